@@ -0,0 +1,262 @@
+# Imported modules
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 1000
+LOG_FLUSH_INTERVAL = 0.05
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+# What happens to a record when the queue is full
+BLOCK = "block"
+DROP = "drop"
+
+# Put on the queue to tell the writer thread to finish
+STOP = object()
+
+
+class RotatingLog:
+    """
+    A log file that is moved aside as app.log.1, app.log.2, ... once it
+    grows past max_bytes or, with max_age set, once it is max_age seconds
+    old. Only backups files are kept.
+    """
+
+    def __init__(self,
+                 path,
+                 max_bytes=LOG_MAX_BYTES,
+                 max_age=None,
+                 backups=LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self._open()
+
+    # Opens the log file for appending and notes when it was started
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._started = self._first_record_time() or time.time()
+
+    # Returns when the first line of the file was logged, from its timestamp
+    def _first_record_time(self):
+        try:
+            with open(self.path, encoding="utf-8", errors="replace") as file:
+                first = file.readline()
+            return datetime.strptime(first[:19],
+                                     "%Y-%m-%d %H:%M:%S").timestamp()
+        except (OSError, ValueError):
+            return None
+
+    # Checks whether the file is due to be rotated
+    def _due(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.max_age
+                    and time.time() - self._started >= self.max_age)
+
+    # Moves the file and its backups along by one and starts a new file
+    def rotate(self):
+        self._file.close()
+        if self.backups:
+            for number in range(self.backups - 1, 0, -1):
+                older = f"{self.path}.{number}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.path}.{number + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    # Writes lines with a single flush, rotating first if the file is due
+    def write(self, lines):
+        if self._due():
+            self.rotate()
+        self._file.write("".join(lines))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Puts records on a queue of at most queue_size records for the writer.
+
+    When the writer falls behind and the queue is full, the "block" policy
+    makes the caller wait for room. The "drop" policy discards INFO and
+    DEBUG records and still waits for room for warnings and errors, so a
+    burst of activity logging can't slow the menus down but problems are
+    never lost. Dropped records are counted and the count is logged.
+    """
+
+    def __init__(self, log_queue, queue_size=LOG_QUEUE_SIZE, policy=DROP):
+        super().__init__(log_queue)
+        self.queue_size = queue_size
+        self.policy = policy
+        self.dropped = 0
+
+    # Only the message is worked out here; the writer formats the line
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.queue_size:
+            if self.policy == DROP and record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            while self.queue.qsize() >= self.queue_size:
+                time.sleep(LOG_FLUSH_INTERVAL / 10)
+        self.queue.put(record)
+
+
+class LogFormatter(logging.Formatter):
+    """
+    Formats records as LOG_FORMAT lines, formatting the date and time only
+    once per second of records rather than once per record.
+    """
+
+    def __init__(self):
+        super().__init__(LOG_FORMAT)
+        self._second = None
+        self._time = ""
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._second:
+            self._second = second
+            self._time = time.strftime(self.default_time_format,
+                                       self.converter(second))
+        return self.default_msec_format % (self._time, record.msecs)
+
+
+class LogWriter(threading.Thread):
+    """
+    Writes queued records to the log file in batches, one flush per batch.
+    """
+
+    def __init__(self,
+                 log_queue,
+                 log_file,
+                 handler,
+                 batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.log_file = log_file
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.formatter = LogFormatter()
+        self._reported = 0
+
+    # Waits for a record, then takes whatever else arrives within the flush
+    # interval, up to a batch
+    def _next_batch(self):
+        """
+        Waking up once per interval rather than once per record keeps the
+        writer from competing with the menus for the interpreter lock.
+        """
+        batch = [self.queue.get()]
+        room = min(self.batch_size, self.handler.queue_size // 2)
+        if batch[0] is not STOP and self.queue.qsize() < room:
+            time.sleep(self.flush_interval)
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # Formats a batch of records as lines of the log
+    def _format(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record) + "\n")
+            except Exception:
+                self.handler.handleError(record)
+        dropped = self.handler.dropped - self._reported
+        if dropped:
+            self._reported += dropped
+            notice = logging.LogRecord(
+                "root", logging.WARNING, __file__, 0,
+                f"{dropped} log records dropped while the log queue was full",
+                None, None)
+            lines.append(self.formatter.format(notice) + "\n")
+        return lines
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = self._next_batch()
+            if STOP in batch:
+                stopping = True
+                batch = [record for record in batch if record is not STOP]
+            lines = self._format(batch)
+            if lines:
+                try:
+                    self.log_file.write(lines)
+                except OSError as e:
+                    print(f"Could not write to {self.log_file.path}: {e}")
+        self.log_file.close()
+
+
+writer = None
+
+
+# Sends the root logger's records through a queue to a background writer
+def start_logging(path="app.log",
+                  level=logging.INFO,
+                  max_bytes=LOG_MAX_BYTES,
+                  max_age=None,
+                  backups=LOG_BACKUPS,
+                  queue_size=LOG_QUEUE_SIZE,
+                  policy=DROP,
+                  flush_interval=LOG_FLUSH_INTERVAL):
+    """
+    Logging calls then only format the message and put it on a queue; the
+    file is written, flushed and rotated by the writer thread. Records still
+    queued are written when the program exits.
+    """
+    global writer
+
+    if writer is not None:
+        return writer
+
+    log_queue = queue.SimpleQueue()
+    handler = BoundedQueueHandler(log_queue, queue_size, policy)
+    writer = LogWriter(log_queue,
+                       RotatingLog(path, max_bytes, max_age, backups),
+                       handler,
+                       flush_interval=flush_interval)
+    writer.start()
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    atexit.register(stop_logging)
+    return writer
+
+
+# Writes every queued record and stops the writer thread
+def stop_logging():
+    global writer
+
+    if writer is None:
+        return
+    logging.getLogger().removeHandler(writer.handler)
+    writer.queue.put(STOP)
+    writer.join()
+    writer = None
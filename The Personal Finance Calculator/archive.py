@@ -0,0 +1,407 @@
+# Imported modules
+import csv
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+
+from journal import file_identity
+from timestamps import parse_timestamp
+
+SEGMENT_MAGIC = b"#finance-segment 1\n"
+SEGMENT_SUFFIX = ".seg"
+PENDING_SUFFIX = ".pending"
+COMPRESSIONS = ("gzip", "lzma")
+PERIODS = {"month": 7, "year": 4}
+
+
+# Returns the archive period of a "%Y-%m-%d %H:%M:%S" date, e.g. 2024-01
+def period_of(date, period="month"):
+    return date[:PERIODS[period]]
+
+
+# Opens the compressed payload of a segment for reading or writing
+def open_payload(file, compression, mode="rb"):
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=file, mode=mode, compresslevel=6, mtime=0)
+    if compression == "lzma":
+        return lzma.LZMAFile(file, mode)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+# Parses csv text into rows
+def parse_rows(data):
+    return list(csv.reader(io.StringIO(data.decode("utf-8"), newline="")))
+
+
+class Segment:
+    """
+    One archived period of expenses.
+
+    The file starts with a magic line and a one-line JSON header, followed
+    by the period's rows as compressed csv. Rows are sorted by user and
+    then by date, and the header holds each user's totals, row count and
+    where their rows start in the uncompressed csv, along with the dates of
+    the period's first and last rows. Totals and date bounds are read
+    without decompressing anything, and reading one user's rows stops
+    decompressing at the end of them.
+    """
+
+    __slots__ = ("path", "header", "payload", "first", "last")
+
+    def __init__(self, path, header, payload):
+        self.path = path
+        self.header = header
+        self.payload = payload
+        self.first = parse_timestamp(header["first"])
+        self.last = parse_timestamp(header["last"])
+
+    # Reads the header of a segment file
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            if file.readline() != SEGMENT_MAGIC:
+                raise ValueError(f"Not an expense archive segment: {path}")
+            header = json.loads(file.readline())
+            return cls(path, header, file.tell())
+
+    # Checks whether any of the segment's rows can fall in a range of stamps
+    def overlaps(self, start, end):
+        return ((start is None or self.last >= start)
+                and (end is None or self.first <= end))
+
+    # Returns the rows of one user, oldest first, from the open segment file
+    def user_rows(self, username, file):
+        entry = self.header["users"].get(username)
+        if entry is None:
+            return []
+        file.seek(self.payload)
+        with open_payload(file, self.header["compression"]) as stream:
+            stream.seek(entry["start"])
+            return parse_rows(stream.read(entry["length"]))
+
+    # Returns every row of the segment
+    def all_rows(self):
+        with open(self.path, "rb") as file:
+            file.seek(self.payload)
+            with open_payload(file, self.header["compression"]) as stream:
+                return parse_rows(stream.read())
+
+
+# Writes rows of one period as a segment file, returning its header
+def write_segment(path,
+                  period,
+                  rows,
+                  compression,
+                  totals_type,
+                  source=None,
+                  replaces=()):
+    """
+    totals_type is the class used for running totals (UserTotals), whose
+    add(row) and total, rows, by_type and by_category attributes are stored
+    in the header. source is the identity of the file the rows were moved
+    out of (its journal.file_identity), for finishing or undoing an
+    interrupted archive run. replaces names the segment files whose rows
+    were folded into this one, which are removed once it is in place.
+    """
+    rows.sort(key=lambda row: (row[0], parse_timestamp(row[1]) or 0))
+    users = {}
+    payload = io.BytesIO()
+    with open_payload(payload, compression, "wb") as stream:
+        position = 0
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            record = buffer.getvalue().encode("utf-8")
+            entry = users.get(row[0])
+            if entry is None:
+                entry = users[row[0]] = [totals_type(), 0, position]
+            entry[0].add(row)
+            entry[1] += 1
+            stream.write(record)
+            position += len(record)
+
+    header = {
+        "period": period,
+        "compression": compression,
+        "first": min(row[1] for row in rows),
+        "last": max(row[1] for row in rows),
+        "rows": len(rows),
+        "source": source,
+        "replaces": list(replaces),
+        "users": {}
+    }
+    ends = [entry[2] for entry in users.values()][1:] + [position]
+    for (username, (totals, count, start)), end in zip(users.items(), ends):
+        header["users"][username] = {
+            "total": totals.total,
+            "rows": totals.rows,
+            "by_type": totals.by_type,
+            "by_category": totals.by_category,
+            "count": count,
+            "start": start,
+            "length": end - start
+        }
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(SEGMENT_MAGIC)
+        file.write(json.dumps(header, ensure_ascii=False).encode("utf-8"))
+        file.write(b"\n")
+        file.write(payload.getvalue())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    return header
+
+
+class ArchiveStore:
+    """
+    Compressed per-period segments of expenses moved out of expenses.csv.
+
+    Only the segment headers are kept in memory. They are loaded again when
+    the directory changes, which creating, replacing or removing a segment
+    always does.
+
+    Archiving first writes each new segment as a .pending file naming the
+    expenses file its rows came from, then replaces expenses.csv, then
+    renames the pending files into place. A run interrupted before the
+    expenses file was replaced left its rows there, so its pending files
+    are dropped. A run interrupted after that had already removed the
+    rows, so its pending files are kept. Either way no row is lost or
+    counted twice.
+
+    Segments never overlap, so reading them in name order reads a user's
+    rows oldest first. A year segment written where month segments of that
+    year exist takes in their rows, and a month archived into a year that
+    already has a segment goes into the year segment. The month segments
+    are removed only after the year segment is in place.
+    """
+
+    def __init__(self, directory, source_path, totals_type, lock):
+        self.directory = directory
+        self.source_path = source_path
+        self.totals_type = totals_type
+        self._lock = lock
+        self._segments = {}
+        self._users = {}
+        self._version = None
+        self._loads = 0
+
+    # Reloads the segment headers if the directory has changed
+    def refresh(self):
+        with self._lock:
+            try:
+                stat = os.stat(self.directory)
+            except FileNotFoundError:
+                self._segments = {}
+                self._users = {}
+                self._version = None
+                return
+            if (stat.st_ino, stat.st_mtime_ns) != self._version:
+                self._load()
+
+    # Loads every segment header, after dealing with any interrupted run
+    def _load(self):
+        self._recover()
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            try:
+                segments.append(
+                    Segment.load(os.path.join(self.directory, name)))
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping an unreadable archive segment: {e}")
+
+        # Segments folded into another one are left behind if a run stopped
+        # between moving it into place and removing them
+        replaced = {
+            name
+            for segment in segments
+            for name in segment.header.get("replaces", ())
+        }
+        stat = os.stat(self.directory)
+        self._version = (stat.st_ino, stat.st_mtime_ns)
+        self._loads += 1
+        self._segments = {}
+        self._users = {}
+        for segment in segments:
+            if os.path.basename(segment.path) in replaced:
+                os.remove(segment.path)
+                continue
+            self._segments[segment.header["period"]] = segment
+            for username in segment.header["users"]:
+                self._users.setdefault(username, []).append(segment)
+
+    # Finishes or undoes an archive run that was interrupted
+    def _recover(self):
+        identity = file_identity(self.source_path)
+        for name in os.listdir(self.directory):
+            if not name.endswith(PENDING_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                source = Segment.load(path).header["source"]
+            except (OSError, ValueError):
+                source = identity
+            if source == identity:
+                os.remove(path)
+            else:
+                os.replace(path, path[:-len(PENDING_SUFFIX)])
+
+    # Returns a value that changes whenever a segment is written or removed
+    @property
+    def version(self):
+        with self._lock:
+            self.refresh()
+            return self._loads if self._version else 0
+
+    # Returns the path of the segment of a period
+    def segment_path(self, period):
+        return os.path.join(self.directory,
+                            f"expenses-{period}{SEGMENT_SUFFIX}")
+
+    # Returns the names of every user with archived rows
+    def users(self):
+        with self._lock:
+            self.refresh()
+            return list(self._users)
+
+    # Returns how many archived rows a user has, optionally only in segments
+    # overlapping a range of stamps
+    def count(self, username, start=None, end=None):
+        with self._lock:
+            self.refresh()
+            return sum(segment.header["users"][username]["count"]
+                       for segment in self._users.get(username, ())
+                       if segment.overlaps(start, end))
+
+    # Returns a user's archived totals from the segment headers, or None
+    def totals(self, username):
+        with self._lock:
+            self.refresh()
+            segments = list(self._users.get(username, ()))
+        if not segments:
+            return None
+        totals = self.totals_type()
+        for segment in segments:
+            entry = segment.header["users"][username]
+            totals.total += entry["total"]
+            totals.rows += entry["rows"]
+            for key, amount in entry["by_type"].items():
+                totals.by_type[key] = totals.by_type.get(key, 0) + amount
+            for key, amount in entry["by_category"].items():
+                totals.by_category[key] = totals.by_category.get(key,
+                                                                 0) + amount
+        return totals
+
+    # Returns every user's archived total, {username: pence}
+    def all_totals(self):
+        with self._lock:
+            self.refresh()
+            segments = list(self._segments.values())
+        totals = {}
+        for segment in segments:
+            for username, entry in segment.header["users"].items():
+                totals[username] = totals.get(username, 0) + entry["total"]
+        return totals
+
+    # Yields a user's archived rows, oldest first, optionally only those
+    # dated between two stamps (inclusive)
+    def rows(self, username, start=None, end=None):
+        with self._lock:
+            self.refresh()
+            # Only segments overlapping the range are opened, and holding
+            # them open keeps this snapshot valid if they are rewritten
+            opened = [(segment, open(segment.path, "rb"))
+                      for segment in self._users.get(username, ())
+                      if segment.overlaps(start, end)]
+        try:
+            for segment, file in opened:
+                for row in segment.user_rows(username, file):
+                    if start is None and end is None:
+                        yield row
+                        continue
+                    stamp = parse_timestamp(row[1])
+                    if (stamp is not None and (start is None or stamp >= start)
+                            and (end is None or stamp <= end)):
+                        yield row
+        finally:
+            for _, file in opened:
+                file.close()
+
+    # Returns the period a period's rows are archived under, the year when
+    # the year already has a segment, and the segments folded into it
+    def _target(self, period):
+        year = period[:PERIODS["year"]]
+        if period != year and year not in self._segments:
+            return period, []
+        return year, [
+            segment for key, segment in self._segments.items()
+            if key != year and key[:len(year)] == year
+        ]
+
+    # Writes the pending segments holding each period's archived rows plus
+    # the new ones, for moving out of the file identified by source. periods
+    # yields (period, rows) pairs in order.
+    def stage(self, periods, compression, source):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self.refresh()
+            # Months of a year with a segment arrive one after another and
+            # are gathered into one write of the year segment
+            pending = None
+            for period, rows in periods:
+                target, folded = self._target(period)
+                if pending is not None and pending[0] == target:
+                    pending[2].extend(rows)
+                    continue
+                if pending is not None:
+                    self._write_pending(*pending, compression, source)
+                pending = (target, folded, rows)
+            if pending is not None:
+                self._write_pending(*pending, compression, source)
+
+    # Writes the pending segment of a period with its archived rows, the
+    # rows of the segments folded into it and the new rows
+    def _write_pending(self, period, folded, rows, compression, source):
+        existing = self._segments.get(period)
+        for segment in ([existing] if existing else []) + folded:
+            rows = segment.all_rows() + rows
+        write_segment(
+            self.segment_path(period) + PENDING_SUFFIX, period, rows,
+            compression, self.totals_type, source,
+            [os.path.basename(segment.path) for segment in folded])
+
+    # Moves every pending segment into place
+    def commit(self):
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(PENDING_SUFFIX):
+                    path = os.path.join(self.directory, name)
+                    os.replace(path, path[:-len(PENDING_SUFFIX)])
+            self._load()
+
+    # Removes every archived row of a user, rewriting the segments holding them
+    def remove_user(self, username):
+        with self._lock:
+            self.refresh()
+            for segment in self._users.get(username, ()):
+                rows = [
+                    row for row in segment.all_rows() if row[0] != username
+                ]
+                if rows:
+                    write_segment(segment.path, segment.header["period"], rows,
+                                  segment.header["compression"],
+                                  self.totals_type)
+                else:
+                    os.remove(segment.path)
+            if self._version is not None:
+                # The directory's mtime may not have ticked since the last load
+                self._load()
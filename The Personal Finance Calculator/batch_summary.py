@@ -0,0 +1,77 @@
+# Imported modules
+import logging
+
+from journal import replace_file
+from money import format_pounds, parse_pence
+
+SUMMARY_FIELDS = [
+    "username", "income", "total_expenses", "remaining", "spending_ratio",
+    "feedback"
+]
+
+# Feedback buckets by spending ratio (expenses / income), checked in order
+NO_INCOME = "Income missing"
+FEEDBACK_LIMITS = ((0.5, "Money Maestro"), (0.75, "Budget Boss"),
+                   (1, "Walking the Line"))
+OVERSPENT = "Danger Zone"
+
+
+# Returns the feedback bucket a user's spending falls in
+def feedback_bucket(total_expenses, income):
+    if income == 0:
+        return NO_INCOME
+    spending_ratio = total_expenses / income
+    for limit, bucket in FEEDBACK_LIMITS:
+        if spending_ratio < limit:
+            return bucket
+    return OVERSPENT
+
+
+# Yields the header and the budget summary row of every profile
+def summary_rows(storage, workers=None):
+    """
+    Every user's expenses are totalled in one pass over the storage before
+    the profiles are read, so the cost doesn't grow with one query per
+    user. Amounts are in pounds and the spending ratio is left blank for
+    users without an income.
+    """
+    totals = storage.expense_totals(workers)
+    yield SUMMARY_FIELDS
+    for profile in storage.profiles():
+        username = profile[0]
+        try:
+            income = parse_pence(profile[2]) if len(profile) >= 3 else 0
+        except ValueError:
+            logging.warning(
+                f"Invalid income for {username} in the batch summary: "
+                f"{profile[2]}")
+            income = 0
+        total_expenses = totals.get(username, 0)
+        yield [
+            username,
+            format_pounds(income),
+            format_pounds(total_expenses),
+            format_pounds(income - total_expenses),
+            f"{total_expenses / income:.4f}" if income else "",
+            feedback_bucket(total_expenses, income)
+        ]
+
+
+# Writes the budget summary of every user to one csv file, returning how many
+# users it covers
+def write_summaries(storage, path, workers=None):
+    """
+    The file is written next to its destination and moved over it, so a
+    job reading the previous night's summaries never sees half of one.
+    """
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    replace_file(path, counted(summary_rows(storage, workers)))
+    logging.info(f"Budget summaries of {count - 1} users written to {path}")
+    return count - 1
@@ -0,0 +1,76 @@
+# Times the nightly budget summaries of every user with different numbers of
+# worker processes, against indexing the file and asking for each user's
+# totals, and checks that every run writes the same summaries
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_summary import write_summaries  # noqa: E402
+from generate_data import generate, parse_count  # noqa: E402
+from storage import CsvBackend  # noqa: E402
+
+
+# Returns a backend over a data directory that hasn't indexed anything yet
+def open_storage(directory):
+    return CsvBackend(os.path.join(directory, "user_list.csv"),
+                      os.path.join(directory, "expenses.csv"),
+                      os.path.join(directory, "journal.csv"))
+
+
+# Writes the summaries the way a single interactive process would have to
+def indexed_summaries(directory, output):
+    storage = open_storage(directory)
+    storage.expense_store.refresh()
+    return write_summaries(storage, output)
+
+
+# Returns the seconds taken by a function and the summaries it wrote
+def measure(function, output):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    with open(output, encoding="utf-8") as file:
+        return elapsed, file.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_count, default="2M")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--workers",
+                        default=",".join(
+                            str(count) for count in (1, 2, 4, 8)
+                            if count <= max(os.cpu_count() or 1, 2)),
+                        help="Comma separated worker counts to time")
+    parser.add_argument("--data-dir",
+                        help="Keep the generated dataset here between runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        directory = args.data_dir or work
+        if not os.path.exists(os.path.join(directory, "expenses.csv")):
+            os.makedirs(directory, exist_ok=True)
+            print(f"Generating {args.rows:,} rows for {args.users:,} users "
+                  f"in {directory}")
+            generate(directory, args.rows, args.users)
+        size = os.path.getsize(os.path.join(directory, "expenses.csv"))
+        output = os.path.join(work, "summaries.csv")
+        print(f"{args.rows:,} rows, {size / 1e6:.0f} MB, "
+              f"{os.cpu_count() or 1} CPUs")
+
+        baseline, expected = measure(
+            lambda: indexed_summaries(directory, output), output)
+        print(f"{'index, then totals per user':<30} {baseline:8.2f}s")
+        single = None
+        for workers in (int(count) for count in args.workers.split(",")):
+            elapsed, summaries = measure(
+                lambda: write_summaries(open_storage(directory), output,
+                                        workers), output)
+            assert summaries == expected, f"{workers} workers differ"
+            single = single or elapsed
+            print(f"{f'batch, {workers} workers':<30} {elapsed:8.2f}s  "
+                  f"{single / elapsed:4.1f}x")
@@ -0,0 +1,91 @@
+# Compares the per-row cost of the old report row formatting with the shared
+# record decoder on a large expenses file
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from money import format_stored_amount  # noqa: E402
+from records import decode_rows  # noqa: E402
+
+
+# Writes a csv file of synthetic expense rows
+def write_file(path, count):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for number in range(count):
+            writer.writerow([
+                "bench", f"2024-{number % 12 + 1:02d}-{number % 28 + 1:02d} "
+                f"12:{number % 60:02d}:00", f"Category {number % 20}",
+                f"Item {number}", 150 + number % 1000, "Essential"
+            ])
+
+
+# Reads the file without formatting anything, to subtract from the timings
+def read_only(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.reader(file):
+            pass
+
+
+# The row formatting every report used to repeat
+def old_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.reader(file):
+            if len(row) < 6:
+                continue
+            try:
+                day = datetime.strptime(
+                    row[1], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+            except ValueError:
+                day = "Invalid date"
+            yield [day, row[2], row[3], format_stored_amount(row[4]), row[5]]
+
+
+# The same rows through the shared decoder
+def new_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        for expense in decode_rows(csv.reader(file)):
+            yield [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+
+
+# Returns the seconds taken to run a function over the file
+def measure(function, path):
+    start = time.perf_counter()
+    for _ in function(path) or ():
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "expenses.csv")
+        write_file(path, args.rows)
+
+        assert list(islice(old_rows(path),
+                           1000)) == list(islice(new_rows(path), 1000))
+        reading = measure(read_only, path)
+        old = measure(old_rows, path)
+        new = measure(new_rows, path)
+
+    print(f"{args.rows:,} rows, csv reading alone {reading:.2f}s")
+    for name, elapsed in (("strptime/strftime per row", old),
+                          ("shared record decoder", new)):
+        per_row = (elapsed - reading) / args.rows * 1e9
+        print(f"{name:<26} {elapsed:6.2f}s  {per_row:6.0f} ns/row on top "
+              "of reading")
+    print(f"Speed-up of the per-row work: "
+          f"{(old - reading) / (new - reading):.1f}x")
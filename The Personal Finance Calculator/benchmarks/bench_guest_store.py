@@ -0,0 +1,112 @@
+# Compares the memory per guest expense and the time to list them for the
+# old dicts, a list of records and the compact guest store
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from guest_store import GuestStore  # noqa: E402
+from money import format_money  # noqa: E402
+from records import ExpenseRecord  # noqa: E402
+
+CATEGORIES = ["Food", "Rent", "Transport", "Bills", "Fun"]
+
+
+# Builds the fields of a synthetic guest expense
+def make_expense(number):
+    return ("Guest", f"2024-{number % 12 + 1:02d}-{number % 28 + 1:02d} "
+            f"12:{number % 60:02d}:{number % 59:02d}",
+            CATEGORIES[number % len(CATEGORIES)], f"Item {number}",
+            150 + number % 1000,
+            "Essential" if number % 3 else "Non-Essential")
+
+
+# Fills a container the way the guest session used to, with dicts
+def fill_dicts(count):
+    expenses = []
+    for number in range(count):
+        _, date, category, description, amount, expense_type = make_expense(
+            number)
+        expenses.append({
+            "date": date,
+            "category": category,
+            "description": description,
+            "amount": amount,
+            "type": expense_type
+        })
+    return expenses
+
+
+# Fills a list with one record per expense
+def fill_records(count):
+    return [ExpenseRecord(*make_expense(number)) for number in range(count)]
+
+
+# Fills the compact store, with a limit high enough to stay in memory
+def fill_store(count, memory_limit):
+    store = GuestStore(memory_limit=memory_limit)
+    for number in range(count):
+        store.append(ExpenseRecord(*make_expense(number)))
+    return store
+
+
+# Returns the bytes allocated while building a container, and the container
+def measure_memory(build):
+    tracemalloc.start()
+    container = build()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used, container
+
+
+# Returns the seconds taken to format every expense as a report row
+def measure_listing(expenses, dicts=False):
+    start = time.perf_counter()
+    if dicts:
+        # What the guest reports did for each dict before the shared records
+        for expense in expenses:
+            try:
+                day = datetime.strptime(
+                    expense["date"], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+            except ValueError:
+                day = "Invalid date"
+            [
+                day, expense["category"], expense["description"],
+                format_money(expense["amount"]), expense["type"]
+            ]
+    else:
+        for expense in expenses:
+            [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--expenses", type=int, default=100000)
+    args = parser.parse_args()
+    count = args.expenses
+
+    cases = [
+        ("dict per expense", lambda: fill_dicts(count), True),
+        ("record per expense", lambda: fill_records(count), False),
+        ("guest store in memory", lambda: fill_store(count, 1 << 40), False),
+        ("guest store, 64 KiB cap", lambda: fill_store(count, 1 << 16), False),
+    ]
+    results = []
+    for name, build, dicts in cases:
+        used, expenses = measure_memory(build)
+        listing = measure_listing(expenses, dicts)
+        results.append((name, used, listing))
+        del expenses
+
+    print(f"{count:,} guest expenses")
+    for name, used, listing in results:
+        print(f"{name:<24} {used / count:7.1f} bytes each, "
+              f"listed in {listing * 1000:7.1f}ms")
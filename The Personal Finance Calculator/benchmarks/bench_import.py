@@ -0,0 +1,56 @@
+# Compares adding expenses one row at a time with the batch import path
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_store import ExpenseStore  # noqa: E402
+from journal import Journal  # noqa: E402
+
+
+# Builds a list of synthetic expense rows for one user
+def make_rows(count):
+    return [[
+        "bench", f"2024-01-{day % 28 + 1:02d} 12:00:00", "Food", f"Item {day}",
+        150, "Essential"
+    ] for day in range(count)]
+
+
+# Times a function that writes rows into a fresh store, returning rows per second
+def measure(write, rows):
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(os.path.join(directory, "journal.csv"))
+        store = ExpenseStore(os.path.join(directory, "expenses.csv"), journal)
+        start = time.perf_counter()
+        write(store, rows)
+        elapsed = time.perf_counter() - start
+        assert store.totals("bench").rows == len(rows)
+    return len(rows) / elapsed
+
+
+# Writes every row with its own open, append and fsync, like add_expense does
+def per_row(store, rows):
+    for row in rows:
+        store.append_many([row])
+
+
+# Writes every row through one handle with a single fsync
+def batch(store, rows):
+    store.append_many(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    per_row_rate = measure(per_row, rows)
+    batch_rate = measure(batch, rows)
+
+    print(f"rows:    {args.rows}")
+    print(f"per-row: {per_row_rate:,.0f} rows/s")
+    print(f"batch:   {batch_rate:,.0f} rows/s ({batch_rate / per_row_rate:.1f}x)")
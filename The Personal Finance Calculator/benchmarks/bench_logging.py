@@ -0,0 +1,103 @@
+# Times adding expenses one at a time, the way the menus do, with logging
+# off, with the old synchronous file handler and through the log queue
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_logging import LOG_FORMAT, LOG_QUEUE_SIZE  # noqa: E402
+from app_logging import start_logging, stop_logging  # noqa: E402
+from guest_store import GuestStore  # noqa: E402
+from money import format_money  # noqa: E402
+from records import ExpenseRecord  # noqa: E402
+from storage import CsvBackend  # noqa: E402
+
+DATE = "2024-06-01 12:00:00"
+
+
+# Adds guest expenses in memory, logging each one like add_expense does
+def add_guest_expenses(directory, count):
+    store = GuestStore()
+    for number in range(count):
+        amount = 100 + number % 1000
+        store.append(
+            ExpenseRecord("Guest", DATE, "Food", f"Item {number}", amount,
+                          "Essential"))
+        logging.info(f"Guest expense added in memory: Food, Item {number}, "
+                     f"{format_money(amount)}, Essential")
+
+
+# Appends expenses for a user one at a time, logging each one
+def add_stored_expenses(directory, count):
+    storage = CsvBackend(os.path.join(directory, "user_list.csv"),
+                         os.path.join(directory, "expenses.csv"),
+                         os.path.join(directory, "journal.csv"))
+    for number in range(count):
+        amount = 100 + number % 1000
+        storage.append_expenses(
+            [["alice", DATE, "Food", f"Item {number}", amount, "Essential"]])
+        logging.info(f"Expense added to file: Food, Item {number}, "
+                     f"{format_money(amount)}, Essential")
+
+
+# Routes the root logger's records the way one of the modes does
+def configure(mode, path, queue_size):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    logging.disable(logging.NOTSET)
+
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+    elif mode == "sync":
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        start_logging(path, queue_size=queue_size)
+
+
+# Returns the seconds the caller spent, and the seconds to drain the queue
+def run(mode, workload, count, queue_size):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app.log")
+        configure(mode, path, queue_size)
+        start = time.perf_counter()
+        workload(directory, count)
+        elapsed = time.perf_counter() - start
+        stop_logging()
+        drained = time.perf_counter() - start - elapsed
+        configure("off", path, queue_size)
+
+        lines = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                lines = sum(1 for _ in file)
+    return elapsed, drained, lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--expenses", type=int, default=20000)
+    parser.add_argument("--queue-size", type=int, default=LOG_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    workloads = [("guest", add_guest_expenses),
+                 ("stored", add_stored_expenses)]
+    for name, workload in workloads:
+        print(f"{args.expenses:,} {name} expenses")
+        baseline = None
+        for mode in ("off", "sync", "queue"):
+            elapsed, drained, lines = run(mode, workload, args.expenses,
+                                          args.queue_size)
+            baseline = baseline or elapsed
+            print(f"  logging {mode:<6} {elapsed * 1000:9.1f}ms "
+                  f"({elapsed / baseline:5.2f}x off), "
+                  f"{elapsed / args.expenses * 1000000:6.1f}us each, "
+                  f"drained in {drained * 1000:7.1f}ms, {lines:,} lines")
@@ -0,0 +1,76 @@
+# Compares parsing and summing amounts stored as pounds text with whole pence
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from money import format_money, format_pounds  # noqa: E402
+
+
+# Sums amounts stored as decimal pounds text, as the float-based code did
+def sum_pounds(fields):
+    total = 0
+    for field in fields:
+        total += float(field)
+    return total
+
+
+# Sums amounts stored as decimal pounds text exactly
+def sum_decimal_pounds(fields):
+    total = Decimal(0)
+    for field in fields:
+        total += Decimal(field)
+    return total
+
+
+# Sums amounts stored as whole pence text
+def sum_pence(fields):
+    total = 0
+    for field in fields:
+        total += int(field)
+    return total
+
+
+# Runs a function a few times and returns the best time in seconds
+def best_time(function, argument, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    pence = [random.randint(1, 20000) for _ in range(args.rows)]
+    pound_fields = [format_pounds(amount) for amount in pence]
+    pence_fields = [str(amount) for amount in pence]
+
+    pounds_time, pounds_total = best_time(sum_pounds, pound_fields)
+    decimal_time, decimal_total = best_time(sum_decimal_pounds, pound_fields)
+    pence_time, pence_total = best_time(sum_pence, pence_fields)
+    # What the in-memory aggregates and report columns add up, already parsed
+    array_time, array_total = best_time(sum, array("q", pence))
+
+    assert decimal_total * 100 == pence_total == array_total
+
+    print(f"rows:                  {args.rows}")
+    print(f"float pounds:          {pounds_time:.3f}s, "
+          f"drift {pounds_total * 100 - pence_total:+.6f} pence")
+    print(f"exact decimal pounds:  {decimal_time:.3f}s")
+    print(f"integer pence:         {pence_time:.3f}s "
+          f"({decimal_time / pence_time:.1f}x faster than exact decimal)")
+    print(f"pre-parsed pence:      {array_time:.3f}s "
+          f"({pounds_time / array_time:.1f}x faster than float parsing)")
+    print(f"total:                 {format_money(pence_total)}")
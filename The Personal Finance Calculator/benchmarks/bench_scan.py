@@ -0,0 +1,61 @@
+# Compares reading one user's expenses from a large expenses.csv by indexing
+# every row first, by the memory-mapped scan and by the scan split across
+# processes, and checks that all three return the same rows
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mmap_scan  # noqa: E402
+from expense_store import ExpenseStore  # noqa: E402
+from generate_data import generate, parse_count, user_name  # noqa: E402
+from journal import Journal  # noqa: E402
+
+
+# Returns the seconds taken to read a user's rows, and the rows
+def read_user(directory, username, index_first, workers):
+    mmap_scan.PARALLEL_SCAN_BYTES = 0
+    mmap_scan.SCAN_WORKERS = workers
+    store = ExpenseStore(os.path.join(directory, "expenses.csv"),
+                         Journal(os.path.join(directory, "journal.csv")))
+    start = time.perf_counter()
+    if index_first:
+        store.refresh()
+    rows = list(store.rows(username))
+    return time.perf_counter() - start, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_count, default="1M")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--workers",
+                        type=int,
+                        default=max(os.cpu_count() or 1, 2))
+    parser.add_argument("--data-dir",
+                        help="Keep the generated dataset here between runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        directory = args.data_dir or work
+        if not os.path.exists(os.path.join(directory, "expenses.csv")):
+            os.makedirs(directory, exist_ok=True)
+            print(f"Generating {args.rows:,} rows in {directory}")
+            generate(directory, args.rows, args.users)
+        size = os.path.getsize(os.path.join(directory, "expenses.csv"))
+        username = user_name(0)
+
+        print(f"{args.rows:,} rows, {size / 1e6:.0f} MB, reading {username}")
+        cases = [("index every row, then read", True, 1),
+                 ("memory-mapped scan", False, 1),
+                 (f"scan in {args.workers} processes", False, args.workers)]
+        expected = None
+        for name, index_first, workers in cases:
+            elapsed, rows = read_user(directory, username, index_first,
+                                      workers)
+            expected = expected or rows
+            assert rows == expected, f"{name} returned different rows"
+            print(f"{name:<30} {elapsed * 1000:9.1f}ms  {len(rows):,} rows")
@@ -0,0 +1,76 @@
+# Times searching one user's expenses through the search index against a
+# linear scan of their rows, and checks both find the same expenses
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_data import generate, parse_count, user_name  # noqa: E402
+from search_index import matches_search, tokenize  # noqa: E402
+from storage import CsvBackend  # noqa: E402
+
+QUERIES = ["eating", "purchase 12345", "trav purch 99", "sho", "rent"]
+
+
+# Finds a user's matching rows by checking every one of them
+def linear_search(storage, username, text):
+    terms = tokenize(text)
+    return [
+        row for row in storage.query_expenses(username)
+        if matches_search(terms, row[2], row[3])
+    ]
+
+
+# Returns the median seconds taken by a function, and its last result
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_count, default="2M")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir",
+                        help="Keep the generated dataset here between runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        directory = args.data_dir or work
+        if not os.path.exists(os.path.join(directory, "expenses.csv")):
+            os.makedirs(directory, exist_ok=True)
+            print(f"Generating {args.rows:,} rows in {directory}")
+            generate(directory, args.rows, args.users)
+        storage = CsvBackend(os.path.join(directory, "user_list.csv"),
+                             os.path.join(directory, "expenses.csv"),
+                             os.path.join(directory, "journal.csv"))
+        username = user_name(0)
+
+        start = time.perf_counter()
+        storage.expense_users()
+        print(f"Indexed {args.rows:,} rows in "
+              f"{time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        list(storage.search_expenses(username, QUERIES[0]))
+        print(f"Built the search index of {username} "
+              f"({storage.totals(username).rows:,} rows) in "
+              f"{(time.perf_counter() - start) * 1000:.0f}ms")
+
+        for text in QUERIES:
+            indexed, found = measure(
+                lambda: list(storage.search_expenses(username, text)),
+                args.repeat)
+            linear, expected = measure(
+                lambda: linear_search(storage, username, text), 1)
+            assert found == expected, f"different results for {text!r}"
+            print(f"{text!r:<18} {len(found):>8,} found  index "
+                  f"{indexed * 1000:8.2f}ms  linear {linear * 1000:8.1f}ms")
@@ -0,0 +1,130 @@
+# Times a cold start up to a user's first report, in a fresh process each
+# time, reading only the csv files against mapping the snapshots saved at the
+# last shutdown and reading the rows appended since, and checks that both
+# produce the same report
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_data import generate, parse_count, user_name  # noqa: E402
+
+SNAPSHOTS = ("user_list.csv.snapshot", "expenses.csv.snapshot")
+REPORT_ROWS = 20
+
+
+# Returns a backend over a data directory that hasn't indexed anything yet
+def open_storage(directory):
+    from storage import CsvBackend
+    return CsvBackend(os.path.join(directory, "user_list.csv"),
+                      os.path.join(directory, "expenses.csv"),
+                      os.path.join(directory, "journal.csv"))
+
+
+# Logs a user in and prints their first report page, the way a session starts,
+# then prints the seconds it took since the process started loading the app
+def first_report(directory, username):
+    start = time.perf_counter()
+    from expense_query import ExpenseQuery, run_query
+    storage = open_storage(directory)
+    profile = storage.get_profile(username)
+    totals = storage.totals(username)
+    _, rows = run_query(storage, username, ExpenseQuery(limit=REPORT_ROWS))
+    report = [profile, totals.total, totals.by_category, list(rows)]
+    elapsed = time.perf_counter() - start
+    print(repr(report))
+    print(elapsed)
+
+
+# Runs first_report in a new process, returning its seconds and its report
+def cold_start(directory, username):
+    output = subprocess.run(
+        [sys.executable, __file__, "--report", directory, username],
+        check=True,
+        capture_output=True,
+        text=True).stdout.splitlines()
+    return float(output[1]), output[0]
+
+
+# Indexes everything and saves the snapshots, as a shutdown would
+def save_snapshots(directory):
+    storage = open_storage(directory)
+    storage.profiles()
+    storage.expense_store.refresh()
+    storage.save_snapshot(force=True)
+
+
+# Appends copies of the first rows of expenses.csv, as if added since the
+# snapshots were saved
+def append_tail(directory, rows):
+    path = os.path.join(directory, "expenses.csv")
+    with open(path, newline="", encoding="utf-8") as file:
+        tail = list(islice(csv.reader(file), 1, rows + 1))
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(tail)
+
+
+# Moves the snapshots aside (or back), so a run only sees the csv files
+def move_snapshots(directory, aside):
+    for name in SNAPSHOTS:
+        path = os.path.join(directory, name)
+        if aside:
+            os.replace(path, path + ".aside")
+        else:
+            os.replace(path + ".aside", path)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--report"]:
+        first_report(sys.argv[2], sys.argv[3])
+        sys.exit()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_count, default="1M")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tail",
+                        type=parse_count,
+                        default="10k",
+                        help="Rows appended after the snapshots were saved")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir",
+                        help="Keep the generated dataset here between runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        directory = args.data_dir or work
+        if not os.path.exists(os.path.join(directory, "expenses.csv")):
+            os.makedirs(directory, exist_ok=True)
+            print(f"Generating {args.rows:,} rows in {directory}")
+            generate(directory, args.rows, args.users)
+        save_snapshots(directory)
+        append_tail(directory, args.tail)
+        size = os.path.getsize(os.path.join(directory, "expenses.csv"))
+        snapshot = os.path.getsize(os.path.join(directory, SNAPSHOTS[1]))
+        username = user_name(0)
+
+        print(f"{args.rows:,} rows + {args.tail:,} since the snapshot, "
+              f"{size / 1e6:.0f} MB, snapshot {snapshot / 1e6:.0f} MB")
+        move_snapshots(directory, True)
+        try:
+            timings = [
+                cold_start(directory, username) for _ in range(args.repeat)
+            ]
+        finally:
+            move_snapshots(directory, False)
+        csv_only = min(elapsed for elapsed, _ in timings)
+        expected = timings[0][1]
+        print(f"{'csv files only':<30} {csv_only * 1000:9.1f}ms")
+
+        timings = [cold_start(directory, username) for _ in range(args.repeat)]
+        for _, report in timings:
+            assert report == expected, "the snapshot gave a different report"
+        elapsed = min(elapsed for elapsed, _ in timings)
+        print(f"{'snapshot + csv tail':<30} {elapsed * 1000:9.1f}ms  "
+              f"{csv_only / elapsed:4.1f}x")
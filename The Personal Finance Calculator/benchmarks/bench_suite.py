@@ -0,0 +1,219 @@
+# Times login, adding an expense, the budget summary and every report on
+# generated datasets, and records the results as JSON
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIRECTORY))
+
+from generate_data import PASSWORD, generate  # noqa: E402
+from generate_data import parse_count, user_name  # noqa: E402
+from storage import CsvBackend  # noqa: E402
+
+# Reports are timed for the last month of the generated data
+REPORT_START = datetime(2024, 12, 1)
+REPORT_END = datetime(2024, 12, 31)
+
+
+# Returns the current git commit, or None outside a git checkout
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=BENCHMARK_DIRECTORY,
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runs a function several times, returning its timings and its last result
+def measure(function, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+# Counts the rows a list report shows, formatted the way the menus format them
+def count_report_rows(main, **filters):
+    count = 0
+    for expense in main.expense_records(**filters):
+        [
+            expense.day, expense.category, expense.description, expense.money,
+            expense.expense_type
+        ]
+        count += 1
+    return count
+
+
+# Opens the backend to benchmark for a generated dataset
+def open_storage(directory, backend):
+    csv_backend = CsvBackend(os.path.join(directory, "user_list.csv"),
+                             os.path.join(directory, "expenses.csv"),
+                             os.path.join(directory, "journal.csv"))
+    if backend == "csv":
+        return csv_backend
+
+    from sqlite_backend import SqliteBackend, migrate
+
+    database = os.path.join(directory, "finance.db")
+    fresh = not os.path.exists(database)
+    storage = SqliteBackend(database)
+    if fresh:
+        migrate(csv_backend, storage)
+    return storage
+
+
+# Times every operation on one dataset, returning a list of result entries
+def run_dataset(main, directory, rows, users, backend, repeat):
+    username = user_name(0)
+    results = []
+
+    def record(operation, function, runs=repeat):
+        timings, result = measure(function, runs)
+        entry = {
+            "rows": rows,
+            "users": users,
+            "operation": operation,
+            "runs": runs,
+            "min": min(timings),
+            "median": statistics.median(timings)
+        }
+        if isinstance(result, int):
+            entry["rows_returned"] = result
+        results.append(entry)
+        print(f"{rows:>12,} rows  {operation:<26} median "
+              f"{entry['median'] * 1000:10.2f}ms")
+
+    # Opening includes indexing the data files on the first query
+    record("open_and_index",
+           lambda: open_storage(directory, backend).expense_users(),
+           runs=1)
+    main.storage = open_storage(directory, backend)
+    main.storage.expense_users()
+
+    def login():
+        row = main.storage.get_profile(username)
+        return row is not None and row[1] == main.hash_password(PASSWORD)
+
+    record("login", login)
+    main.logged_in = True
+    main.profile = {"name": username, "income": 250000}
+    main.income = 250000
+
+    def budget_summary():
+        total = main.calculate_total_expenses()
+        main.get_spending_feedback(total, main.income)
+        return total
+
+    record("budget_summary", budget_summary)
+    record("report_category",
+           lambda: count_report_rows(main, category="Eating Out"))
+    record("report_type",
+           lambda: count_report_rows(main, expense_type="Non-Essential"))
+    record("report_date",
+           lambda: count_report_rows(main, start=REPORT_START, end=REPORT_END))
+    record("report_all", lambda: count_report_rows(main))
+    record("report_totals_by_category",
+           lambda: len(main.get_expense_columns().totals_by_category()))
+    record("report_monthly_trend",
+           lambda: len(main.get_expense_columns().totals_by_month()))
+    record(
+        "add_expense", lambda: main.add_expenses(username, [(
+            None, "Food", "Benchmark", "1.00", "E")]))
+    main.storage.close()
+    return results
+
+
+# Prints how each operation changed against an earlier results file
+def compare(results, path):
+    with open(path, encoding="utf-8") as file:
+        previous = json.load(file)
+    before = {
+        (entry["rows"], entry["operation"]): entry["median"]
+        for entry in previous["results"]
+    }
+
+    print(f"\nCompared with {previous.get('commit') or path}:")
+    for entry in results:
+        old = before.get((entry["rows"], entry["operation"]))
+        if old:
+            print(f"{entry['rows']:>12,} rows  {entry['operation']:<26} "
+                  f"{old / entry['median']:6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes",
+                        default="10k,1M,10M",
+                        help="Comma separated dataset sizes in rows")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--category-skew", type=float, default=1.0)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--data-dir",
+                        help="Keep generated datasets here between runs")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    data_root = os.path.abspath(args.data_dir) if args.data_dir else None
+
+    with tempfile.TemporaryDirectory() as work:
+        # main.py writes app.log and opens its data files where it starts
+        os.chdir(work)
+        import main
+
+        results = []
+        for size in args.sizes.split(","):
+            rows = parse_count(size)
+            name = (f"{rows}-rows-{args.users}-users-{args.category_skew}-"
+                    f"skew-{args.days}-days-{args.seed}")
+            directory = os.path.join(data_root or work, name)
+            if not os.path.exists(os.path.join(directory, "expenses.csv")):
+                os.makedirs(directory, exist_ok=True)
+                print(f"Generating {rows:,} rows in {directory}")
+                generate(directory, rows, args.users, args.category_skew,
+                         args.days, args.seed)
+            results.extend(
+                run_dataset(main, directory, rows, args.users, args.backend,
+                            args.repeat))
+        os.chdir(BENCHMARK_DIRECTORY)
+
+    report = {
+        "commit": current_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "settings": {
+            "users": args.users,
+            "category_skew": args.category_skew,
+            "days": args.days,
+            "seed": args.seed,
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+    if compare_path:
+        compare(results, compare_path)
@@ -0,0 +1,97 @@
+# Generates realistic user_list.csv and expenses.csv files for benchmarks
+import argparse
+import csv
+import hashlib
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_store import FORMAT_HEADER  # noqa: E402
+from journal import version_header  # noqa: E402
+
+# Categories from most to least common, with whether they are essential
+CATEGORIES = [("Food", True), ("Transport", True), ("Bills", True),
+              ("Eating Out", False), ("Shopping", False), ("Rent", True),
+              ("Entertainment", False), ("Health", True), ("Travel", False),
+              ("Gifts", False), ("Education", True), ("Charity", False)]
+PASSWORD = "benchmark"
+END_DATE = datetime(2024, 12, 31, 23, 59, 59)
+
+
+# Parses a row count such as 10000, 10k or 1M
+def parse_count(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    return int(float(text) * scale)
+
+
+# Returns the name of the benchmark user with the given number
+def user_name(number):
+    return f"user{number:06d}"
+
+
+# Writes a user list and an expenses file with the requested shape
+def generate(directory, rows, users=100, category_skew=1.0, days=730, seed=1):
+    """
+    Expenses are written oldest first, the order the app appends them in,
+    spread evenly over the `days` days up to the end of 2024 and randomly
+    across users. Category i (0 = most common) is chosen with weight
+    1 / (i + 1) ** category_skew, so 0 gives every category the same share.
+    """
+    generator = random.Random(seed)
+    password = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+    with open(os.path.join(directory, "user_list.csv"),
+              "w",
+              newline="",
+              encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for number in range(users):
+            writer.writerow([user_name(number), password, "2500.00"])
+
+    weights = list(
+        accumulate(1 / (rank + 1)**category_skew
+                   for rank in range(len(CATEGORIES))))
+    start = END_DATE - timedelta(days=days)
+    step = days * 86400 / max(rows, 1)
+
+    with open(os.path.join(directory, "expenses.csv"),
+              "w",
+              newline="",
+              encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(version_header(FORMAT_HEADER[1]))
+        for number in range(rows):
+            category, essential = generator.choices(CATEGORIES,
+                                                    cum_weights=weights)[0]
+            moment = start + timedelta(seconds=int(number * step))
+            writer.writerow([
+                user_name(generator.randrange(users)),
+                moment.strftime("%Y-%m-%d %H:%M:%S"), category,
+                f"{category} purchase {number}",
+                int(generator.lognormvariate(7, 1)) + 1,
+                "Essential" if essential else "Non-Essential"
+            ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--rows", type=parse_count, default="10k")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--category-skew", type=float, default=1.0)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    generate(args.directory, args.rows, args.users, args.category_skew,
+             args.days, args.seed)
+    print(f"Wrote {args.rows:,} expenses for {args.users} users to "
+          f"{args.directory}")
@@ -0,0 +1,88 @@
+# Simulates many clients adding expenses through the server at the same time
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import FinanceServer, send  # noqa: E402
+from storage import CsvBackend  # noqa: E402
+
+
+# Creates a profile and adds expenses over one connection, returning the latencies
+async def run_client(path, number, expenses):
+    reader, writer = await asyncio.open_unix_connection(path)
+    name = f"client{number}"
+    response = await send(reader,
+                          writer,
+                          "create_profile",
+                          name=name,
+                          password="secret")
+    assert response["ok"], response
+
+    latencies = []
+    for item in range(expenses):
+        start = time.perf_counter()
+        response = await send(reader,
+                              writer,
+                              "add_expense",
+                              category=f"Category {item % 5}",
+                              description=f"Item {item}",
+                              amount="1.50",
+                              type="E",
+                              date=f"2024-01-{item % 28 + 1:02d}")
+        latencies.append(time.perf_counter() - start)
+        assert response["ok"], response
+
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+# Runs all clients against a fresh data directory and checks nothing was lost
+async def run(clients, expenses):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = CsvBackend(os.path.join(directory, "user_list.csv"),
+                             os.path.join(directory, "expenses.csv"),
+                             os.path.join(directory, "journal.csv"))
+        path = os.path.join(directory, "finance.sock")
+        server = FinanceServer(storage)
+        listener = await server.start(path)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_client(path, number, expenses)
+                                         for number in range(clients)))
+        elapsed = time.perf_counter() - start
+
+        listener.close()
+        await listener.wait_closed()
+        await server.stop()
+
+        # A second backend reads the files from scratch
+        check = CsvBackend(os.path.join(directory, "user_list.csv"),
+                           os.path.join(directory, "expenses.csv"),
+                           os.path.join(directory, "journal.csv"))
+        for number in range(clients):
+            totals = check.totals(f"client{number}")
+            assert totals.rows == expenses, (number, totals.rows)
+            assert totals.total == expenses * 150, (number, totals.total)
+
+    latencies = sorted(latency for result in results for latency in result)
+    total = clients * expenses
+    print(f"{clients} clients x {expenses} expenses: {total} added "
+          f"in {elapsed:.2f}s ({total / elapsed:,.0f} per second) "
+          f"in {server.batches} batched writes")
+    print(f"Latency: median {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+    print("No expenses lost.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--expenses", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.expenses))
@@ -0,0 +1,93 @@
+# Runs random appends, resets, compactions and archive runs that mix month
+# and year periods, and checks after each step that date range reports are
+# oldest first and hold exactly the expected rows
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_store import ExpenseStore  # noqa: E402
+from journal import Journal  # noqa: E402
+from timestamps import parse_timestamp  # noqa: E402
+
+USERS = ("alice", "bob", "carol")
+FIRST_DAY = datetime(2019, 1, 1)
+DAYS = 5 * 365
+EVERYTHING = (datetime(2000, 1, 1), datetime(2100, 1, 1))
+
+
+# Returns an expense row of a user on a random day of the covered years
+def random_row(rng, username):
+    date = FIRST_DAY + timedelta(days=rng.randrange(DAYS),
+                                 seconds=rng.randrange(86400))
+    return [
+        username,
+        date.strftime("%Y-%m-%d %H:%M:%S"),
+        rng.choice(("Food", "Rent", "Travel")), "Soak",
+        str(rng.randrange(1, 10000)),
+        rng.choice("EN")
+    ]
+
+
+# Takes one random step, applying it to both the store and the expected rows
+def step(rng, store, expected):
+    action = rng.random()
+    if action < 0.5:
+        username = rng.choice(USERS)
+        rows = [random_row(rng, username) for _ in range(rng.randrange(1, 40))]
+        store.append_many(rows)
+        expected[username].extend(rows)
+        return f"added {len(rows)} for {username}"
+    if action < 0.6:
+        username = rng.choice(USERS)
+        store.reset_user(username)
+        expected[username] = []
+        return f"reset {username}"
+    if action < 0.7:
+        store.compact()
+        return "compacted"
+    period = rng.choice(("month", "year"))
+    cutoff = FIRST_DAY + timedelta(days=rng.randrange(DAYS))
+    moved = store.archive_before(cutoff, period, rng.choice(("gzip", "lzma")))
+    return f"archived {moved} by {period} before {cutoff:%Y-%m-%d}"
+
+
+# Checks every user's date range report against the expected rows
+def check(store, expected, done):
+    for username in USERS:
+        rows = list(store.rows_between(username, *EVERYTHING))
+        stamps = [parse_timestamp(row[1]) for row in rows]
+        assert stamps == sorted(stamps), (
+            f"{username}'s rows are out of order after: {done}")
+        assert sorted(rows) == sorted(
+            expected[username]), (f"{username}'s rows differ after: {done}")
+        total = sum(int(row[4]) for row in expected[username])
+        assert store.totals(username).total == total, (
+            f"{username}'s total differs after: {done}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExpenseStore(os.path.join(directory, "expenses.csv"),
+                             Journal(os.path.join(directory, "journal.csv")),
+                             os.path.join(directory, "archive"))
+        expected = {username: [] for username in USERS}
+        done = []
+        for _ in range(args.steps):
+            done.append(step(rng, store, expected))
+            check(store, expected, done[-5:])
+        segments = sorted(os.listdir(os.path.join(directory, "archive")))
+
+    print(f"{args.steps} steps, {len(segments)} segments left: "
+          f"{', '.join(segments)}")
+    print("Every date range report was complete and oldest first.")
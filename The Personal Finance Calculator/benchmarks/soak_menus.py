@@ -0,0 +1,104 @@
+# Drives the interactive menus through many scripted transitions and checks
+# that memory and stack depth stay flat
+import argparse
+import builtins
+import contextlib
+import io
+import itertools
+import os
+import sys
+import tempfile
+import tracemalloc
+
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One round of a guest session: a bad choice, an income, an expense, a
+# report, a budget summary that resets everything, and back to setup
+SCRIPT = [
+    "9",  # setup: invalid option
+    "3",  # setup: continue as a guest
+    "x",  # main menu: not a number
+    "1",
+    "2500",  # main menu: enter income
+    "2",
+    "Food",
+    "Lunch",
+    "12.50",
+    "E",  # main menu: add an expense
+    "4",
+    "4",
+    "n",  # main menu: report of all expenses
+    "3",
+    "1",  # main menu: budget summary, reset the account
+    "3",
+    "2",  # main menu: budget summary, return
+    "5",  # main menu: exit
+]
+
+
+# Returns how many frames are on the stack of the caller
+def stack_depth():
+    depth = 0
+    frame = sys._getframe(1)
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+# Runs the scripted session for the given number of screen transitions
+def run(transitions, sample_every):
+    answers = itertools.cycle(SCRIPT)
+    depths = []
+
+    def scripted_input(prompt=""):
+        depths.append(stack_depth())
+        if len(depths) > 1000:
+            del depths[:-1]
+        return next(answers)
+
+    import main
+
+    builtins.input = scripted_input
+    samples = []
+    deepest = 0
+    state = main.SETUP
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        for transition in range(1, transitions + 1):
+            state = main.SCREENS[state]()
+            if state is main.EXIT:
+                state = main.SETUP
+            deepest = max(deepest, max(depths))
+            # Drop what was printed so it doesn't count as growth
+            output.seek(0)
+            output.truncate()
+            if transition % sample_every == 0:
+                current, _ = tracemalloc.get_traced_memory()
+                samples.append((transition, current, deepest))
+    tracemalloc.stop()
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transitions", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIRECTORY)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        samples = run(args.transitions, args.transitions // args.samples)
+        os.chdir(APP_DIRECTORY)
+
+    for transition, current, deepest in samples:
+        print(f"{transition:>8} transitions: {current / 1024:8.1f} KiB "
+              f"traced, deepest stack {deepest} frames")
+
+    first, last = samples[0], samples[-1]
+    growth = last[1] - first[1]
+    print(f"Memory growth after the first sample: {growth / 1024:.1f} KiB")
+    assert last[2] == first[2], "stack depth kept growing"
+    assert growth < 64 * 1024, "memory kept growing"
+    print("Memory and stack depth stayed flat.")
@@ -0,0 +1,145 @@
+# Imported modules
+from array import array
+from datetime import datetime
+
+from timestamps import EPOCH, SECOND, parse_timestamp
+
+NO_DATE = -2**63
+
+numpy = None
+numpy_checked = False
+
+
+# Imports numpy the first time a report needs it, returning None if it is missing
+def load_numpy():
+    """
+    Importing numpy takes longer than everything else the program imports,
+    so command line calls that never build a report don't pay for it.
+    """
+    global numpy, numpy_checked
+    if not numpy_checked:
+        numpy_checked = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+class ExpenseColumns:
+    """
+    Columnar copy of one user's expenses used for aggregate reports.
+
+    Amounts (whole pence) and timestamps are kept in flat typed arrays, and
+    categories and types as small integer codes into a dictionary of names.
+    With numpy installed the arrays are viewed without copying and grouped with
+    vectorised bincounts; without it the same totals are summed in Python.
+    Passing vectorised=False to the totals sums in Python anyway, for one-off
+    commands where importing numpy would take longer than the sums.
+    """
+
+    def __init__(self):
+        self.amounts = array("q")
+        self.stamps = array("q")
+        self.category_codes = array("I")
+        self.type_codes = array("B")
+        self.categories = []
+        self.types = []
+        self._category_lookup = {}
+        self._type_lookup = {}
+
+    def __len__(self):
+        return len(self.amounts)
+
+    # Returns the code of a value, adding it to the dictionary if it is new
+    @staticmethod
+    def _encode(key, name, lookup, names):
+        code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(names)
+            names.append(name)
+        return code
+
+    # Appends expense rows ([user, date, category, description, amount, type])
+    def extend(self, rows):
+        for row in rows:
+            if len(row) < 6:
+                continue
+            try:
+                amount = int(row[4])
+            except ValueError:
+                continue
+
+            stamp = parse_timestamp(row[1])
+            category = row[2].strip()
+            expense_type = row[5].strip().capitalize()
+
+            self.amounts.append(amount)
+            self.stamps.append(NO_DATE if stamp is None else stamp)
+            self.category_codes.append(
+                self._encode(category.lower(), category,
+                             self._category_lookup, self.categories))
+            self.type_codes.append(
+                self._encode(expense_type, expense_type, self._type_lookup,
+                             self.types))
+
+    # Sums amounts per dictionary code
+    def _group_sums(self, codes, size, vectorised=True):
+        numpy = load_numpy() if vectorised else None
+        if numpy is not None:
+            # asarray wraps the array's buffer, nothing is copied. The float64
+            # sums of whole pence are exact up to 2**53
+            sums = numpy.bincount(numpy.asarray(codes),
+                                  weights=numpy.asarray(self.amounts),
+                                  minlength=size)
+            return [int(total) for total in sums.round().tolist()]
+
+        sums = [0] * size
+        for code, amount in zip(codes, self.amounts):
+            sums[code] += amount
+        return sums
+
+    # Returns (category, total) pairs, largest total first
+    def totals_by_category(self, vectorised=True):
+        sums = self._group_sums(self.category_codes, len(self.categories),
+                                vectorised)
+        return sorted(zip(self.categories, sums), key=lambda item: -item[1])
+
+    # Returns (type, total) pairs, largest total first
+    def totals_by_type(self, vectorised=True):
+        sums = self._group_sums(self.type_codes, len(self.types), vectorised)
+        return sorted(zip(self.types, sums), key=lambda item: -item[1])
+
+    # Returns ("YYYY-MM", total) pairs in month order, skipping undated rows
+    def totals_by_month(self, vectorised=True):
+        if not self.amounts:
+            return []
+
+        numpy = load_numpy() if vectorised else None
+        if numpy is not None:
+            stamps = numpy.asarray(self.stamps)
+            dated = stamps != NO_DATE
+            if not dated.any():
+                return []
+            months = stamps[dated].astype("datetime64[s]").astype(
+                "datetime64[M]")
+            first = months.min()
+            offsets = (months - first).astype(numpy.int64)
+            sums = numpy.bincount(offsets,
+                                  weights=numpy.asarray(self.amounts)[dated])
+            counts = numpy.bincount(offsets)
+            return [(str(first + offset), int(round(sums[offset])))
+                    for offset in numpy.flatnonzero(counts).tolist()]
+
+        totals = {}
+        for stamp, amount in zip(self.stamps, self.amounts):
+            if stamp == NO_DATE:
+                continue
+            month = (EPOCH + stamp * SECOND).strftime("%Y-%m")
+            totals[month] = totals.get(month, 0) + amount
+        return sorted(totals.items())
+
+
+# Formats a month key such as 2024-01 for display, e.g. Jan 2024
+def month_label(month):
+    return datetime.strptime(month, "%Y-%m").strftime("%b %Y")
@@ -0,0 +1,238 @@
+# Imported modules
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from search_index import matches_search, tokenize
+from timestamps import parse_timestamp, to_timestamp
+
+# Access paths in the order they are preferred when they read as many rows
+PATHS = ("date", "category", "type", "search", "all")
+PATH_NAMES = {
+    "date": "date range",
+    "category": "category",
+    "type": "expense type",
+    "search": "search index",
+    "all": "all of the user's rows"
+}
+SORT_KEYS = ("date", "amount", "category")
+
+
+# Sort key putting rows in date order, undated rows last
+def date_key(row):
+    stamp = parse_timestamp(row[1])
+    return (stamp is None, stamp or 0)
+
+
+# Sort key putting rows in amount order, unreadable amounts first
+def amount_key(row):
+    try:
+        return int(row[4])
+    except ValueError:
+        return -1
+
+
+# Sort key putting rows in category order, ignoring case
+def category_key(row):
+    return row[2].strip().lower()
+
+
+SORTS = {"date": date_key, "amount": amount_key, "category": category_key}
+
+
+# Parses the most rows a query may return, a whole number of 0 or more
+def parse_limit(text):
+    limit = int(text)
+    if limit < 0:
+        raise ValueError(f"The limit can't be negative: {text}")
+    return limit
+
+
+class ExpenseQuery:
+    """
+    Filters, amount thresholds, an order and a limit for one user's expenses.
+
+    Category and type compare the way the single-filter reports always have
+    (ignoring case and surrounding spaces), start and end are inclusive,
+    amounts are whole pence and every word of search has to start a word of
+    the category or description. Unset filters match everything.
+    """
+
+    __slots__ = ("category", "expense_type", "start", "end", "min_amount",
+                 "max_amount", "search", "sort", "descending", "limit",
+                 "category_key", "type_key", "terms", "_low", "_high")
+
+    def __init__(self,
+                 category=None,
+                 expense_type=None,
+                 start=None,
+                 end=None,
+                 min_amount=None,
+                 max_amount=None,
+                 search=None,
+                 sort=None,
+                 descending=False,
+                 limit=None):
+        if sort is not None and sort not in SORTS:
+            raise ValueError(f"Can't sort by {sort}, only by "
+                             f"{', '.join(SORT_KEYS)}")
+        if limit is not None and limit < 0:
+            raise ValueError(f"The limit can't be negative: {limit}")
+        self.category = category
+        self.expense_type = expense_type
+        self.start = start
+        self.end = end
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.terms = tokenize(search) if search is not None else []
+        # A search without any words doesn't filter anything
+        self.search = search if self.terms else None
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.category_key = (category.strip().lower()
+                             if category is not None else None)
+        self.type_key = (expense_type.strip().capitalize()
+                         if expense_type is not None else None)
+        self._low = to_timestamp(start) if start is not None else None
+        self._high = to_timestamp(end) if end is not None else None
+
+    # Checks whether the query has a date range
+    @property
+    def dated(self):
+        return self.start is not None or self.end is not None
+
+    # Returns the date range with open ends filled in
+    def date_range(self):
+        return self.start or datetime.min, self.end or datetime.max
+
+    # Returns the access paths the query's filters make available
+    def paths(self):
+        available = {
+            "date": self.dated,
+            "category": self.category is not None,
+            "type": self.expense_type is not None,
+            "search": self.search is not None,
+            "all": True
+        }
+        return [path for path in PATHS if available[path]]
+
+    # Returns everything that changes the result, for cache keys
+    def key(self):
+        return (self.category_key, self.type_key, self._low,
+                self._high, self.min_amount, self.max_amount,
+                tuple(sorted(set(self.terms))), self.sort, self.descending,
+                self.limit)
+
+    # Checks whether a stored row passes every filter
+    def matches(self, row):
+        if len(row) < 6:
+            return False
+        if (self.category_key is not None
+                and row[2].strip().lower() != self.category_key):
+            return False
+        if (self.type_key is not None
+                and row[5].strip().capitalize() != self.type_key):
+            return False
+        if self.dated:
+            stamp = parse_timestamp(row[1])
+            if (stamp is None or self._low is not None and stamp < self._low
+                    or self._high is not None and stamp > self._high):
+                return False
+        if self.min_amount is not None or self.max_amount is not None:
+            try:
+                amount = int(row[4])
+            except ValueError:
+                return False
+            if (self.min_amount is not None and amount < self.min_amount or
+                    self.max_amount is not None and amount > self.max_amount):
+                return False
+        return not self.terms or matches_search(self.terms, row[2], row[3])
+
+
+class QueryPlan:
+    """
+    The access path chosen for a query and how many rows each open path
+    would have read. Running the query fills in the rows it scanned and
+    returned.
+    """
+
+    __slots__ = ("path", "estimates", "scanned", "returned")
+
+    def __init__(self, path, estimates):
+        self.path = path
+        self.estimates = estimates
+        self.scanned = 0
+        self.returned = 0
+
+    # Describes the plan, like EXPLAIN in a database
+    def explain(self, query):
+        lines = [
+            f"Access path: {PATH_NAMES[self.path]} "
+            f"({self.estimates[self.path]:,} rows)"
+        ]
+        others = [
+            f"{PATH_NAMES[path]} ({rows:,} rows)"
+            for path, rows in self.estimates.items() if path != self.path
+        ]
+        if others:
+            lines.append(f"Not chosen: {', '.join(others)}")
+        order = query.sort or ("date" if query.dated else None)
+        if order is not None:
+            lines.append(f"Sorted by {order}"
+                         f"{', largest first' if query.descending else ''}")
+        if query.limit is not None:
+            lines.append(f"Limited to {query.limit:,} rows")
+        lines.append(f"Rows scanned: {self.scanned:,}, "
+                     f"returned: {self.returned:,}")
+        return lines
+
+
+# Picks the access path that reads the fewest rows
+def choose_plan(estimates):
+    path = min(estimates,
+               key=lambda path: (estimates[path], PATHS.index(path)))
+    return QueryPlan(path, estimates)
+
+
+# Yields the rows of an access path that pass every filter, ordered and limited
+def execute(rows, query, plan):
+    """
+    The rows are read once. Every filter is applied to each row, including
+    the one the access path already satisfies, which is cheap and keeps
+    every path returning the same rows. A limit without an order stops
+    reading early; with an order only `limit` rows are held at a time.
+    Date range queries come back in date order whichever path they use.
+    """
+
+    def scanned():
+        for row in rows:
+            plan.scanned += 1
+            yield row
+
+    matching = filter(query.matches, scanned())
+    sort = query.sort
+    if sort is None and query.dated and plan.path != "date":
+        sort = "date"
+
+    if sort is None:
+        results = (matching if query.limit is None else islice(
+            matching, query.limit))
+    elif query.limit is None:
+        results = sorted(matching, key=SORTS[sort], reverse=query.descending)
+    elif query.descending:
+        results = heapq.nlargest(query.limit, matching, key=SORTS[sort])
+    else:
+        results = heapq.nsmallest(query.limit, matching, key=SORTS[sort])
+
+    for row in results:
+        plan.returned += 1
+        yield row
+
+
+# Plans and runs a query over a user's stored expenses, returning the plan
+# and a generator of the matching rows
+def run_query(storage, username, query):
+    plan = choose_plan(storage.access_paths(username, query))
+    return plan, execute(storage.read_path(username, plan.path, query), query,
+                         plan)
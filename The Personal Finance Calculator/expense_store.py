@@ -0,0 +1,1132 @@
+# Imported modules
+import csv
+import heapq
+import io
+import logging
+import os
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                as_completed, wait)
+from itertools import chain
+
+from archive import COMPRESSIONS, PERIODS, ArchiveStore, period_of
+from columnar import ExpenseColumns
+from instrumentation import count_rows, timed
+from journal import (HEADER_MARK, RESET_EXPENSES, file_identity, replace_file,
+                     version_header)
+from mmap_scan import find_records
+from money import parse_pence
+from search_index import SearchIndex, matches_search, tokenize
+from snapshot import SNAPSHOT_TAIL_BYTES, open_snapshot, write_snapshot
+from timestamps import parse_timestamp, to_timestamp
+
+# First row of an expenses file whose amounts are stored as whole pence,
+# followed by the id of the file's version (see journal.file_identity)
+FORMAT_HEADER = [HEADER_MARK, "pence"]
+
+# Totalling every user reads the file in blocks of about this many bytes,
+# summed by TOTALS_WORKERS processes
+TOTALS_BLOCK_BYTES = 16 * 1024 * 1024
+TOTALS_WORKERS = os.cpu_count() or 1
+
+
+# Splits a binary csv file into records, yielding (offset, raw_bytes) pairs.
+# A record only ends at a newline that is outside of a quoted field.
+def iter_records(file, start=0):
+    file.seek(start)
+    offset = start
+    pending = b""
+    pending_offset = start
+    quotes = 0
+
+    for line in file:
+        if not pending:
+            pending_offset = offset
+        pending += line
+        quotes += line.count(b'"')
+        offset += len(line)
+
+        if quotes % 2 == 0:
+            yield pending_offset, pending
+            pending = b""
+            quotes = 0
+
+    if pending:
+        yield pending_offset, pending
+
+
+# Parses a single raw csv record into a list of fields
+def parse_record(raw):
+    text = raw.decode("utf-8")
+    for row in csv.reader(io.StringIO(text)):
+        return row
+    return []
+
+
+# Checks whether a parsed row is the format header rather than an expense
+def is_format_header(row):
+    return row[:2] == FORMAT_HEADER
+
+
+# Formats a row the same way csv.writer does, returned as encoded bytes
+def format_record(row):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue().encode("utf-8")
+
+
+# Returns the length of the whole records at the start of a block that starts
+# at a record, or 0 if the block doesn't hold a whole record yet
+def whole_records_length(data):
+    quotes = data.count(b'"')
+    end = len(data)
+    while True:
+        newline = data.rfind(b"\n", 0, end)
+        if newline == -1:
+            return 0
+        quotes -= data.count(b'"', newline + 1, end)
+        if quotes % 2 == 0:
+            return newline + 1
+        end = newline
+
+
+# Reads the bytes from start up to size in blocks of whole records, yielding
+# (offset, block) pairs
+def read_blocks(file, start, size, block_bytes):
+    file.seek(start)
+    offset = start
+    pending = b""
+    remaining = size - start
+    while remaining > 0:
+        data = file.read(min(block_bytes, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        data = pending + data
+        length = whole_records_length(data) if remaining > 0 else len(data)
+        if length:
+            yield offset, data[:length]
+            offset += length
+        pending = data[length:]
+    if pending:
+        yield offset, pending
+
+
+# Sums the amounts of each user's rows in a block of whole records starting at
+# byte offset base, skipping rows hidden by tombstones. Returns the sums and
+# how many amounts couldn't be read. Runs in worker processes.
+def block_totals(data, base, tombstones):
+    if tombstones:
+        rows = ((base + offset, parse_record(raw))
+                for offset, raw in iter_records(io.BytesIO(data)))
+    else:
+        # Nothing is hidden, so the offsets aren't needed
+        rows = ((base, row) for row in csv.reader(
+            io.StringIO(data.decode("utf-8"), newline="")))
+
+    totals = {}
+    invalid = 0
+    for offset, row in rows:
+        if len(row) < 5 or not row[0]:
+            continue
+        username = row[0]
+        if offset < tombstones.get(username, -1):
+            continue
+        try:
+            amount = int(row[4])
+        except ValueError:
+            invalid += 1
+            continue
+        totals[username] = totals.get(username, 0) + amount
+    return totals, invalid
+
+
+# Adds a block's sums to the running totals, returning its invalid amounts
+def merge_totals(totals, result):
+    block, invalid = result
+    for username, amount in block.items():
+        totals[username] = totals.get(username, 0) + amount
+    return invalid
+
+
+class UserTotals:
+    """
+    Running aggregates of one user's expenses.
+    """
+
+    __slots__ = ("total", "by_type", "by_category", "rows")
+
+    def __init__(self):
+        self.total = 0
+        self.by_type = {}
+        self.by_category = {}
+        self.rows = 0
+
+    # Adds a parsed row to the aggregates, returning False if its amount is invalid
+    def add(self, row):
+        if len(row) < 5:
+            return True
+        try:
+            amount = int(row[4])
+        except ValueError:
+            return False
+
+        self.total += amount
+        self.rows += 1
+        if len(row) >= 6:
+            expense_type = row[5].strip().capitalize()
+            category = row[2].strip().lower()
+            self.by_type[expense_type] = self.by_type.get(expense_type,
+                                                          0) + amount
+            self.by_category[category] = self.by_category.get(category,
+                                                              0) + amount
+        return True
+
+    # Returns new aggregates adding another set to these
+    def combined(self, other):
+        totals = UserTotals()
+        for part in (self, other):
+            totals.total += part.total
+            totals.rows += part.rows
+            for key, amount in part.by_type.items():
+                totals.by_type[key] = totals.by_type.get(key, 0) + amount
+            for key, amount in part.by_category.items():
+                totals.by_category[key] = totals.by_category.get(key,
+                                                                 0) + amount
+        return totals
+
+    # Lists the differences between these aggregates and another set
+    def differences(self, other):
+        drift = []
+        if self.total != other.total:
+            drift.append(f"total {self.total} != {other.total}")
+        for name in ("by_type", "by_category"):
+            mine = getattr(self, name)
+            theirs = getattr(other, name)
+            for key in sorted(set(mine) | set(theirs)):
+                if mine.get(key, 0) != theirs.get(key, 0):
+                    drift.append(
+                        f"{name}[{key}] {mine.get(key, 0)} != {theirs.get(key, 0)}"
+                    )
+        return drift
+
+
+class UserIndex:
+    """
+    Row offsets of one user, in file order, sorted by date, and per category
+    and type (compared the way reports compare them) in file order.
+    """
+
+    __slots__ = ("offsets", "stamps", "dated_offsets", "undated_offsets",
+                 "by_category", "by_type")
+
+    def __init__(self):
+        self.offsets = array("q")
+        self.stamps = array("q")
+        self.dated_offsets = array("q")
+        self.undated_offsets = array("q")
+        self.by_category = {}
+        self.by_type = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # Adds the offset of a parsed row, keeping the date order (rows usually
+    # arrive in order)
+    def add(self, offset, row):
+        stamp = parse_timestamp(row[1]) if len(row) > 1 else None
+        if len(row) >= 6:
+            self._add_to(self.by_category, row[2].strip().lower(), offset)
+            self._add_to(self.by_type, row[5].strip().capitalize(), offset)
+
+        self.offsets.append(offset)
+        if stamp is None:
+            self.undated_offsets.append(offset)
+        elif not self.stamps or stamp >= self.stamps[-1]:
+            self.stamps.append(stamp)
+            self.dated_offsets.append(offset)
+        else:
+            position = bisect_right(self.stamps, stamp)
+            self.stamps.insert(position, stamp)
+            self.dated_offsets.insert(position, offset)
+
+    # Adds an offset to the offsets kept for a key
+    @staticmethod
+    def _add_to(offsets, key, offset):
+        kept = offsets.get(key)
+        if kept is None:
+            kept = offsets[key] = array("q")
+        kept.append(offset)
+
+    # Returns the offsets of rows dated between two timestamps (inclusive)
+    def between(self, start, end):
+        low = bisect_left(self.stamps, start)
+        high = bisect_right(self.stamps, end)
+        return self.dated_offsets[low:high]
+
+    # Counts the rows dated between two timestamps (inclusive)
+    def count_between(self, start, end):
+        return max(
+            bisect_right(self.stamps, end) - bisect_left(self.stamps, start),
+            0)
+
+
+class ExpenseStore:
+    """
+    Expense storage backed by the shared expenses csv file.
+
+    The file is indexed once and every user gets a list of the byte offsets
+    of their own rows, so reading one user's expenses costs time proportional
+    to that user's rows rather than to the whole file. Rows appended by other
+    processes are picked up by indexing only the new tail of the file.
+
+    Per-user totals (overall, per type and per category) are kept up to date
+    as rows are indexed, so summaries never have to re-read the file.
+
+    Resetting a user's expenses appends a tombstone to the journal instead of
+    rewriting the file: rows of that user written before the tombstone are
+    hidden, and compact() later drops them with an atomic file replace.
+
+    With an archive directory, archive_before() moves old rows into
+    compressed segments (see archive.py). Every read includes the archived
+    rows, oldest first, and totals come from the segment headers.
+
+    The index itself is saved to a binary snapshot next to the file at
+    compaction and shutdown (see snapshot.py). A later process maps it in
+    and only indexes what was appended to the file since.
+    """
+
+    def __init__(self, path, journal, archive_directory=None):
+        self.path = path
+        self.journal = journal
+        self._lock = journal.lock
+        self.archive = (ArchiveStore(archive_directory, path, UserTotals,
+                                     journal.lock)
+                        if archive_directory is not None else None)
+        self.snapshot_path = f"{path}.snapshot"
+        self._snapshot_size = None
+        self._index = {}
+        self._totals = {}
+        self._columns = {}
+        self._searches = {}
+        self._scanned = None
+        self._tombstones = {}
+        self._dead = 0
+        self._size = 0
+        self._mtime = 0
+        self._inode = None
+        self._identity = None
+        self._journal_version = None
+
+    # Makes sure the index matches the file on disk, indexing only what changed
+    def refresh(self):
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return
+
+            if stat.st_ino != self._inode or stat.st_size < self._size:
+                self._reindex(stat)
+            elif stat.st_size > self._size:
+                if file_identity(self.path) != self._identity:
+                    # Replaced by a new version that was given the same inode
+                    self._reindex(stat)
+                else:
+                    self._index_from(self._size)
+            elif stat.st_mtime_ns != self._mtime:
+                # Same size but rewritten in place, nothing can be trusted
+                self._reindex(stat)
+
+            self._apply_journal()
+
+    # Forgets everything that was indexed
+    def _reset(self):
+        self._index = {}
+        self._totals = {}
+        self._columns = {}
+        self._searches = {}
+        self._scanned = None
+        self._tombstones = {}
+        self._dead = 0
+        self._size = 0
+        self._mtime = 0
+        self._inode = None
+        self._identity = None
+        self._journal_version = None
+        self._snapshot_size = None
+
+    # Indexes the whole file again, hiding rows covered by journaled tombstones
+    def _reindex(self, stat):
+        if self._load_snapshot():
+            if stat.st_size > self._size:
+                self._index_from(self._size)
+            return
+        self._reset()
+        self._tombstones = self._journal_tombstones()
+        if stat.st_size and not self._has_format_header():
+            self._migrate_to_pence()
+            stat = os.stat(self.path)
+            # The migrated file is a new version that no tombstone applies to
+            self._tombstones = self._journal_tombstones()
+        self._inode = stat.st_ino
+        self._identity = file_identity(self.path)
+        self._index_from(0)
+
+    # Replaces the index with the one saved in a valid snapshot, if there is one
+    def _load_snapshot(self):
+        """
+        The snapshot holds the dead row count, the tombstones it was built
+        with, and every user's totals and index arrays, so loading it
+        copies arrays out of the mapping instead of parsing rows. Tombstones
+        journaled since are applied by refresh() as usual.
+        """
+        snapshot = open_snapshot(self.snapshot_path, self.path)
+        if snapshot is None:
+            return False
+        self._reset()
+        with snapshot:
+            strings = snapshot.strings
+            self._dead = snapshot.next()
+            for _ in range(snapshot.next()):
+                username = strings[snapshot.next()]
+                self._tombstones[username] = snapshot.next()
+            for _ in range(snapshot.next()):
+                username = strings[snapshot.next()]
+                totals = self._totals[username] = UserTotals()
+                index = self._index[username] = UserIndex()
+                totals.total = snapshot.next()
+                totals.rows = snapshot.next()
+                counts = [snapshot.next() for _ in range(7)]
+                index.offsets = snapshot.array(counts[0])
+                index.stamps = snapshot.array(counts[1])
+                index.dated_offsets = snapshot.array(counts[1])
+                index.undated_offsets = snapshot.array(counts[2])
+                for amounts, count in ((totals.by_type, counts[3]),
+                                       (totals.by_category, counts[4])):
+                    for _ in range(count):
+                        key = strings[snapshot.next()]
+                        amounts[key] = snapshot.next()
+                for offsets, count in ((index.by_category, counts[5]),
+                                       (index.by_type, counts[6])):
+                    for _ in range(count):
+                        key = strings[snapshot.next()]
+                        offsets[key] = snapshot.array(snapshot.next())
+            self._inode = snapshot.inode
+            self._size = self._snapshot_size = snapshot.size
+            self._mtime = snapshot.mtime
+        self._identity = file_identity(self.path)
+        return True
+
+    # Returns the string table and numbers of a snapshot of the index
+    def _snapshot_contents(self):
+        strings = {}
+        numbers = array("q")
+
+        def string(text):
+            number = strings.get(text)
+            if number is None:
+                number = strings[text] = len(strings)
+            return number
+
+        numbers.append(self._dead)
+        numbers.append(len(self._tombstones))
+        for username, upto in self._tombstones.items():
+            numbers.extend((string(username), upto))
+        numbers.append(len(self._index))
+        for username, index in self._index.items():
+            totals = self._totals[username]
+            numbers.extend((string(username), totals.total, totals.rows,
+                            len(index.offsets), len(index.stamps),
+                            len(index.undated_offsets), len(totals.by_type),
+                            len(totals.by_category), len(index.by_category),
+                            len(index.by_type)))
+            for values in (index.offsets, index.stamps, index.dated_offsets,
+                           index.undated_offsets):
+                numbers.extend(values)
+            for amounts in (totals.by_type, totals.by_category):
+                for key, amount in amounts.items():
+                    numbers.extend((string(key), amount))
+            for offsets in (index.by_category, index.by_type):
+                for key, values in offsets.items():
+                    numbers.extend((string(key), len(values)))
+                    numbers.extend(values)
+        return list(strings), numbers
+
+    # Saves the index to the snapshot file, returning whether it was written
+    def save_snapshot(self, force=False):
+        """
+        Only an index that has been built is saved; nothing is read just to
+        save it. Unless forced (after compaction), it is only saved when
+        there is no snapshot of this file yet or SNAPSHOT_TAIL_BYTES have
+        been appended since the last one.
+        """
+        with self._lock:
+            if self._inode is None:
+                return False
+            self.refresh()
+            if self._inode is None or not force and (
+                    self._snapshot_size is not None and
+                    self._size - self._snapshot_size < SNAPSHOT_TAIL_BYTES):
+                return False
+            strings, numbers = self._snapshot_contents()
+            try:
+                written = write_snapshot(self.snapshot_path, self.path,
+                                         self._inode, self._size, self._mtime,
+                                         strings, numbers)
+            except OSError as e:
+                logging.warning(f"Couldn't save the expense index: {e}")
+                return False
+            if written:
+                self._snapshot_size = self._size
+            return written
+
+    # Checks whether the file starts with the pence format header
+    def _has_format_header(self):
+        with open(self.path, "rb") as file:
+            for _, raw in iter_records(file):
+                return is_format_header(parse_record(raw))
+        return False
+
+    # Rewrites a file with amounts in pounds to whole pence, replacing it atomically
+    def _migrate_to_pence(self):
+
+        def migrated_rows():
+            yield version_header(FORMAT_HEADER[1])
+            with open(self.path, "rb") as file:
+                for offset, raw in iter_records(file):
+                    row = parse_record(raw)
+                    if not row:
+                        continue
+                    if offset < self._tombstones.get(row[0], -1):
+                        continue
+                    if len(row) >= 5:
+                        try:
+                            row[4] = parse_pence(row[4])
+                        except ValueError:
+                            pass
+                    yield row
+
+        replace_file(self.path, migrated_rows())
+        self.journal.prune()
+        logging.info(f"Expense amounts in {self.path} migrated to pence")
+
+    # Indexes every record from the given byte offset to the end of the file
+    def _index_from(self, start):
+        scanned = 0
+        with timed("expenses.index"), open(self.path, "rb") as file:
+            for offset, raw in iter_records(file, start):
+                scanned += 1
+                row = parse_record(raw)
+                if not row or not row[0] or offset == 0 and is_format_header(
+                        row):
+                    continue
+                if offset < self._tombstones.get(row[0], -1):
+                    self._dead += 1
+                    continue
+                self._add_row(row, offset)
+            stat = os.fstat(file.fileno())
+
+        count_rows("expenses.index", scanned, scanned, stat.st_size - start)
+        self._size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+
+    # Records the offset of a row and adds it to its owner's totals
+    def _add_row(self, row, offset):
+        username = row[0]
+        index = self._index.get(username)
+        if index is None:
+            index = self._index[username] = UserIndex()
+            self._totals[username] = UserTotals()
+        index.add(offset, row)
+
+        if not self._totals[username].add(row):
+            logging.warning(
+                f"Skipping a row with invalid amount format: {row[4]}")
+
+    # Returns the latest tombstone offset of every user from the journal
+    def _journal_tombstones(self):
+        tombstones = {}
+        for record in self.journal.records_for(self.path):
+            if record[0] == RESET_EXPENSES:
+                upto = int(record[4])
+                if upto > tombstones.get(record[3], -1):
+                    tombstones[record[3]] = upto
+        return tombstones
+
+    # Applies journaled tombstones if the journal or the file has changed
+    def _apply_journal(self):
+        version = (self.journal.version, self._identity)
+        if version == self._journal_version:
+            return
+        self._journal_version = version
+
+        for username, upto in self._journal_tombstones().items():
+            if upto > self._tombstones.get(username, -1):
+                self._tombstones[username] = upto
+                self._drop_rows_before(username, upto)
+
+    # Hides a user's rows written before the given offset and fixes their totals
+    def _drop_rows_before(self, username, upto):
+        index = self._index.pop(username, None)
+        self._totals.pop(username, None)
+        self._searches.pop(username, None)
+        if not index:
+            return
+
+        kept = [offset for offset in index.offsets if offset >= upto]
+        self._dead += len(index) - len(kept)
+        if not kept:
+            return
+
+        with open(self.path, "rb") as file:
+            for offset in kept:
+                self._add_row(parse_record(self._read_record(file, offset)),
+                              offset)
+
+    # Returns the running totals of a user
+    def totals(self, username):
+        with self._lock:
+            self.refresh()
+            totals = self._totals.get(username) or UserTotals()
+            archived = self.archive.totals(username) if self.archive else None
+            return totals.combined(archived) if archived else totals
+
+    # Returns the number of a user's archived rows, optionally only in
+    # segments overlapping a range of stamps
+    def _archived_count(self, username, start=None, end=None):
+        if self.archive is None:
+            return 0
+        return self.archive.count(username, start, end)
+
+    # Puts a user's archived rows passing a check before rows from the file
+    def _with_archived(self, username, rows, keep=None):
+        if self.archive is None:
+            return rows
+        archived = self.archive.rows(username)
+        if keep is not None:
+            archived = filter(keep, archived)
+        return chain(archived, rows)
+
+    # Returns a columnar copy of a user's expenses, extended with new rows only
+    def columns(self, username):
+        with self._lock:
+            self.refresh()
+            index = self._index.get(username)
+            if not index and not self._archived_count(username):
+                self._columns.pop(username, None)
+                return ExpenseColumns()
+
+            version = self.archive.version if self.archive else None
+            cached = self._columns.get(username)
+            # A new index object means rows were dropped, and a new archive
+            # version that rows were archived, so start again
+            if (cached is None or cached[0] is not index
+                    or cached[3] != version):
+                columns = ExpenseColumns()
+                if self.archive is not None:
+                    columns.extend(self.archive.rows(username))
+                cached = self._columns[username] = [index, columns, 0, version]
+
+            if index and cached[2] < len(index):
+                with open(self.path, "rb") as file:
+                    cached[1].extend(
+                        parse_record(self._read_record(file, offset))
+                        for offset in index.offsets[cached[2]:])
+                cached[2] = len(index)
+            return cached[1]
+
+    # Returns the search index of a user's expenses, extended with new rows only
+    def _search_index(self, username, index):
+        cached = self._searches.get(username)
+        # A new index object means rows were dropped, so start again
+        if cached is None or cached[0] is not index:
+            cached = self._searches[username] = [index, SearchIndex()]
+
+        search_index = cached[1]
+        if len(search_index) < len(index):
+            with open(self.path, "rb") as file:
+                for offset in index.offsets[len(search_index):]:
+                    row = parse_record(self._read_record(file, offset))
+                    row += [""] * (4 - len(row))
+                    search_index.add(offset, row[2], row[3])
+        return search_index
+
+    # Rebuilds every user's totals from the raw rows and reports any drift
+    def check_totals(self):
+        with self._lock:
+            self.refresh()
+            rebuilt = {}
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as file:
+                    for offset, raw in iter_records(file):
+                        row = parse_record(raw)
+                        if not row or not row[0] or is_format_header(row):
+                            continue
+                        if offset >= self._tombstones.get(row[0], -1):
+                            rebuilt.setdefault(row[0], UserTotals()).add(row)
+
+            drift = []
+            for username in sorted(set(rebuilt) | set(self._totals)):
+                expected = rebuilt.get(username) or UserTotals()
+                actual = self._totals.get(username) or UserTotals()
+                for difference in actual.differences(expected):
+                    drift.append(f"{username}: {difference}")
+
+        for message in drift:
+            logging.warning(f"Expense totals drift for {message}")
+        return drift
+
+    # Returns the total of every user's expenses, {username: pence}
+    def all_totals(self, workers=None):
+        """
+        Archived totals come from the segment headers. Once the file is
+        indexed its running totals are used. Otherwise the file is read
+        once, in blocks of whole records that `workers` processes
+        (TOTALS_WORKERS by default) parse and sum, and their sums are
+        merged per user. Only a few blocks are waiting at a time, so memory
+        use doesn't grow with the file. Rows appended while the file is read
+        are left for the next call.
+        """
+        totals = self._file_totals(workers)
+        if self.archive is not None:
+            merge_totals(totals, (self.archive.all_totals(), 0))
+        return totals
+
+    # Returns the total of every user's rows in the file, {username: pence}
+    def _file_totals(self, workers):
+        with self._lock:
+            try:
+                file = open(self.path, "rb")
+            except FileNotFoundError:
+                return {}
+            first = next(iter_records(file), (0, b""))[1]
+            size = os.fstat(file.fileno()).st_size
+            header = is_format_header(parse_record(first)) if first else False
+            if self._inode is not None or size and not header:
+                # Older files are migrated to pence by indexing them
+                file.close()
+                self.refresh()
+                return {
+                    username: totals.total
+                    for username, totals in self._totals.items()
+                }
+            tombstones = self._journal_tombstones()
+
+        workers = TOTALS_WORKERS if workers is None else workers
+        totals = {}
+        invalid = 0
+        with timed("expenses.all_totals"), file:
+            blocks = read_blocks(file, len(first), size, TOTALS_BLOCK_BYTES)
+            if workers <= 1 or size <= TOTALS_BLOCK_BYTES:
+                for offset, data in blocks:
+                    invalid += merge_totals(
+                        totals, block_totals(data, offset, tombstones))
+            else:
+                with ProcessPoolExecutor(workers) as executor:
+                    running = set()
+                    for offset, data in blocks:
+                        if len(running) >= workers * 2:
+                            done, running = wait(running,
+                                                 return_when=FIRST_COMPLETED)
+                            for future in done:
+                                invalid += merge_totals(
+                                    totals, future.result())
+                        running.add(
+                            executor.submit(block_totals, data, offset,
+                                            tombstones))
+                    for future in as_completed(running):
+                        invalid += merge_totals(totals, future.result())
+
+        if invalid:
+            logging.warning(
+                f"Skipped {invalid} rows with invalid amount formats")
+        return totals
+
+    # Returns the names of all users that have at least one row
+    def users(self):
+        with self._lock:
+            self.refresh()
+            if self.archive is None:
+                return list(self._index)
+            return list(dict.fromkeys(chain(self.archive.users(),
+                                            self._index)))
+
+    # Returns a value that changes whenever rows are added, hidden or compacted
+    @property
+    def generation(self):
+        with self._lock:
+            self.refresh()
+            return (self._inode, self._size, self._mtime, self.journal.version,
+                    self.archive.version if self.archive else None)
+
+    # Returns how many hidden rows compaction would remove from the file
+    @property
+    def dead_rows(self):
+        with self._lock:
+            self.refresh()
+            return self._dead
+
+    # Yields the parsed rows of a single user, archived rows first and then
+    # in the order they were written
+    def rows(self, username):
+        return self._with_archived(
+            username, self._read_rows(username, lambda index: index.offsets))
+
+    # Yields a user's rows dated between two datetimes (inclusive), oldest first
+    def rows_between(self, username, start, end):
+        start = to_timestamp(start)
+        end = to_timestamp(end)
+        rows = self._read_rows(username,
+                               lambda index: index.between(start, end))
+        if self.archive is None:
+            return rows
+        # Rows added later can be dated inside an archived period
+        return heapq.merge(self.archive.rows(username, start, end),
+                           rows,
+                           key=lambda row: parse_timestamp(row[1]))
+
+    # Yields a user's rows whose date could not be parsed
+    def undated_rows(self, username):
+        return self._read_rows(username, lambda index: index.undated_offsets)
+
+    # Yields a user's rows in a category, ignoring case, in file order
+    def rows_in_category(self, username, category):
+        key = category.strip().lower()
+        return self._with_archived(
+            username,
+            self._read_rows(username,
+                            lambda index: index.by_category.get(key, ())),
+            lambda row: row[2].strip().lower() == key)
+
+    # Yields a user's rows of an expense type, in file order
+    def rows_of_type(self, username, expense_type):
+        key = expense_type.strip().capitalize()
+        return self._with_archived(
+            username,
+            self._read_rows(username, lambda index: index.by_type.get(key,
+                                                                      ())),
+            lambda row: row[5].strip().capitalize() == key)
+
+    # Returns how many rows each access path open to a query would read
+    def path_sizes(self, username, query):
+        if self._inode is None and not self._open_snapshot():
+            scanned = self._scan_user(username)
+            if scanned is not None:
+                # Reading any path scans the file for the user's rows again
+                # (see _scan_rows), except the search path, whose index is
+                # only kept for an indexed file
+                return self._path_sizes(username, query, scanned[0], None)
+        with self._lock:
+            self.refresh()
+            index = self._index.get(username)
+            searched = (len(
+                self._search_index(username, index).search(query.search))
+                        if index and query.search is not None else 0)
+            return self._path_sizes(username, query, index, searched)
+
+    # Counts the rows each open access path would read through a user's
+    # index, and through the search index if searched (its size) isn't None
+    def _path_sizes(self, username, query, index, searched):
+        # Archived rows are decompressed and checked on every path, except
+        # segments outside a date range
+        archived = self._archived_count(username)
+        if not index and not archived:
+            return {
+                path: 0
+                for path in query.paths()
+                if path != "search" or searched is not None
+            }
+
+        index = index or UserIndex()
+        sizes = {"all": len(index) + archived}
+        if query.dated:
+            start, end = query.date_range()
+            start = to_timestamp(start)
+            end = to_timestamp(end)
+            sizes["date"] = (index.count_between(start, end) +
+                             self._archived_count(username, start, end))
+        if query.category is not None:
+            sizes["category"] = len(
+                index.by_category.get(query.category_key, ())) + archived
+        if query.expense_type is not None:
+            sizes["type"] = len(index.by_type.get(query.type_key,
+                                                  ())) + archived
+        if query.search is not None and searched is not None:
+            sizes["search"] = searched + archived
+        return sizes
+
+    # Yields a user's rows matching every word of a search, oldest first
+    def search(self, username, text):
+        with self._lock:
+            # The search index is kept, so index the file rather than scan it
+            self.refresh()
+        terms = tokenize(text)
+        return self._with_archived(
+            username,
+            self._read_rows(
+                username, lambda index: self._search_index(username, index).
+                search(text)),
+            lambda row: matches_search(terms, row[2], row[3]))
+
+    # Yields the rows at the offsets chosen from a user's index
+    def _read_rows(self, username, select):
+        if self._inode is None and not self._open_snapshot():
+            # Nothing has needed every user's rows yet, so don't index them
+            yield from self._scan_rows(username, select)
+            return
+
+        with self._lock:
+            self.refresh()
+            index = self._index.get(username)
+            if not index:
+                return
+            # Holding the open file keeps this snapshot valid across compaction
+            offsets = array("q", select(index))
+            file = open(self.path, "rb")
+
+        read = bytes_read = 0
+        with file:
+            try:
+                for offset in offsets:
+                    raw = self._read_record(file, offset)
+                    read += 1
+                    bytes_read += len(raw)
+                    yield parse_record(raw)
+            finally:
+                count_rows("expenses.read", read, read, bytes_read)
+
+    # Loads a valid snapshot of the index if nothing has been indexed yet,
+    # returning whether there is an index to read through
+    def _open_snapshot(self):
+        with self._lock:
+            return self._inode is not None or self._load_snapshot()
+
+    # Yields rows chosen from an index of one user built by scanning the file
+    def _scan_rows(self, username, select):
+        """
+        One-off commands usually read a single user's expenses, which the
+        memory-mapped scan finds without decoding anyone else's rows. Files
+        still in pounds go through refresh() so they are migrated first.
+        """
+        scanned = self._scan_user(username)
+        if scanned is None:
+            with self._lock:
+                self.refresh()
+            yield from self._read_rows(username, select)
+            return
+
+        index, rows = scanned
+        for offset in select(index):
+            yield list(rows[offset])
+
+    # Scans the file for one user's rows, returning an index of them and the
+    # rows by offset, or None if the file is still in pounds
+    def _scan_user(self, username):
+        """
+        The last scan is kept until the file or the journal changes, so
+        planning a query and then reading it only scans once.
+        """
+        with self._lock:
+            try:
+                file = open(self.path, "rb")
+            except FileNotFoundError:
+                return UserIndex(), {}
+            stat = os.fstat(file.fileno())
+            size = stat.st_size
+            if size and not self._has_format_header():
+                file.close()
+                return None
+            key = (username, stat.st_ino, size, stat.st_mtime_ns,
+                   self.journal.version)
+            if self._scanned is not None and self._scanned[0] == key:
+                file.close()
+                return self._scanned[1:]
+            tombstone = self._journal_tombstones().get(username, -1)
+
+        index = UserIndex()
+        rows = {}
+        scanned = 0
+        with file:
+            field = username.replace('"', '""').encode("utf-8")
+            for offset, raw in find_records(file, field, size):
+                scanned += 1
+                row = parse_record(raw)
+                if (offset < tombstone or not row or row[0] != username
+                        or offset == 0 and is_format_header(row)):
+                    continue
+                index.add(offset, row)
+                rows[offset] = row
+        count_rows("expenses.scan", scanned, len(rows), size)
+
+        with self._lock:
+            self._scanned = (key, index, rows)
+        return index, rows
+
+    # Reads the raw record starting at the given offset
+    @staticmethod
+    def _read_record(file, offset):
+        file.seek(offset)
+        raw = file.readline()
+        while raw.count(b'"') % 2:
+            line = file.readline()
+            if not line:
+                break
+            raw += line
+        return raw
+
+    # Starts a new file with the format header, returning where rows start
+    def _write_header(self, file):
+        header = version_header(FORMAT_HEADER[1])
+        self._identity = header[2]
+        return file.write(format_record(header))
+
+    # Appends many rows through one buffered handle with a single fsync
+    def append_many(self, rows):
+        with self._lock:
+            self.refresh()
+            written = []
+            with open(self.path, "ab") as file:
+                offset = file.seek(0, os.SEEK_END)
+                if offset == 0:
+                    offset = self._write_header(file)
+                for row in rows:
+                    record = format_record(row)
+                    file.write(record)
+                    written.append((row, offset))
+                    offset += len(record)
+                file.flush()
+                os.fsync(file.fileno())
+                stat = os.fstat(file.fileno())
+
+            if self._inode is None:
+                self._inode = stat.st_ino
+            for row, offset in written:
+                self._add_row([str(field) for field in row], offset)
+            self._size = stat.st_size
+            self._mtime = stat.st_mtime_ns
+            return len(written)
+
+    # Hides every row of a user by journaling a tombstone at the end of the file
+    def reset_user(self, username):
+        with self._lock:
+            self.refresh()
+            if self.archive is not None:
+                self.archive.remove_user(username)
+            if username not in self._index:
+                return
+            self.journal.append(RESET_EXPENSES, self.path, username,
+                                self._size)
+            self._apply_journal()
+
+    # Rewrites the file without hidden rows, replacing it atomically
+    def compact(self):
+        with self._lock:
+            self.refresh()
+            if not self._dead:
+                return
+
+            temp_path = os.path.join(
+                os.path.dirname(os.path.abspath(self.path)),
+                f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+            with open(self.path, "rb") as source, open(temp_path,
+                                                       "wb") as target:
+                # The header gets a new version id, so no journal record
+                # written against the old file applies to the new one
+                target.write(format_record(version_header(FORMAT_HEADER[1])))
+                for offset, raw in iter_records(source):
+                    row = parse_record(raw)
+                    if (offset == 0 and is_format_header(row) or row
+                            and offset < self._tombstones.get(row[0], -1)):
+                        continue
+                    target.write(raw)
+                target.flush()
+                os.fsync(target.fileno())
+
+            os.replace(temp_path, self.path)
+            self.journal.prune()
+            self.refresh()
+            self.save_snapshot(force=True)
+
+    # Moves rows dated before a cutoff into the archive, returning how many
+    def archive_before(self, cutoff, period="month", compression="gzip"):
+        """
+        Rows are grouped into one segment per period (month or year) and
+        merged with the rows of that period archived before. Rows without a
+        valid date stay in the file, and rows hidden by tombstones are
+        dropped as compaction would. The old rows are spilled to one
+        temporary file per period while the file is read, so only one
+        period is held in memory at a time.
+        """
+        if self.archive is None:
+            raise ValueError("No archive directory is set up")
+        if period not in PERIODS:
+            raise ValueError(f"Unknown archive period: {period}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        limit = to_timestamp(cutoff)
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        with self._lock:
+            self.refresh()
+            if self._inode is None:
+                return 0
+
+            moved = 0
+            spills = {}
+            temp_path = os.path.join(
+                directory, f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+            with tempfile.TemporaryDirectory(dir=directory) as spill:
+                try:
+                    with open(self.path,
+                              "rb") as source, open(temp_path, "wb") as target:
+                        target.write(
+                            format_record(version_header(FORMAT_HEADER[1])))
+                        for offset, raw in iter_records(source):
+                            row = parse_record(raw)
+                            if (offset == 0 and is_format_header(row)
+                                    or row and offset < self._tombstones.get(
+                                        row[0], -1)):
+                                continue
+                            stamp = (parse_timestamp(row[1])
+                                     if len(row) >= 6 and row[0] else None)
+                            if stamp is None or stamp >= limit:
+                                target.write(raw)
+                                continue
+                            key = period_of(row[1], period)
+                            if key not in spills:
+                                spills[key] = open(
+                                    os.path.join(spill, f"{key}.csv"), "wb")
+                            spills[key].write(raw)
+                            moved += 1
+                        target.flush()
+                        os.fsync(target.fileno())
+                finally:
+                    for file in spills.values():
+                        file.close()
+
+                if not moved:
+                    os.remove(temp_path)
+                    return 0
+
+                def spilled(key):
+                    with open(os.path.join(spill, f"{key}.csv"), "rb") as file:
+                        return [
+                            parse_record(raw) for _, raw in iter_records(file)
+                        ]
+
+                self.archive.stage(((key, spilled(key))
+                                    for key in sorted(spills)), compression,
+                                   file_identity(self.path))
+            os.replace(temp_path, self.path)
+            self.archive.commit()
+            self.journal.prune()
+            self.refresh()
+            self.save_snapshot(force=True)
+
+        logging.info(f"{moved} expenses dated before {cutoff:%Y-%m-%d} "
+                     f"archived from {self.path}")
+        return moved
@@ -0,0 +1,159 @@
+# Imported modules
+import os
+import tempfile
+import weakref
+from array import array
+
+from columnar import NO_DATE
+from expense_store import format_record, iter_records, parse_record
+from records import ExpenseRecord
+from timestamps import EPOCH, SECOND, parse_timestamp
+
+GUEST_MEMORY_LIMIT = 1 << 20
+
+
+# Deletes a spill file, ignoring one that is already gone
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class GuestStore:
+    """
+    Compact storage for the expenses of a guest session.
+
+    Expenses are kept in columns: timestamps and amounts in typed arrays,
+    categories and types as small codes into a list of names, and all the
+    descriptions in one byte buffer. That is a few dozen bytes per expense
+    instead of a dict of strings. Once the columns grow past memory_limit
+    bytes they are moved to a temporary file, and iterating reads the file
+    first and then whatever is still in memory, so callers never see the
+    difference. The running total is kept so budget summaries don't iterate.
+    """
+
+    def __init__(self, username="Guest", memory_limit=GUEST_MEMORY_LIMIT):
+        self.username = username
+        self.memory_limit = memory_limit
+        self.total = 0
+        self.spilled = 0
+        self._spill_path = None
+        self._finalizer = None
+        self._categories = []
+        self._types = []
+        self._category_lookup = {}
+        self._type_lookup = {}
+        self._reset_columns()
+
+    # Empties the in-memory columns, keeping the category and type names
+    def _reset_columns(self):
+        self._stamps = array("q")
+        self._amounts = array("q")
+        self._category_codes = array("I")
+        self._type_codes = array("B")
+        self._descriptions = bytearray()
+        self._description_ends = array("q")
+        # Dates that aren't in the usual format are kept as text
+        self._odd_dates = {}
+
+    def __len__(self):
+        return self.spilled + len(self._amounts)
+
+    # Returns roughly how many bytes the in-memory columns use
+    @property
+    def memory_used(self):
+        columns = (self._stamps, self._amounts, self._category_codes,
+                   self._type_codes, self._description_ends)
+        return (sum(column.itemsize * len(column)
+                    for column in columns) + len(self._descriptions))
+
+    # Returns the code of a name, adding it to the names if it is new
+    @staticmethod
+    def _encode(name, lookup, names):
+        code = lookup.get(name)
+        if code is None:
+            code = lookup[name] = len(names)
+            names.append(name)
+        return code
+
+    # Adds an expense record
+    def append(self, expense):
+        stamp = parse_timestamp(expense.date)
+        if stamp is None:
+            self._odd_dates[len(self._amounts)] = expense.date
+            stamp = NO_DATE
+
+        self._stamps.append(stamp)
+        self._amounts.append(int(expense.amount))
+        self._category_codes.append(
+            self._encode(expense.category, self._category_lookup,
+                         self._categories))
+        self._type_codes.append(
+            self._encode(expense.expense_type, self._type_lookup, self._types))
+        self._descriptions += expense.description.encode("utf-8")
+        self._description_ends.append(len(self._descriptions))
+        self.total += int(expense.amount)
+
+        if self.memory_used > self.memory_limit:
+            self._spill()
+
+    # Moves the in-memory expenses to the end of the spill file
+    def _spill(self):
+        if self._spill_path is None:
+            handle, self._spill_path = tempfile.mkstemp(prefix="guest-",
+                                                        suffix=".csv")
+            os.close(handle)
+            self._finalizer = weakref.finalize(self, remove_file,
+                                               self._spill_path)
+
+        with open(self._spill_path, "ab") as file:
+            for expense in self._memory_records():
+                file.write(
+                    format_record([
+                        expense.date, expense.category, expense.description,
+                        expense.amount, expense.expense_type
+                    ]))
+        self.spilled += len(self._amounts)
+        self._reset_columns()
+
+    # Forgets every expense and deletes the spill file
+    def clear(self):
+        if self._finalizer is not None:
+            self._finalizer()
+        self._spill_path = None
+        self._finalizer = None
+        self.total = 0
+        self.spilled = 0
+        self._reset_columns()
+
+    # Yields every expense as a record, oldest first
+    def __iter__(self):
+        if self._spill_path is not None:
+            with open(self._spill_path, "rb") as file:
+                for _, raw in iter_records(file):
+                    row = parse_record(raw)
+                    yield ExpenseRecord(self.username, row[0], row[1], row[2],
+                                        int(row[3]), row[4])
+        yield from self._memory_records()
+
+    # Yields the expenses still held in memory
+    def _memory_records(self):
+        username = self.username
+        categories = self._categories
+        types = self._types
+        descriptions = self._descriptions
+        start = 0
+        columns = zip(self._stamps, self._amounts, self._category_codes,
+                      self._type_codes, self._description_ends)
+        for position, (stamp, amount, category_code, type_code,
+                       end) in enumerate(columns):
+            if stamp == NO_DATE:
+                date = self._odd_dates[position]
+                stamp = None
+            else:
+                date = (EPOCH + stamp * SECOND).isoformat(" ")
+            yield ExpenseRecord(username, date, categories[category_code],
+                                descriptions[start:end].decode("utf-8"),
+                                amount, types[type_code], stamp)
+            start = end
@@ -0,0 +1,75 @@
+# Imported modules
+import csv
+import re
+from datetime import datetime
+
+from money import parse_pence
+
+OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+# Reads expenses from a csv file with date, category, description, amount, type columns
+def read_csv_expenses(path):
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        for line_number, row in enumerate(csv.reader(file), start=1):
+            if not row:
+                continue
+            if line_number == 1 and row[0].strip().lower() == "date":
+                continue
+            yield tuple(row)
+
+
+# Converts an OFX date such as 20240131 or 20240131093000.000[0:GMT] to the app's format
+def parse_ofx_date(value):
+    digits = re.match(r"\d*", value).group()
+    try:
+        if len(digits) >= 14:
+            moment = datetime.strptime(digits[:14], "%Y%m%d%H%M%S")
+        else:
+            moment = datetime.strptime(digits[:8], "%Y%m%d")
+    except ValueError:
+        return value
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Reads debit transactions from an OFX/QFX bank statement as expenses
+def read_ofx_expenses(path, category="Imported", expense_type="Essential"):
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        text = file.read()
+
+    for block in re.split(r"<STMTTRN>", text, flags=re.IGNORECASE)[1:]:
+        block = re.split(r"</STMTTRN>", block, flags=re.IGNORECASE)[0]
+        fields = {
+            tag.upper(): value.strip()
+            for tag, value in OFX_FIELD.findall(block)
+        }
+
+        amount = fields.get("TRNAMT", "")
+        try:
+            debit = parse_pence(amount) < 0
+        except ValueError:
+            # Left for the import's validation to report
+            debit = True
+            amount = ""
+        # Credits are income, only money going out is an expense
+        if not debit:
+            continue
+
+        date = parse_ofx_date(fields.get("DTPOSTED", ""))
+        description = fields.get("NAME") or fields.get("MEMO", "")
+        # The amount stays text, so it is parsed to exact pence like any other
+        yield (date, category, description, amount.replace("-", "",
+                                                           1), expense_type)
+
+
+# Picks the reader for a statement file, by default from its extension
+def read_expenses(path,
+                  file_format=None,
+                  category="Imported",
+                  expense_type="Essential"):
+    if file_format is None:
+        file_format = "ofx" if path.lower().endswith((".ofx",
+                                                      ".qfx")) else "csv"
+    if file_format == "ofx":
+        return read_ofx_expenses(path, category, expense_type)
+    return read_csv_expenses(path)
@@ -0,0 +1,205 @@
+# Imported modules
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentation is off unless FINANCE_METRICS is set, e.g. FINANCE_METRICS=1
+enabled = os.environ.get("FINANCE_METRICS", "") not in ("", "0")
+SUMMARY_INTERVAL = float(os.environ.get("FINANCE_METRICS_INTERVAL", "60"))
+
+# Latency buckets double from 1 microsecond; the last one catches the rest
+BUCKETS = 32
+
+
+class Histogram:
+    """
+    Latencies of one operation in power-of-two microsecond buckets.
+    """
+
+    __slots__ = ("count", "total", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * BUCKETS
+
+    # Adds one latency in seconds
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        micros = int(seconds * 1000000)
+        self.buckets[min(micros.bit_length(), BUCKETS - 1)] += 1
+
+    # Returns the upper bound in milliseconds of the bucket holding a percentile
+    def percentile(self, fraction):
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target and count:
+                return (1 << bucket) / 1000
+        return self.maximum * 1000
+
+    # Returns the histogram as a dictionary for the log
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.maximum * 1000, 3)
+        }
+
+
+class Metrics:
+    """
+    Latency histograms and row and byte counters, summarised to app.log.
+
+    Every SUMMARY_INTERVAL seconds, on the next recorded event, the figures
+    gathered since the last summary are logged as a single JSON object and
+    started again, so each line in the log covers one interval.
+    """
+
+    def __init__(self, interval=SUMMARY_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    # Starts a new interval
+    def _reset(self):
+        self._histograms = {}
+        self._rows = {}
+        self._started = time.time()
+
+    # Records how long one operation took
+    def record_time(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(seconds)
+        self.log_if_due()
+
+    # Records the rows an operation looked at and returned, and the bytes it read
+    def record_rows(self, name, scanned=0, returned=0, bytes_read=0):
+        with self._lock:
+            counts = self._rows.get(name)
+            if counts is None:
+                counts = self._rows[name] = {
+                    "scanned": 0,
+                    "returned": 0,
+                    "bytes_read": 0
+                }
+            counts["scanned"] += scanned
+            counts["returned"] += returned
+            counts["bytes_read"] += bytes_read
+
+    # Returns everything recorded in the current interval
+    def summary(self):
+        with self._lock:
+            return {
+                "event": "metrics",
+                "interval_start": round(self._started, 3),
+                "interval_seconds": round(time.time() - self._started, 3),
+                "latency": {
+                    name: histogram.summary()
+                    for name, histogram in sorted(self._histograms.items())
+                },
+                "rows": {
+                    name: dict(counts)
+                    for name, counts in sorted(self._rows.items())
+                }
+            }
+
+    # Logs the current interval as a JSON line and starts a new one
+    def log_summary(self, reason="interval"):
+        summary = self.summary()
+        summary["reason"] = reason
+        with self._lock:
+            self._reset()
+        if summary["latency"] or summary["rows"]:
+            logging.info(json.dumps(summary))
+
+    # Logs a summary if the interval has passed
+    def log_if_due(self):
+        if time.time() - self._started >= self.interval:
+            self.log_summary()
+
+
+metrics = Metrics()
+
+
+# Times the code in a with block under the given name, if enabled
+@contextmanager
+def timed(name):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record_time(name, time.perf_counter() - start)
+
+
+# Records rows scanned and returned and bytes read, if enabled
+def count_rows(name, scanned=0, returned=0, bytes_read=0):
+    if enabled:
+        metrics.record_rows(name, scanned, returned, bytes_read)
+
+
+# Wraps an iterator to time only the work of producing its rows, if enabled
+def timed_rows(name, rows):
+    """
+    Reports are read a page at a time while the user looks at them, so timing
+    the whole loop would count the time spent reading the screen.
+    """
+    if not enabled:
+        return rows
+    return _timed_rows(name, rows)
+
+
+def _timed_rows(name, rows):
+    spent = 0.0
+    iterator = iter(rows)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                spent += time.perf_counter() - start
+            yield row
+    finally:
+        metrics.record_time(name, spent)
+
+
+# Starts profiling the session if FINANCE_PROFILE is set, returning the profiler
+def start_profiling():
+    if not os.environ.get("FINANCE_PROFILE"):
+        return None
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+# Stops a session profiler and writes its statistics for pstats or snakeviz
+def stop_profiling(profiler):
+    if profiler is None:
+        return
+    profiler.disable()
+    path = os.environ.get("FINANCE_PROFILE")
+    if path == "1":
+        path = f"session-{os.getpid()}-{int(time.time())}.prof"
+    profiler.dump_stats(path)
+    logging.info(f"Session profile written to {path}")
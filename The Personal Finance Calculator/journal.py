@@ -0,0 +1,168 @@
+# Imported modules
+import csv
+import io
+import os
+import uuid
+
+from locking import FileLock
+
+DELETE_PROFILE = "delete_profile"
+UPDATE_INCOME = "update_income"
+RESET_EXPENSES = "reset_expenses"
+
+# First field of the header row of a data file, followed by its format and
+# the id of the file's version
+HEADER_MARK = "#format"
+
+
+# Returns the header row starting a new version of a data file
+def version_header(file_format):
+    return [HEADER_MARK, file_format, uuid.uuid4().hex]
+
+
+# Returns a string identifying the current version of a file
+def file_identity(path):
+    """
+    That is the version id in the file's header row. Every rewrite gets a
+    new one, unlike the inode, which the filesystem may hand back to the
+    next file replacing it. Files written before headers carried an id are
+    identified by their inode until they are next rewritten.
+    """
+    try:
+        with open(path, "rb") as file:
+            first = file.readline(256)
+            inode = os.fstat(file.fileno()).st_ino
+    except FileNotFoundError:
+        return ""
+    fields = first.decode("utf-8", "replace").rstrip("\r\n").split(",")
+    if fields[0] == HEADER_MARK and len(fields) >= 3 and fields[2]:
+        return fields[2]
+    return str(inode)
+
+
+# Writes rows to a temporary file and atomically moves it over the target
+def replace_file(path, rows):
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(directory,
+                             f".{os.path.basename(path)}.{os.getpid()}.tmp")
+
+    with open(temp_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for row in rows:
+            writer.writerow(row)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, path)
+
+
+class Journal:
+    """
+    Append-only log of changes made to the csv data files.
+
+    Deleting a profile, resetting a user's expenses or changing an income is
+    recorded here as a single appended row instead of rewriting user_list.csv
+    or expenses.csv. Each record names the file it applies to and that file's
+    version id at the time, so once compaction has atomically replaced a file
+    the records written against its old version stop applying, even if it
+    crashes before pruning them.
+
+    The lock is shared by every store using the journal and also locks out
+    other processes, so writes and compaction never interleave across them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(f"{path}.lock")
+        self._records = []
+        self._size = 0
+        self._inode = None
+
+    # Reads any records appended since the last call, returning only the new ones
+    def refresh(self):
+        with self.lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._records = []
+                self._size = 0
+                self._inode = None
+                return []
+
+            if stat.st_ino != self._inode or stat.st_size < self._size:
+                self._records = []
+                self._size = 0
+                self._inode = stat.st_ino
+
+            if stat.st_size == self._size:
+                return []
+
+            with open(self.path, "rb") as file:
+                file.seek(self._size)
+                data = file.read()
+
+            # Leave a half-written last record for the next refresh
+            data = data[:data.rfind(b"\n") + 1]
+            self._size += len(data)
+            text = io.StringIO(data.decode("utf-8"), newline="")
+            new_records = [row for row in csv.reader(text) if len(row) == 5]
+
+            self._records.extend(new_records)
+            return new_records
+
+    # Returns a value that changes whenever records are added or pruned
+    @property
+    def version(self):
+        with self.lock:
+            self.refresh()
+            return self._inode, self._size
+
+    # Returns every record that still applies to the current version of a file
+    def records_for(self, target):
+        with self.lock:
+            self.refresh()
+            identity = file_identity(target)
+            return [
+                record for record in self._records
+                if record[1] == target and record[2] == identity
+            ]
+
+    # Appends a single record and makes sure it reaches the disk
+    def append(self, operation, target, username, value=""):
+        with self.lock:
+            self.refresh()
+            record = [
+                operation, target,
+                file_identity(target), username,
+                str(value)
+            ]
+
+            with open(self.path, "a", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerow(record)
+                file.flush()
+                os.fsync(file.fileno())
+
+            self.refresh()
+            return record
+
+    # Returns the number of records currently in the journal
+    def __len__(self):
+        with self.lock:
+            self.refresh()
+            return len(self._records)
+
+    # Drops records whose target file has been replaced since they were written
+    def prune(self):
+        with self.lock:
+            self.refresh()
+            identities = {}
+            live = []
+            for record in self._records:
+                if record[1] not in identities:
+                    identities[record[1]] = file_identity(record[1])
+                if record[2] == identities[record[1]]:
+                    live.append(record)
+
+            if len(live) != len(self._records):
+                replace_file(self.path, live)
+                self.refresh()
@@ -0,0 +1,78 @@
+# Imported modules
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    A re-entrant lock shared by threads and by other processes.
+
+    Threads of this process queue on an RLock, and the outermost holder also
+    takes an exclusive lock on a small lock file, so separate processes using
+    the same data directory take turns as well.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(self.path, "a+b")
+                self._lock_file()
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock_file()
+            finally:
+                self._file.close()
+                self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    # Blocks until this process holds the lock file
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+
+        # msvcrt gives up after ten seconds, so keep waiting
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    # Lets other processes take the lock file
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -1,26 +1,53 @@
 # Imported modules
-import hashlib
-import os
-import logging
+import argparse
 import csv
-from datetime import datetime
-from tabulate import tabulate
-
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s %(levelname)s %(message)s',
-                    filename='app.log')
+import json
+import logging
+import sys
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+from app_logging import start_logging
+from batch_summary import feedback_bucket, write_summaries
+from columnar import ExpenseColumns, month_label
+from expense_query import (SORT_KEYS, ExpenseQuery, QueryPlan, execute,
+                           parse_limit, run_query)
+from guest_store import GuestStore
+from importer import read_expenses
+from instrumentation import (metrics, start_profiling, stop_profiling, timed,
+                             timed_rows)
+from money import format_money, format_pounds, parse_pence
+from paging import PAGE_SIZE, PagedReport
+from report_cache import ReportCache
+from records import (ExpenseRecord, build_expense_row, decode_rows,
+                     hash_password, parse_expense_type)
+from search_index import matches_search, tokenize
+from storage import CsvBackend, open_backend
+from timestamps import to_timestamp
+
+# Log records are written to app.log by a background thread
+start_logging("app.log")
 
 income = 0
-guest_expenses = []
+guest_expenses = GuestStore()
 logged_in = False
 profile = {}
 PROFILE_FILE = "user_list.csv"
 EXPENSES_FILE = "expenses.csv"
-
-
-# Hashes a password using SHA-256 for secure storage
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+JOURNAL_FILE = "journal.csv"
+DATABASE_FILE = "finance.db"
+ARCHIVE_DIRECTORY = "archive"
+storage = open_backend(PROFILE_FILE, EXPENSES_FILE, JOURNAL_FILE,
+                       DATABASE_FILE, ARCHIVE_DIRECTORY)
+compaction_running = threading.Lock()
+report_cache = ReportCache()
+
+# States of an interactive session
+SETUP = "setup"
+LOGIN = "login"
+CREATE_PROFILE = "create_profile"
+MAIN_MENU = "main_menu"
+EXIT = None
 
 
 # Creates a new user profile and saves it to the user list
@@ -32,36 +59,32 @@ def create_profile():
 
     if check_if_user_exists(name):
         print("Username already exists. Try again.")
-        setup()
-        return
+        return SETUP
 
     hashed_password = hash_password(password)
     initial_income = 0
 
+    try:
+        # Another process may have taken the name since the check above
+        storage.add_profile([name, hashed_password, initial_income])
+    except ValueError:
+        print("Username already exists. Try again.")
+        return SETUP
+
     profile = {
         "name": name,
         "password": hashed_password,
         "income": initial_income
     }
 
-    with open(PROFILE_FILE, "a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([name, hashed_password, initial_income])
-
     logged_in = True
     print(f"{name}, your profile is created!")
-    main_menu()
+    return MAIN_MENU
 
 
 # Checks if a user with the specified username already exists
 def check_if_user_exists(username):
-    if os.path.exists(PROFILE_FILE):
-        with open(PROFILE_FILE, "r") as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row[0] == username:
-                    return True
-    return False
+    return storage.get_profile(username) is not None
 
 
 # Displays the initial setup menu and handles user choice
@@ -75,18 +98,18 @@ def setup():
         choice = int(input("Choose an option:\n"))
 
         if choice == 1:
-            load_profile()
+            return LOGIN
         elif choice == 2:
-            create_profile()
+            return CREATE_PROFILE
         elif choice == 3:
-            main_menu()
+            return MAIN_MENU
         else:
 
             raise ValueError("Invalid choice.")
     except ValueError as e:
         logging.warning(f"Setup error: {e}")
         print("Please enter a valid option.")
-        setup()
+        return SETUP
 
 
 # Loads an existing user profile by verifying username and password
@@ -96,54 +119,36 @@ def load_profile():
     name = input("Enter your name:\n")
     password = input("Enter your password:\n")
 
-    hashed_password = hash_password(password)
+    with timed("login"):
+        hashed_password = hash_password(password)
+        row = storage.get_profile(name)
+        matched = row is not None and row[1] == hashed_password
 
-    if os.path.exists(PROFILE_FILE):
-        with open(PROFILE_FILE, "r") as file:
-            reader = csv.reader(file)
-
-            for row in reader:
-                if row[0] == name and row[1] == hashed_password:
-                    profile = {
-                        "name": name,
-                        "password": hashed_password,
-                        "income": float(row[2])
-                    }
-                    income = profile["income"]
-                    logged_in = True
-
-                    print(f"Welcome back {name}!")
-                    main_menu()
-                    return
+    if matched:
+        profile = {
+            "name": name,
+            "password": hashed_password,
+            "income": parse_pence(row[2])
+        }
+        income = profile["income"]
+        logged_in = True
+
+        print(f"Welcome back {name}!")
+        return MAIN_MENU
 
     logging.warning(f"Failed login attempt for user: {name}")
     print("Login failed. Please try again.")
-    setup()
+    return SETUP
 
 
 # Deletes a user account and all associated expenses
 def delete_user(username):
     global profile, logged_in
 
-    if os.path.exists(PROFILE_FILE):
-        with open(PROFILE_FILE, "r") as file:
-            rows = list(csv.reader(file))
-
-        with open(PROFILE_FILE, "w", newline="") as file:
-            writer = csv.writer(file)
-            for row in rows:
-                if row[0] != username:
-                    writer.writerow(row)
-
-    if os.path.exists(EXPENSES_FILE):
-        with open(EXPENSES_FILE, "r") as file:
-            rows = list(csv.reader(file))
-
-        with open(EXPENSES_FILE, "w", newline="") as file:
-            writer = csv.writer(file)
-            for row in rows:
-                if row[0] != username:
-                    writer.writerow(row)
+    storage.delete_profile(username)
+    storage.reset_expenses(username)
+    report_cache.invalidate(username)
+    schedule_compaction()
 
     profile.clear()
     logged_in = False
@@ -154,64 +159,55 @@ def delete_user(username):
 
 # Resets all expenses for a given username
 def reset_expenses(username):
-    if os.path.exists(EXPENSES_FILE):
-        with open(EXPENSES_FILE, "r") as file:
-            rows = list(csv.reader(file))
-
-        with open(EXPENSES_FILE, "w", newline="") as file:
-            writer = csv.writer(file)
-            for row in rows:
-                if row[0] != username:
-                    writer.writerow(row)
-
-    main_menu()
+    storage.reset_expenses(username)
+    report_cache.invalidate(username)
+    schedule_compaction()
 
 
 # Displays the main menu and handles navigation to various features
 def main_menu():
-    while True:
+    print("\nMain Menu")
+    print("1. Enter Income")
+    print("2. Add Expense")
+    print("3. View Budget Summary")
+    print("4. Generate Expense Report")
 
-        print("\nMain Menu")
-        print("1. Enter Income")
-        print("2. Add Expense")
-        print("3. View Budget Summary")
-        print("4. Generate Expense Report")
-
-        if logged_in:
-            print("5. Delete Account")
-            print("6. Exit")
-        else:
-            print("5. Exit")
+    if logged_in:
+        print("5. Delete Account")
+        print("6. Exit")
+    else:
+        print("5. Exit")
 
-        try:
+    try:
 
-            choice = int(input("Enter your choice: ").strip())
+        choice = int(input("Enter your choice: ").strip())
 
-            if choice == 1:
-                enter_income()
-            elif choice == 2:
-                add_expense()
-            elif choice == 3:
-                view_budget()
-            elif choice == 4:
-                generate_expense_report()
-            elif choice == 5 and logged_in:
-                delete_user(profile["name"])
-                print("Goodbye!")
-                exit()
-            elif choice == 5 and not logged_in or choice == 6:
-
-                print("Goodbye!")
-                exit()
-            else:
+        if choice == 1:
+            enter_income()
+        elif choice == 2:
+            add_expense()
+        elif choice == 3:
+            return view_budget()
+        elif choice == 4:
+            generate_expense_report()
+        elif choice == 5 and logged_in:
+            delete_user(profile["name"])
+            print("Goodbye!")
+            return EXIT
+        elif choice == 5 and not logged_in or choice == 6:
+
+            print("Goodbye!")
+            return EXIT
+        else:
 
-                print("Please enter a valid option.")
+            print("Please enter a valid option.")
 
-        except ValueError:
+    except ValueError:
 
-            print(
-                "Invalid input. Please enter a number corresponding to your choice."
-            )
+        print(
+            "Invalid input. Please enter a number corresponding to your choice."
+        )
+    return MAIN_MENU
 
 
 # Allows the user to enter their monthly income
@@ -220,7 +216,7 @@ def enter_income():
 
     while True:
         try:
-            user_income = float(input("Enter your monthly income: "))
+            user_income = parse_pence(input("Enter your monthly income: "))
 
             if user_income < 0:
                 print("Please enter a positive amount\n")
@@ -235,31 +231,34 @@ def enter_income():
     if logged_in:
         profile["income"] = user_income
         update_user_profile(profile)
-        logging.info(f"Income added for {profile['name']}: {user_income}")
+        logging.info(
+            f"Income added for {profile['name']}: {format_money(user_income)}")
     else:
-        logging.info(f"Guest income entered: {user_income}")
+        logging.info(f"Guest income entered: {format_money(user_income)}")
 
-    print(f"Your current income is {income}")
+    print(f"Your current income is {format_money(income)}")
 
 
 # Updates a user's profile in the user list
 def update_user_profile(updated_profile):
     if "name" in updated_profile:
-        profiles = []
+        storage.update_income(updated_profile["name"],
+                              format_pounds(updated_profile["income"]))
+        schedule_compaction()
 
-        if os.path.exists(PROFILE_FILE):
-            with open(PROFILE_FILE, "r") as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if row[0] == updated_profile["name"]:
-                        profiles.append(
-                            [row[0], row[1], updated_profile["income"]])
-                    else:
-                        profiles.append(row)
 
-        with open(PROFILE_FILE, "w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerows(profiles)
+# Rewrites the data files without deleted or outdated rows
+def compact_data_files():
+    with compaction_running:
+        storage.compact()
+        logging.info("Data files compacted")
+
+
+# Starts compaction in the background once enough changes have built up
+def schedule_compaction():
+    if compaction_running.locked() or not storage.needs_compaction():
+        return
+    threading.Thread(target=compact_data_files, daemon=True).start()
 
 
 # Adds a new expense for the logged-in user or a guest user
@@ -269,7 +268,7 @@ def add_expense():
 
     while True:
         try:
-            amount = float(input("Enter the amount:\n"))
+            amount = parse_pence(input("Enter the amount:\n"))
             if amount < 0:
                 print("Please enter a positive amount.")
             else:
@@ -293,58 +292,66 @@ def add_expense():
     username = profile.get("name", "Guest")
 
     if logged_in:
-        with open(EXPENSES_FILE, "a", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                username,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"), category,
-                description, amount, expense_type
-            ])
-            logging.info(
-                f"Expense added to file: {category}, {description}, £{amount}, {expense_type}"
-            )
+        storage.append_expenses([[
+            username,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"), category,
+            description, amount, expense_type
+        ]])
+        report_cache.invalidate(username)
+        logging.info(
+            f"Expense added to file: {category}, {description}, {format_money(amount)}, {expense_type}"
+        )
     else:
-        guest_expenses.append({
-            "date":
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "category":
-            category,
-            "description":
-            description,
-            "amount":
-            amount,
-            "type":
-            expense_type
-        })
+        guest_expenses.append(
+            ExpenseRecord(username,
+                          datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                          category, description, amount, expense_type))
         logging.info(
-            f"Guest expense added in memory: {category}, {description}, £{amount}, {expense_type}"
+            f"Guest expense added in memory: {category}, {description}, {format_money(amount)}, {expense_type}"
         )
 
     print(
-        f"Expense added: {category}, {description}, £{amount}, {expense_type}."
+        f"Expense added: {category}, {description}, {format_money(amount)}, {expense_type}."
     )
 
 
+# Adds many (date, category, description, amount, type) expenses for a user at once
+def add_expenses(username, expenses):
+    """
+    Validate every expense first and only write if all of them are valid,
+    so a bad statement line never leaves a half-imported batch behind.
+    """
+    if not check_if_user_exists(username):
+        raise ValueError(f"No profile found for user: {username}")
+
+    rows = []
+    errors = []
+    for number, expense in enumerate(expenses, start=1):
+        try:
+            rows.append(build_expense_row(username, *expense))
+        except (TypeError, ValueError) as e:
+            errors.append(f"Expense {number}: {e}")
+
+    if errors:
+        shown = "\n".join(errors[:10])
+        more = len(errors) - 10
+        if more > 0:
+            shown += f"\n...and {more} more"
+        raise ValueError(
+            f"{len(errors)} invalid expenses, nothing imported:\n{shown}")
+
+    added = storage.append_expenses(rows)
+    logging.info(f"{added} expenses added in bulk for {username}")
+    return added
+
+
 # Calculates the total expenses for the logged-in user or guest
 def calculate_total_expenses():
     total = 0
     if logged_in:
-        if os.path.exists(EXPENSES_FILE):
-            with open(EXPENSES_FILE, "r") as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if len(row) < 5:
-                        continue
-                    if row[0] == profile["name"]:
-                        try:
-                            total += float(row[4])
-                        except ValueError:
-                            print(
-                                f"Skipping a row with invalid amount format: {row[4]}"
-                            )
+        total = storage.totals(profile["name"]).total
     else:
-        for expense in guest_expenses:
-            total += expense["amount"]
+        total = guest_expenses.total
 
     return total
 
@@ -358,7 +365,11 @@ def generate_expense_report():
         print("2. View expenses by date range")
         print("3. View expenses by type (Essential or Non-Essential)")
         print("4. View all expenses.")
-        print("5. Return to Main Menu")
+        print("5. View totals by category")
+        print("6. View monthly spending trend")
+        print("7. Search expenses")
+        print("8. Custom query")
+        print("9. Return to Main Menu")
 
         try:
 
@@ -392,11 +403,25 @@ def generate_expense_report():
                 display_all_expenses()
             elif choice == 5:
 
+                display_totals_by_category()
+            elif choice == 6:
+
+                display_monthly_trend()
+            elif choice == 7:
+
+                text = input("Enter words to search categories and "
+                             "descriptions for:\n")
+                display_search_results(text)
+            elif choice == 8:
+
+                display_custom_query()
+            elif choice == 9:
+
                 print("Returning to Main Menu...")
                 return
             else:
 
-                print("Invalid choice. Please enter a number between 1 and 5.")
+                print("Invalid choice. Please enter a number between 1 and 9.")
                 continue
 
             while True:
@@ -438,9 +463,9 @@ def view_budget():
     feedback = get_spending_feedback(total_expenses, income)
 
     print("\n------Budget Summary------")
-    print(f"Income: £{income}")
-    print(f"Total Expenses: £{total_expenses}")
-    print(f"Remaining Budget: £{remaining_budget}")
+    print(f"Income: {format_money(income)}")
+    print(f"Total Expenses: {format_money(total_expenses)}")
+    print(f"Remaining Budget: {format_money(remaining_budget)}")
     print(feedback)
 
     print("1. Reset your account.")
@@ -456,31 +481,124 @@ def view_budget():
             else:
                 guest_expenses.clear()
             print("All expenses and income have been reset.")
-            break
+            return MAIN_MENU
         elif choice == "2":
 
-            main_menu()
-            break
+            return MAIN_MENU
         else:
 
             print("Invalid choice. Please try again.")
 
 
+# Feedback messages of each spending bucket
+SPENDING_FEEDBACK = {
+    "Income missing":
+    "🤔 Income missing! Are you living on air and good vibes? 🌬️✨",
+    "Money Maestro":
+    "💸 Money Maestro! Your budget’s tighter than a drum! Keep stacking those coins! 💰🐖",
+    "Budget Boss":
+    "🧠 Budget Boss! You're spending smart, leaving room for a splurge here and there. Treat yo'self! 🍰🎈",
+    "Walking the Line":
+    "🫣 Walking the Line! Just a few coins away from 'Uh-oh'... Maybe rethink that daily latte ☕️💸",
+    "Danger Zone":
+    "🛑 Danger Zone! You’re in 'Champagne dreams on a lemonade budget' territory! 🍾➡️🥤"
+}
+
+
 # Provides feedback on spending habits based on income and expenses
 def get_spending_feedback(total_expenses, income):
-    if income == 0:
-        return "🤔 Income missing! Are you living on air and good vibes? 🌬️✨"
+    return SPENDING_FEEDBACK[feedback_bucket(total_expenses, income)]
+
+
+# Column headers and fixed page widths of the expense reports
+EXPENSE_HEADERS = ["Date", "Category", "Description", "Amount", "Expense Type"]
+EXPENSE_WIDTHS = [12, 15, 30, 12, 13]
+
+
+# Returns the cache key of a report of the logged-in user, or None for guests
+def report_key(report, *parameters):
+    if not logged_in:
+        return None
+    return (profile["name"], report, parameters, storage.generation())
 
-    spending_ratio = total_expenses / income
 
-    if spending_ratio < 0.5:
-        return "💸 Money Maestro! Your budget’s tighter than a drum! Keep stacking those coins! 💰🐖"
-    elif spending_ratio < 0.75:
-        return "🧠 Budget Boss! You're spending smart, leaving room for a splurge here and there. Treat yo'self! 🍰🎈"
-    elif spending_ratio < 1:
-        return "🫣 Walking the Line! Just a few coins away from 'Uh-oh'... Maybe rethink that daily latte ☕️💸"
+# Prints report rows as one grid table, or page by page when there are many
+def show_report(rows, headers, widths, empty_message, cache_key=None):
+    """
+    Display the rows produced by calling rows(), a fresh generator each time.
+    Only one page is read before deciding how to show them, so large reports
+    never have to be held in memory. With a cache key, results of up to
+    report_cache.max_rows rows are kept and shown again without reading
+    the expenses.
+    """
+    cached = report_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        cached_rows, table = cached
+        if table is not None:
+            print(table)
+        elif not cached_rows:
+            print(empty_message)
+        else:
+            PagedReport(lambda: cached_rows, headers, widths).browse()
+        return
+
+    with timed(f"report.{cache_key[1] if cache_key else 'guest'}"):
+        first_rows = list(islice(rows(), PAGE_SIZE + 1))
+
+    if not first_rows:
+        print(empty_message)
+        if cache_key:
+            report_cache.put(cache_key, [])
+    elif len(first_rows) <= PAGE_SIZE:
+        table = tabulate(first_rows, headers=headers, tablefmt="grid")
+        print(table)
+        if cache_key:
+            report_cache.put(cache_key, first_rows, table)
     else:
-        return "🛑 Danger Zone! You’re in 'Champagne dreams on a lemonade budget' territory! 🍾➡️🥤"
+        if cache_key:
+            all_rows = list(islice(rows(), report_cache.max_rows + 1))
+            # Anything bigger is paged through without holding it
+            if len(all_rows) <= report_cache.max_rows:
+                report_cache.put(cache_key, all_rows)
+
+                def rows():
+                    return all_rows
+
+        PagedReport(rows, headers, widths).browse()
+
+
+# Yields the current user's or guest's expenses as records, filtered the same way
+def expense_records(category=None, expense_type=None, start=None, end=None):
+    if logged_in:
+        yield from decode_rows(
+            timed_rows(
+                "storage.query",
+                storage.query_expenses(profile["name"], category, expense_type,
+                                       start, end)))
+        return
+
+    if category is not None:
+        category = category.strip().lower()
+    if expense_type is not None:
+        expense_type = expense_type.strip().capitalize()
+    dated = start is not None or end is not None
+    start = to_timestamp(start) if start is not None else None
+    end = to_timestamp(end) if end is not None else None
+
+    for expense in guest_expenses:
+        if category is not None and expense.category.strip().lower(
+        ) != category:
+            continue
+        if expense_type is not None and expense.expense_type.strip(
+        ).capitalize() != expense_type:
+            continue
+        if dated:
+            # Only reports with a date range parse the dates
+            stamp = expense.stamp
+            if (stamp is None or start is not None and stamp < start
+                    or end is not None and stamp > end):
+                continue
+        yield expense
 
 
 # Displays expenses filtered by type (Essential or Non-Essential)
@@ -489,55 +607,17 @@ def display_expenses_by_type(expense_type):
     Display expenses filtered by a specified expense type.
     """
     print(f"\n--- {expense_type.capitalize()} Expenses ---")
-    found_expenses = False
-    data_list = []
 
-    if logged_in:
-        if os.path.exists(EXPENSES_FILE):
-            with open(EXPENSES_FILE, "r") as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if len(row) < 6:
-                        continue
-                    if row[0] == profile["name"] and row[5].strip().capitalize(
-                    ) == expense_type.capitalize():
-                        try:
-                            formatted_date = datetime.strptime(
-                                row[1],
-                                "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-                        except ValueError:
-                            formatted_date = "Invalid date"
-                        data_list.append([
-                            formatted_date, row[2], row[3], f"£{row[4]}",
-                            row[5]
-                        ])
-                        found_expenses = True
-    else:
-        for expense in guest_expenses:
-            if expense["type"].capitalize() == expense_type.capitalize():
-                try:
-                    formatted_date = datetime.strptime(
-                        expense["date"],
-                        "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-                except ValueError:
-                    formatted_date = "Invalid date"
-                data_list.append([
-                    formatted_date, expense["category"],
-                    expense["description"], f"£{expense['amount']}",
-                    expense["type"]
-                ])
-                found_expenses = True
-
-    if found_expenses:
-        print(
-            tabulate(data_list,
-                     headers=[
-                         "Date", "Category", "Description", "Amount",
-                         "Expense Type"
-                     ],
-                     tablefmt="grid"))
-    else:
-        print(f"No {expense_type.lower()} expenses recorded.")
+    def rows():
+        for expense in expense_records(expense_type=expense_type):
+            yield [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+
+    show_report(rows, EXPENSE_HEADERS, EXPENSE_WIDTHS,
+                f"No {expense_type.lower()} expenses recorded.",
+                report_key("type", expense_type.capitalize()))
 
 
 # Displays expenses filtered by a specified category
@@ -546,49 +626,15 @@ def display_expenses_by_category(category):
     Display expenses filtered by the specified category.
     """
     print(f"\n--- Expenses in Category: {category} ---")
-    found_expenses = False
-    data_list = []
 
-    if logged_in:
-        if os.path.exists(EXPENSES_FILE):
-            with open(EXPENSES_FILE, "r") as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if len(row) < 6:
-                        continue
-                    if row[0] == profile["name"] and row[2].strip().lower(
-                    ) == category.strip().lower():
-                        try:
-                            formatted_date = datetime.strptime(
-                                row[1],
-                                "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-                        except ValueError:
-                            formatted_date = "Invalid date"
-                        data_list.append(
-                            [formatted_date, row[3], f"£{row[4]}"])
-                        found_expenses = True
-    else:
-        for expense in guest_expenses:
-            if expense["category"].strip().lower() == category.strip().lower():
-                try:
-                    formatted_date = datetime.strptime(
-                        expense["date"],
-                        "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-                except ValueError:
-                    formatted_date = "Invalid date"
-                data_list.append([
-                    formatted_date, expense["description"],
-                    f"£{expense['amount']}"
-                ])
-                found_expenses = True
-
-    if found_expenses:
-        print(
-            tabulate(data_list,
-                     headers=["Date", "Description", "Amount"],
-                     tablefmt="grid"))
-    else:
-        print(f"No expenses recorded in category '{category}'.")
+    def rows():
+        for expense in expense_records(category=category):
+            yield [expense.day, expense.description, expense.money]
+
+    show_report(rows, ["Date", "Description", "Amount"], [12, 40, 12],
+                f"No expenses recorded in category '{category}'.",
+                report_key("category",
+                           category.strip().lower()))
 
 
 # Displays all expenses for the logged-in user or guest user
@@ -597,51 +643,16 @@ def display_all_expenses():
     Display all expenses for the logged-in user or guest user.
     """
     print("\n--- All Expenses ---")
-    found_expenses = False
-    data_list = []
 
-    if logged_in:
-        if os.path.exists(EXPENSES_FILE):
-            with open(EXPENSES_FILE, "r") as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if len(row) < 6:
-                        continue
-                    if row[0] == profile["name"]:
-                        try:
-                            formatted_date = datetime.strptime(
-                                row[1],
-                                "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-                        except ValueError:
-                            formatted_date = "Invalid date"
-                        data_list.append([
-                            formatted_date, row[2], row[3], f"£{row[4]}",
-                            row[5]
-                        ])
-                        found_expenses = True
-    else:
-        for expense in guest_expenses:
-            try:
-                formatted_date = datetime.strptime(
-                    expense["date"], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-            except ValueError:
-                formatted_date = "Invalid date"
-            data_list.append([
-                formatted_date, expense["category"], expense["description"],
-                f"£{expense['amount']}", expense["type"]
-            ])
-            found_expenses = True
-
-    if found_expenses:
-        print(
-            tabulate(data_list,
-                     headers=[
-                         "Date", "Category", "Description", "Amount",
-                         "Expense Type"
-                     ],
-                     tablefmt="grid"))
-    else:
-        print("No expenses recorded yet.")
+    def rows():
+        for expense in expense_records():
+            yield [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+
+    show_report(rows, EXPENSE_HEADERS, EXPENSE_WIDTHS,
+                "No expenses recorded yet.", report_key("all"))
 
 
 # Displays expenses filtered by a specified date range
@@ -650,8 +661,6 @@ def display_expenses_by_date(start_date, end_date):
     Display expenses filtered by a specified date range.
     """
     print(f"\n--- Expenses from {start_date} to {end_date} ---")
-    found_expenses = False
-    data_list = []
 
     try:
         start_date_parsed = datetime.strptime(start_date, "%Y-%m-%d")
@@ -661,55 +670,231 @@ def display_expenses_by_date(start_date, end_date):
         return
 
     if logged_in:
-        if os.path.exists(EXPENSES_FILE):
-            with open(EXPENSES_FILE, "r") as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if len(row) < 6:
-                        continue
-                    if row[0] == profile["name"]:
-                        try:
-                            row_date = datetime.strptime(
-                                row[1], "%Y-%m-%d %H:%M:%S")
-                            if start_date_parsed <= row_date <= end_date_parsed:
-                                formatted_date = row_date.strftime("%Y-%m-%d")
-                                data_list.append([
-                                    formatted_date, row[2], row[3],
-                                    f"£{row[4]}", row[5]
-                                ])
-                                found_expenses = True
-                        except ValueError:
-                            print(
-                                f"Skipping a row with an invalid date format: {row[1]}"
-                            )
+        undated = decode_rows(storage.undated_expenses(profile["name"]))
     else:
-        for expense in guest_expenses:
-            try:
-                expense_date = datetime.strptime(expense["date"],
-                                                 "%Y-%m-%d %H:%M:%S")
-                if start_date_parsed <= expense_date <= end_date_parsed:
-                    formatted_date = expense_date.strftime("%Y-%m-%d")
-                    data_list.append([
-                        formatted_date, expense["category"],
-                        expense["description"], f"£{expense['amount']}",
-                        expense["type"]
-                    ])
-                    found_expenses = True
-            except ValueError:
-                print(
-                    f"Skipping an expense with an invalid date format: {expense['date']}"
-                )
-
-    if found_expenses:
+        undated = (expense for expense in guest_expenses
+                   if expense.stamp is None)
+    for expense in undated:
         print(
-            tabulate(data_list,
-                     headers=[
-                         "Date", "Category", "Description", "Amount",
-                         "Expense Type"
-                     ],
-                     tablefmt="grid"))
+            f"Skipping an expense with an invalid date format: {expense.date}")
+
+    def rows():
+        # Stored rows come back ordered by date, so only the range is read
+        for expense in expense_records(start=start_date_parsed,
+                                       end=end_date_parsed):
+            yield [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+
+    show_report(rows, EXPENSE_HEADERS, EXPENSE_WIDTHS,
+                "No expenses recorded in this date range.",
+                report_key("date", start_date_parsed, end_date_parsed))
+
+
+# Yields the current user's or guest's expenses matching every word of a search
+def search_records(text):
+    if logged_in:
+        yield from decode_rows(
+            timed_rows("storage.search",
+                       storage.search_expenses(profile["name"], text)))
+        return
+
+    terms = tokenize(text)
+    for expense in guest_expenses:
+        if matches_search(terms, expense.category, expense.description):
+            yield expense
+
+
+# Displays expenses whose category or description contain the searched words
+def display_search_results(text):
+    """
+    Display expenses where every searched word starts a word of the category
+    or description, so "groc" finds "Groceries".
+    """
+    terms = tokenize(text)
+    if not terms:
+        print("Please enter at least one word to search for.")
+        return
+    print(f"\n--- Expenses matching '{text.strip()}' ---")
+
+    def rows():
+        for expense in search_records(text):
+            yield [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+
+    show_report(rows, EXPENSE_HEADERS, EXPENSE_WIDTHS,
+                f"No expenses match '{text.strip()}'.",
+                report_key("search", *sorted(set(terms))))
+
+
+# Runs a query over the current user's or guest's expenses, returning the plan
+# and a generator of the matching rows
+def run_expense_query(query):
+    if logged_in:
+        plan, rows = run_query(storage, profile["name"], query)
+        return plan, timed_rows("storage.query", rows)
+
+    # Guest expenses are only in memory, so they are always read in full
+    plan = QueryPlan("all", {"all": len(guest_expenses)})
+    rows = ((expense.username, expense.date, expense.category,
+             expense.description, expense.amount, expense.expense_type)
+            for expense in guest_expenses)
+    return plan, execute(rows, query, plan)
+
+
+# Asks for an optional value, returning None when it is left blank
+def ask_optional(prompt, parse=str):
+    while True:
+        text = input(prompt).strip()
+        if not text:
+            return None
+        try:
+            return parse(text)
+        except ValueError:
+            print("That value couldn't be read, please try again "
+                  "or leave it blank.")
+
+
+# Asks for the filters, order and limit of a custom query
+def ask_query():
+    print("Leave any question blank to skip it.")
+    category = ask_optional("Category: ")
+    expense_type = ask_optional(
+        "Type ('E' for essential, 'N' for non-essential): ",
+        parse_expense_type)
+    start = ask_optional("From date (YYYY-MM-DD): ",
+                         lambda text: datetime.strptime(text, "%Y-%m-%d"))
+    end = ask_optional(
+        "To date (YYYY-MM-DD): ", lambda text: datetime.strptime(
+            text, "%Y-%m-%d").replace(hour=23, minute=59, second=59))
+    min_amount = ask_optional("Smallest amount: ", parse_pence)
+    max_amount = ask_optional("Largest amount: ", parse_pence)
+    search = ask_optional("Words to search for: ")
+    sort = ask_optional(f"Sort by ({', '.join(SORT_KEYS)}): ",
+                        lambda text: SORT_KEYS[SORT_KEYS.index(text.lower())])
+    descending = sort is not None and input(
+        "Largest first? (y/n): ").strip().lower() == "y"
+    limit = ask_optional("Most rows to show: ", parse_limit)
+    return ExpenseQuery(category, expense_type, start, end, min_amount,
+                        max_amount, search, sort, descending, limit)
+
+
+# Displays the expenses matching a combination of filters, and optionally how
+# they were found
+def display_custom_query():
+    """
+    Display expenses matching every filter the user fills in. The query
+    reads the rows through whichever filter narrows them down most, like
+    a database picking an index, and can explain which one it used.
+    """
+    query = ask_query()
+    explain = input(
+        "Explain how the expenses are found? (y/n): ").strip().lower() == "y"
+    print("\n--- Custom Query ---")
+
+    def rows():
+        for expense in decode_rows(run_expense_query(query)[1]):
+            yield [
+                expense.day, expense.category, expense.description,
+                expense.money, expense.expense_type
+            ]
+
+    if not explain:
+        show_report(rows, EXPENSE_HEADERS, EXPENSE_WIDTHS,
+                    "No expenses match this query.",
+                    report_key("query", *query.key()))
+        return
+
+    # Explaining needs the plan after the rows are read, so they are listed
+    # in full rather than paged or cached
+    plan, found = run_expense_query(query)
+    found = [[
+        expense.day, expense.category, expense.description, expense.money,
+        expense.expense_type
+    ] for expense in decode_rows(found)]
+    if found:
+        print(tabulate(found, headers=EXPENSE_HEADERS, tablefmt="grid"))
     else:
-        print("No expenses recorded in this date range.")
+        print("No expenses match this query.")
+    print("\n".join(plan.explain(query)))
+
+
+# Returns the columnar copy of the current user's or guest's expenses
+def get_expense_columns():
+    with timed("storage.columns"):
+        if logged_in:
+            return storage.columns(profile["name"])
+
+        columns = ExpenseColumns()
+        columns.extend(expense.row() for expense in guest_expenses)
+        return columns
+
+
+# Displays the total spent in each category, largest first
+def display_totals_by_category():
+    """
+    Display the total and share of spending for every category.
+    """
+    print("\n--- Totals by Category ---")
+    columns = get_expense_columns()
+    totals = columns.totals_by_category()
+
+    if not totals:
+        print("No expenses recorded yet.")
+        return
+
+    overall = sum(total for _, total in totals)
+    data_list = [[
+        category,
+        format_money(total), f"{total / overall:.0%}" if overall else "-"
+    ] for category, total in totals]
+    print(
+        tabulate(data_list,
+                 headers=["Category", "Total", "Share"],
+                 tablefmt="grid"))
+
+
+# Displays the total spent in each month with the change from the month before
+def display_monthly_trend():
+    """
+    Display monthly spending totals in date order.
+    """
+    print("\n--- Monthly Spending Trend ---")
+    columns = get_expense_columns()
+    totals = columns.totals_by_month()
+
+    if not totals:
+        print("No expenses recorded yet.")
+        return
+
+    data_list = []
+    previous = None
+    for month, total in totals:
+        if previous is None:
+            change = "-"
+        else:
+            difference = total - previous
+            change = f"{'+' if difference >= 0 else '-'}{format_money(abs(difference))}"
+        data_list.append([month_label(month), format_money(total), change])
+        previous = total
+    print(
+        tabulate(data_list,
+                 headers=["Month", "Total", "Change"],
+                 tablefmt="grid"))
+
+
+# Formats a table with the tabulate library, which is only imported when needed
+def tabulate(data, **options):
+    """
+    Importing tabulate costs more than the rest of a command line call, so
+    commands that print JSON or csv never import it.
+    """
+    from tabulate import tabulate as format_table
+    with timed("tabulate"):
+        return format_table(data, **options)
 
 
 # Prints a table using the tabulate library
@@ -718,7 +903,376 @@ def print_table(data, column_headers):
     print(table)
 
 
+# Fields of the expense rows written by the command line, in import file order
+EXPORT_FIELDS = ["date", "category", "description", "amount", "type"]
+
+
+# Converts a stored expense row to the fields written by the command line
+def export_row(row):
+    try:
+        amount = format_pounds(int(row[4]))
+    except ValueError:
+        amount = row[4]
+    return [row[1], row[2], row[3], amount, row[5]]
+
+
+# Reads a YYYY-MM-DD date given on the command line
+def parse_day(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"dates must be in the format YYYY-MM-DD: {text}")
+
+
+# Returns the fields, rows and query plan of a command line report for a user
+def build_report(username, group_by=None, query=None):
+    """
+    Without group_by, the expenses matching the query are returned one per
+    row. Grouping by category, type or date (month) returns the totals
+    instead, summed in Python: for one user's expenses that is quicker than
+    importing numpy. The plan's row counts are filled in as the rows are read.
+    """
+    query = query or ExpenseQuery()
+    plan, rows = run_query(storage, username, query)
+
+    if group_by is None:
+        return EXPORT_FIELDS, (export_row(row) for row in rows), plan
+
+    if query.key() != ExpenseQuery().key():
+        columns = ExpenseColumns()
+        columns.extend(rows)
+    else:
+        columns = storage.columns(username)
+
+    if group_by == "category":
+        return ["category", "total"
+                ], [[category, format_pounds(total)]
+                    for category, total in columns.totals_by_category(False)
+                    ], plan
+    if group_by == "type":
+        return ["type", "total"
+                ], [[expense_type, format_pounds(total)]
+                    for expense_type, total in columns.totals_by_type(False)
+                    ], plan
+    return ["month", "total"
+            ], [[month, format_pounds(total)]
+                for month, total in columns.totals_by_month(False)], plan
+
+
+# Returns the budget summary of a user as fields and a single row
+def build_summary(username):
+    income = parse_pence(storage.get_profile(username)[2])
+    total_expenses = storage.totals(username).total
+    return ["income", "total_expenses", "remaining", "feedback"], [
+        format_pounds(income),
+        format_pounds(total_expenses),
+        format_pounds(income - total_expenses),
+        get_spending_feedback(total_expenses, income)
+    ]
+
+
+# Writes command output as JSON, csv or a grid table
+def write_output(fields, rows, output_format, file=None):
+    """
+    JSON and csv rows are written as they are read, so exporting a large
+    history doesn't build it up in memory first.
+    """
+    file = file or sys.stdout
+    if output_format == "json":
+        file.write("[")
+        for number, row in enumerate(rows):
+            file.write(",\n" if number else "\n")
+            file.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False))
+        file.write("\n]\n")
+    elif output_format == "csv":
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(fields)
+        writer.writerows(rows)
+    else:
+        headers = [field.replace("_", " ").capitalize() for field in fields]
+        # Amounts stay as written, e.g. 12.50 rather than 12.5
+        print(tabulate(list(rows),
+                       headers=headers,
+                       tablefmt="grid",
+                       disable_numparse=True),
+              file=file)
+
+
+# Runs a non-interactive command given on the command line
+def run_command(arguments):
+    parser = argparse.ArgumentParser(prog="main.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import", help="Import expenses for a user from a csv or OFX file")
+    import_parser.add_argument("username")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=["csv", "ofx"])
+    import_parser.add_argument("--category",
+                               default="Imported",
+                               help="Category given to OFX transactions")
+    import_parser.add_argument("--type",
+                               default="Essential",
+                               help="Expense type given to OFX transactions")
+
+    output_options = argparse.ArgumentParser(add_help=False)
+    output_options.add_argument("--format",
+                                choices=["json", "csv", "table"],
+                                default="json",
+                                help="Output format (default: json)")
+
+    add_parser = commands.add_parser("add-expense",
+                                     parents=[output_options],
+                                     help="Add one expense for a user")
+    add_parser.add_argument("username")
+    add_parser.add_argument("--category", required=True)
+    add_parser.add_argument("--description", default="")
+    add_parser.add_argument("--amount", required=True)
+    add_parser.add_argument("--type",
+                            required=True,
+                            help="E or Essential, N or Non-Essential")
+    add_parser.add_argument("--date",
+                            help="YYYY-MM-DD [HH:MM:SS], default now")
+
+    report_parser = commands.add_parser(
+        "report",
+        parents=[output_options],
+        help="List a user's expenses, or their totals grouped with --by")
+    report_parser.add_argument("username")
+    report_parser.add_argument("--by", choices=["category", "type", "date"])
+    report_parser.add_argument("--category")
+    report_parser.add_argument("--type")
+    report_parser.add_argument("--start", type=parse_day)
+    report_parser.add_argument("--end",
+                               type=parse_day,
+                               help="Last day included")
+    report_parser.add_argument(
+        "--search", help="Words that categories or descriptions start with")
+    report_parser.add_argument("--min-amount",
+                               type=parse_pence,
+                               help="Smallest amount in pounds")
+    report_parser.add_argument("--max-amount",
+                               type=parse_pence,
+                               help="Largest amount in pounds")
+    report_parser.add_argument("--sort", choices=SORT_KEYS)
+    report_parser.add_argument("--descending",
+                               action="store_true",
+                               help="Largest first when sorted")
+    report_parser.add_argument("--limit",
+                               type=parse_limit,
+                               help="Most expenses to include")
+    report_parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Print how the expenses were found to stderr")
+
+    summary_parser = commands.add_parser("summary",
+                                         parents=[output_options],
+                                         help="Show a user's budget summary")
+    summary_parser.add_argument("username")
+
+    export_parser = commands.add_parser(
+        "export",
+        help="Write all of a user's expenses in the import file format")
+    export_parser.add_argument("username")
+    export_parser.add_argument("--format",
+                               choices=["csv", "json"],
+                               default="csv")
+    export_parser.add_argument("--output",
+                               help="File to write, default stdout")
+
+    batch_parser = commands.add_parser(
+        "batch-summary",
+        help="Write the budget summary of every user to one csv file")
+    batch_parser.add_argument("--output", default="budget_summaries.csv")
+    batch_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes summing expenses.csv, default one per CPU")
+
+    archive_parser = commands.add_parser(
+        "archive",
+        help="Move old expenses into compressed segments under archive/")
+    archive_parser.add_argument("--older-than",
+                                type=int,
+                                default=365,
+                                help="Age in days, default 365")
+    archive_parser.add_argument("--period",
+                                choices=["month", "year"],
+                                default="month")
+    archive_parser.add_argument("--compression",
+                                choices=["gzip", "lzma"],
+                                default="gzip")
+
+    commands.add_parser(
+        "check-totals",
+        help="Rebuild every user's running totals from the stored rows and "
+        "exit with status 1 if any have drifted")
+
+    migrate_parser = commands.add_parser(
+        "migrate-sqlite",
+        help="Copy profiles and expenses from the csv files into SQLite")
+    migrate_parser.add_argument("--database", default=DATABASE_FILE)
+
+    serve_parser = commands.add_parser(
+        "serve", help="Serve many sessions at once from one process")
+    serve_parser.add_argument("--socket", default=None)
+    serve_parser.add_argument("--port",
+                              type=int,
+                              help="Listen on localhost instead of a socket")
+
+    args = parser.parse_args(arguments)
+
+    if args.command == "import":
+        try:
+            added = add_expenses(
+                args.username,
+                read_expenses(args.file, args.format, args.category,
+                              args.type))
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"Imported {added} expenses for {args.username}.")
+    elif args.command == "add-expense":
+        try:
+            if not check_if_user_exists(args.username):
+                raise ValueError(f"No profile found for user: {args.username}")
+            row = build_expense_row(args.username, args.date, args.category,
+                                    args.description, args.amount, args.type)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        storage.append_expenses([row])
+        logging.info(
+            f"Expense added from the command line for {args.username}")
+        write_output(EXPORT_FIELDS, [export_row(row)], args.format)
+    elif args.command in ("report", "summary", "export"):
+        if not check_if_user_exists(args.username):
+            print(f"No profile found for user: {args.username}",
+                  file=sys.stderr)
+            return 1
+
+        if args.command == "report":
+            if args.type is not None:
+                try:
+                    args.type = parse_expense_type(args.type)
+                except ValueError as e:
+                    print(e, file=sys.stderr)
+                    return 1
+            end = args.end
+            if end is not None:
+                end = end.replace(hour=23, minute=59, second=59)
+            query = ExpenseQuery(args.category, args.type, args.start, end,
+                                 args.min_amount, args.max_amount, args.search,
+                                 args.sort, args.descending, args.limit)
+            fields, rows, plan = build_report(args.username, args.by, query)
+            write_output(fields, rows, args.format)
+            if args.explain:
+                print("\n".join(plan.explain(query)), file=sys.stderr)
+        elif args.command == "summary":
+            fields, row = build_summary(args.username)
+            if args.format == "json":
+                print(json.dumps(dict(zip(fields, row)), ensure_ascii=False))
+            else:
+                write_output(fields, [row], args.format)
+        else:
+            fields, rows, _ = build_report(args.username)
+            try:
+                if args.output:
+                    with open(args.output, "w", newline="",
+                              encoding="utf-8") as file:
+                        write_output(fields, rows, args.format, file)
+                else:
+                    write_output(fields, rows, args.format)
+            except OSError as e:
+                print(e, file=sys.stderr)
+                return 1
+    elif args.command == "batch-summary":
+        try:
+            count = write_summaries(storage, args.output, args.workers)
+        except OSError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"Wrote the budget summaries of {count} users to "
+              f"{args.output}.")
+    elif args.command == "archive":
+        cutoff = datetime.now().replace(
+            hour=0, minute=0, second=0,
+            microsecond=0) - timedelta(days=args.older_than)
+        try:
+            moved = storage.archive_expenses(cutoff, args.period,
+                                             args.compression)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"Archived {moved} expenses dated before {cutoff:%Y-%m-%d}.")
+    elif args.command == "check-totals":
+        drift = storage.check_totals()
+        for message in drift:
+            print(f"Totals drift for {message}", file=sys.stderr)
+        if drift:
+            return 1
+        print("Every user's totals match their expenses.")
+    elif args.command == "migrate-sqlite":
+        from sqlite_backend import SqliteBackend, migrate
+
+        target = SqliteBackend(args.database)
+        try:
+            copied, added, skipped = migrate(
+                CsvBackend(PROFILE_FILE, EXPENSES_FILE, JOURNAL_FILE,
+                           ARCHIVE_DIRECTORY), target)
+        finally:
+            target.close()
+        print(f"Copied {copied} profiles and {added} expenses into "
+              f"{args.database} ({skipped} skipped).")
+        print("Set FINANCE_BACKEND=sqlite to use the database.")
+    elif args.command == "serve":
+        import asyncio
+        from server import SOCKET_FILE, serve
+
+        try:
+            asyncio.run(serve(storage, args.socket or SOCKET_FILE, args.port))
+        except KeyboardInterrupt:
+            print("Server stopped.")
+    return 0
+
+
+# Screens of an interactive session. Each one returns the next screen to show
+SCREENS = {
+    SETUP: setup,
+    LOGIN: load_profile,
+    CREATE_PROFILE: create_profile,
+    MAIN_MENU: main_menu
+}
+
+
+# Runs an interactive session, moving from screen to screen until it exits
+def run_session(state=SETUP):
+    """
+    Every screen returns instead of calling the next one, so a session of any
+    length runs at the same stack depth. With FINANCE_PROFILE set the whole
+    session is profiled, and with FINANCE_METRICS set its timings are logged.
+    """
+    profiler = start_profiling()
+    try:
+        while state is not EXIT:
+            state = SCREENS[state]()
+    finally:
+        stop_profiling(profiler)
+        metrics.log_summary("session end")
+    logging.info(f"Report cache: {report_cache.stats()}")
+
+
 # Entry point of the program
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        status = run_command(sys.argv[1:])
+        metrics.log_summary("command end")
+        storage.save_snapshot()
+        sys.exit(status)
+
     print("Welcome to Personal Finance Calculator")
-    setup()
+    run_session()
+    # The next start maps the indexes in instead of reading the files again
+    storage.save_snapshot()
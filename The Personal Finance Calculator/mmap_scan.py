@@ -0,0 +1,107 @@
+# Imported modules
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Files at least this big are split across SCAN_WORKERS processes when scanned
+PARALLEL_SCAN_BYTES = 256 * 1024 * 1024
+SCAN_WORKERS = os.cpu_count() or 1
+
+
+# Returns the record starting at an offset, up to a newline outside quotes
+def record_at(data, offset):
+    end = offset
+    while True:
+        newline = data.find(b"\n", end)
+        if newline == -1:
+            return data[offset:len(data)]
+        end = newline + 1
+        if data[offset:end].count(b'"') % 2 == 0:
+            return data[offset:end]
+
+
+# Finds the records in [start, end) whose first field is `field`
+def scan_chunk(data, field, start, end):
+    """
+    A record start is a line start with an even number of quotes before it,
+    the same rule iter_records splits on. Quotes are only counted from
+    start, so each candidate is returned with the parity of the quotes
+    between start and it, along with the chunk's own quote count, and the
+    caller adds the parity of everything before the chunk.
+    """
+    candidates = []
+    quotes = 0
+    counted = start
+    position = data.find(field, start, end + len(field) + 2)
+    while position != -1:
+        after = data[position + len(field):position + len(field) + 2]
+        if after[:1] == b",":
+            record = position
+        elif after == b'",' and position > 0 and data[position -
+                                                      1:position] == b'"':
+            record = position - 1
+        else:
+            record = -1
+
+        if (start <= record < end
+                and (record == 0 or data[record - 1:record] == b"\n")):
+            quotes += data[counted:record].count(b'"')
+            counted = record
+            candidates.append((record, quotes % 2))
+        position = data.find(field, position + 1, end + len(field) + 2)
+
+    quotes += data[counted:end].count(b'"')
+    return candidates, quotes
+
+
+# Scans one chunk of a file in a worker process
+def scan_file_chunk(path, inode, field, start, end):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_ino != inode:
+            raise FileNotFoundError(f"{path} was replaced during the scan")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return scan_chunk(data, field, start, end)
+
+
+# Yields (offset, raw_bytes) for every record whose first field is `field`
+def find_records(file, field, size=None, workers=None):
+    """
+    `field` is the first field as it is written to the file, without the
+    quotes csv.writer adds when it needs them. The first `size` bytes of the
+    file (all of it by default) are memory-mapped and searched at the byte
+    level, so only matching records are ever copied out or decoded. Files of
+    PARALLEL_SCAN_BYTES or more are scanned in chunks by SCAN_WORKERS
+    processes, unless `workers` says otherwise.
+    """
+    if size is None:
+        size = os.fstat(file.fileno()).st_size
+    if not size or not field:
+        return
+    if workers is None:
+        workers = SCAN_WORKERS if size >= PARALLEL_SCAN_BYTES else 1
+
+    with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as data:
+        chunks = None
+        if workers > 1:
+            inode = os.fstat(file.fileno()).st_ino
+            bounds = [
+                size * number // workers for number in range(workers + 1)
+            ]
+            try:
+                with ProcessPoolExecutor(workers) as executor:
+                    chunks = list(
+                        executor.map(scan_file_chunk, [file.name] * workers,
+                                     [inode] * workers, [field] * workers,
+                                     bounds, bounds[1:]))
+            except OSError:
+                # Compacted since it was opened; this process still has it
+                chunks = None
+        if chunks is None:
+            chunks = [scan_chunk(data, field, 0, size)]
+
+        quotes = 0
+        for candidates, chunk_quotes in chunks:
+            for offset, parity in candidates:
+                if (quotes + parity) % 2 == 0:
+                    yield offset, record_at(data, offset)
+            quotes += chunk_quotes
@@ -0,0 +1,45 @@
+# Imported modules
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+
+# Converts an amount in pounds such as "12.5" or 12.5 to whole pence (1250)
+def parse_pence(value):
+    text = str(value).strip().replace(",", "").lstrip("£")
+    negative = text.startswith("-")
+    pounds, _, pennies = (text[1:] if negative else text).partition(".")
+
+    # Fast exact path for plain amounts with at most two decimal places
+    if ((pounds or pennies) and (not pounds or pounds.isdecimal())
+            and (not pennies or pennies.isdecimal()) and len(pennies) <= 2):
+        whole = int(pounds or 0) * 100 + int(pennies.ljust(2, "0"))
+        return -whole if negative else whole
+
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value}")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+# Formats whole pence as pounds without a currency sign, e.g. 1250 -> "12.50"
+def format_pounds(pence):
+    sign = "-" if pence < 0 else ""
+    pounds, pennies = divmod(abs(pence), 100)
+    return f"{sign}{pounds}.{pennies:02d}"
+
+
+# Formats whole pence for display, e.g. 1250 -> "£12.50"
+def format_money(pence):
+    if pence < 0:
+        return f"-£{format_pounds(-pence)}"
+    return f"£{format_pounds(pence)}"
+
+
+# Formats an amount field read from the expenses file, keeping unreadable text as is
+def format_stored_amount(text):
+    try:
+        return format_money(int(text))
+    except ValueError:
+        return f"£{text}"
@@ -0,0 +1,112 @@
+# Imported modules
+from collections import OrderedDict
+from itertools import islice
+
+PAGE_SIZE = 20
+CACHED_PAGES = 5
+
+
+# Pads or cuts a value to exactly the given width
+def fit(value, width):
+    text = str(value).replace("\n", " ")
+    if len(text) > width:
+        text = text[:width - 1] + "…"
+    return text.ljust(width)
+
+
+class PagedReport:
+    """
+    Shows report rows a page at a time with fixed column widths.
+
+    Rows come from a function that returns a fresh iterator, so nothing but
+    the few most recently shown pages is ever held in memory. Going back to
+    a page that is no longer cached reads the rows again from the start.
+    """
+
+    def __init__(self,
+                 rows,
+                 headers,
+                 widths,
+                 page_size=PAGE_SIZE,
+                 cached_pages=CACHED_PAGES):
+        self._rows = rows
+        self.headers = headers
+        self.widths = widths
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.page_count = None
+        self._iterator = None
+        self._position = 0
+        self._pages = OrderedDict()
+
+    # Returns the rows of a page (numbered from 0), empty if it is past the end
+    def page(self, number):
+        if number in self._pages:
+            self._pages.move_to_end(number)
+            return self._pages[number]
+
+        start = number * self.page_size
+        if self._iterator is None or self._position > start:
+            self._iterator = iter(self._rows())
+            self._position = 0
+
+        for _ in islice(self._iterator, start - self._position):
+            self._position += 1
+        rows = list(islice(self._iterator, self.page_size))
+        self._position += len(rows)
+
+        if len(rows) < self.page_size:
+            self.page_count = max(1, -(-self._position // self.page_size))
+        if rows:
+            self._pages[number] = rows
+            if len(self._pages) > self.cached_pages:
+                self._pages.popitem(last=False)
+        return rows
+
+    # Formats a page of rows as fixed-width text
+    def render(self, number, rows):
+        lines = [
+            " | ".join(
+                fit(header, width)
+                for header, width in zip(self.headers, self.widths)),
+            "-+-".join("-" * width for width in self.widths)
+        ]
+        for row in rows:
+            lines.append(" | ".join(
+                fit(value, width) for value, width in zip(row, self.widths)))
+
+        total = self.page_count if self.page_count is not None else "?"
+        lines.append(f"Page {number + 1} of {total}")
+        return "\n".join(lines)
+
+    # Lets the user move between pages until they quit
+    def browse(self, read=None, write=print):
+        read = read or input
+        number = 0
+        while True:
+            rows = self.page(number)
+            if not rows and number > 0:
+                write("There are no more pages.")
+                number = self.page_count - 1
+                continue
+
+            write(self.render(number, rows))
+            choice = read("[n]ext, [p]revious, [j]ump to page, [q]uit: "
+                          ).strip().lower()
+
+            if choice in ("n", ""):
+                number += 1
+            elif choice == "p":
+                if number == 0:
+                    write("This is the first page.")
+                number = max(0, number - 1)
+            elif choice.startswith("j"):
+                target = choice[1:].strip() or read("Page number: ").strip()
+                try:
+                    number = max(0, int(target) - 1)
+                except ValueError:
+                    write("Please enter a page number.")
+            elif choice == "q":
+                return
+            else:
+                write("Invalid choice. Please enter n, p, j or q.")
@@ -0,0 +1,250 @@
+# Imported modules
+import logging
+import os
+from array import array
+from itertools import chain
+
+from expense_store import format_record, iter_records, parse_record
+from journal import (DELETE_PROFILE, HEADER_MARK, UPDATE_INCOME, file_identity,
+                     replace_file, version_header)
+from snapshot import SNAPSHOT_TAIL_BYTES, open_snapshot, write_snapshot
+
+# First row of a user list written by compaction, followed by the id of the
+# file's version (see journal.file_identity). Older lists have no header.
+PROFILE_HEADER = [HEADER_MARK, "profiles"]
+
+
+class ProfileRepository:
+    """
+    In-memory index of the user list, keyed by username.
+
+    user_list.csv is read once and kept in a dict, so lookups during login and
+    sign-up are O(1). Profiles added by this process are written through and
+    indexed directly; changes made by other processes are noticed from the
+    size, mtime and version of the file and from new journal records.
+
+    The index is saved to a binary snapshot at compaction and shutdown, so
+    the next process only reads profiles appended since.
+    """
+
+    def __init__(self, path, journal):
+        self.path = path
+        self.journal = journal
+        self._lock = journal.lock
+        self._profiles = {}
+        self._size = 0
+        self._mtime = 0
+        self._inode = None
+        self._identity = None
+        self._journal_version = None
+        self.snapshot_path = f"{path}.snapshot"
+        self._snapshot_size = None
+
+    # Makes sure the index matches the user list and the journal
+    def refresh(self):
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return
+
+            if (stat.st_ino != self._inode or stat.st_size < self._size
+                    or stat.st_size == self._size
+                    and stat.st_mtime_ns != self._mtime
+                    # A new version may have been given the same inode
+                    or stat.st_size > self._size
+                    and file_identity(self.path) != self._identity):
+                self._reset()
+                self._identity = file_identity(self.path)
+                if not self._load_snapshot():
+                    self._inode = stat.st_ino
+                    self._index_from(0)
+                elif stat.st_size > self._size:
+                    self._index_from(self._size)
+                else:
+                    self._apply_journal()
+            elif stat.st_size > self._size:
+                self._index_from(self._size)
+            else:
+                self._apply_journal()
+
+    # Forgets everything that was indexed
+    def _reset(self):
+        self._profiles = {}
+        self._size = 0
+        self._mtime = 0
+        self._inode = None
+        self._identity = None
+        self._journal_version = None
+        self._snapshot_size = None
+
+    # Loads the index from a valid snapshot, returning whether there was one
+    def _load_snapshot(self):
+        snapshot = open_snapshot(self.snapshot_path, self.path)
+        if snapshot is None:
+            return False
+        with snapshot:
+            strings = snapshot.strings
+            for _ in range(snapshot.next()):
+                offset = snapshot.next()
+                row = [
+                    strings[number]
+                    for number in snapshot.array(snapshot.next())
+                ]
+                self._profiles[row[0]] = (offset, row)
+            self._inode = snapshot.inode
+            self._size = self._snapshot_size = snapshot.size
+            self._mtime = snapshot.mtime
+        return True
+
+    # Saves the index to the snapshot file, returning whether it was written
+    def save_snapshot(self, force=False):
+        """
+        Journaled changes are saved applied and applied again on loading,
+        which changes nothing. Unless forced, the snapshot is only saved
+        when there is none of this file yet or SNAPSHOT_TAIL_BYTES have been
+        appended since the last one.
+        """
+        with self._lock:
+            if self._inode is None:
+                return False
+            self.refresh()
+            if self._inode is None or not force and (
+                    self._snapshot_size is not None and
+                    self._size - self._snapshot_size < SNAPSHOT_TAIL_BYTES):
+                return False
+            strings = {}
+            numbers = array("q", [len(self._profiles)])
+            for offset, row in self._profiles.values():
+                numbers.extend((offset, len(row)))
+                numbers.extend(
+                    strings.setdefault(field, len(strings)) for field in row)
+            try:
+                written = write_snapshot(self.snapshot_path, self.path,
+                                         self._inode, self._size, self._mtime,
+                                         list(strings), numbers)
+            except OSError as e:
+                logging.warning(f"Couldn't save the profile index: {e}")
+                return False
+            if written:
+                self._snapshot_size = self._size
+            return written
+
+    # Indexes every profile from the given byte offset to the end of the file
+    def _index_from(self, start):
+        deleted, _ = self._journal_changes()
+        with open(self.path, "rb") as file:
+            for offset, raw in iter_records(file, start):
+                row = parse_record(raw)
+                if (not row or offset == 0 and row[:2] == PROFILE_HEADER
+                        or offset < deleted.get(row[0], -1)):
+                    continue
+                self._profiles[row[0]] = (offset, row)
+            stat = os.fstat(file.fileno())
+
+        self._size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+        self._journal_version = None
+        self._apply_journal()
+
+    # Replays the journal, returning deletion offsets and income overrides
+    def _journal_changes(self):
+        deleted = {}
+        incomes = {}
+        for operation, _, _, username, value in self.journal.records_for(
+                self.path):
+            if operation == DELETE_PROFILE:
+                deleted[username] = int(value)
+                incomes.pop(username, None)
+            elif operation == UPDATE_INCOME:
+                incomes[username] = value
+        return deleted, incomes
+
+    # Applies journaled deletions and income changes if the journal has changed
+    def _apply_journal(self):
+        version = self.journal.version
+        if version == self._journal_version:
+            return
+        self._journal_version = version
+
+        deleted, incomes = self._journal_changes()
+        for username, upto in deleted.items():
+            entry = self._profiles.get(username)
+            if entry and entry[0] < upto:
+                del self._profiles[username]
+        for username, income in incomes.items():
+            entry = self._profiles.get(username)
+            if entry and len(entry[1]) >= 3:
+                entry[1][2] = income
+
+    # Returns the stored row [name, password hash, income] of a user, or None
+    def get(self, username):
+        with self._lock:
+            self.refresh()
+            entry = self._profiles.get(username)
+            return list(entry[1]) if entry else None
+
+    # Returns the rows of every profile
+    def rows(self):
+        with self._lock:
+            self.refresh()
+            return [
+                list(row)
+                for _, row in sorted(self._profiles.values(),
+                                     key=lambda entry: entry[0])
+            ]
+
+    # Appends a new profile row to the user list and indexes it
+    def add(self, row):
+        record = format_record(row)
+        with self._lock:
+            self.refresh()
+            # Checked under the lock, so two processes can't both add a name
+            if row[0] in self._profiles:
+                raise ValueError(f"Username already exists: {row[0]}")
+            with open(self.path, "ab") as file:
+                offset = file.seek(0, os.SEEK_END)
+                if offset == 0:
+                    header = version_header(PROFILE_HEADER[1])
+                    self._identity = header[2]
+                    offset = file.write(format_record(header))
+                file.write(record)
+                file.flush()
+                stat = os.fstat(file.fileno())
+
+            if self._inode is None:
+                self._inode = stat.st_ino
+            self._profiles[row[0]] = (offset, [str(field) for field in row])
+            self._size = stat.st_size
+            self._mtime = stat.st_mtime_ns
+
+    # Journals an income change instead of rewriting the user list
+    def update_income(self, username, income):
+        with self._lock:
+            self.refresh()
+            if username not in self._profiles:
+                return
+            self.journal.append(UPDATE_INCOME, self.path, username, income)
+            self._apply_journal()
+
+    # Journals the deletion of a profile instead of rewriting the user list
+    def delete(self, username):
+        with self._lock:
+            self.refresh()
+            if username not in self._profiles:
+                return
+            self.journal.append(DELETE_PROFILE, self.path, username,
+                                self._size)
+            self._apply_journal()
+
+    # Rewrites the user list with journaled changes applied, replacing it atomically
+    def compact(self):
+        with self._lock:
+            if self.journal.records_for(self.path):
+                replace_file(
+                    self.path,
+                    chain([version_header(PROFILE_HEADER[1])], self.rows()))
+                self.journal.prune()
+                self.refresh()
+                self.save_snapshot(force=True)
@@ -0,0 +1,114 @@
+# Imported modules
+import hashlib
+from datetime import datetime
+
+from money import format_money, format_stored_amount, parse_pence
+from timestamps import looks_like_timestamp, parse_timestamp
+
+# Marks a record whose date hasn't been parsed yet
+UNPARSED = object()
+
+
+# Hashes a password using SHA-256 for secure storage
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+# Converts 'E'/'N' or a full type name to "Essential" or "Non-Essential"
+def parse_expense_type(value):
+    value = str(value).strip().upper().replace(" ", "-")
+    if value in ("E", "ESSENTIAL"):
+        return "Essential"
+    if value in ("N", "NON-ESSENTIAL", "NONESSENTIAL"):
+        return "Non-Essential"
+    raise ValueError(f"Invalid expense type: {value}")
+
+
+# Validates one expense and returns it as a row for the expenses file
+def build_expense_row(username, date, category, description, amount,
+                      expense_type):
+    if not date:
+        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        date = str(date).strip()
+        try:
+            parsed = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            try:
+                parsed = datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Invalid date: {date}")
+        date = parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+    amount = parse_pence(amount)
+    if amount < 0:
+        raise ValueError(f"Amount must be positive: {format_money(amount)}")
+
+    return [
+        username, date, category, description, amount,
+        parse_expense_type(expense_type)
+    ]
+
+
+class ExpenseRecord:
+    """
+    One expense as the reports see it, whether read from storage or kept in
+    memory for a guest.
+
+    Fields are passed through exactly as stored. The date is only parsed the
+    first time a report compares it; showing the day just slices off the
+    time. The amount is whole pence (an int for guests, text from storage).
+    """
+
+    __slots__ = ("username", "date", "category", "description", "amount",
+                 "expense_type", "_stamp")
+
+    def __init__(self,
+                 username,
+                 date,
+                 category,
+                 description,
+                 amount,
+                 expense_type,
+                 stamp=UNPARSED):
+        self.username = username
+        self.date = date
+        self.category = category
+        self.description = description
+        self.amount = amount
+        self.expense_type = expense_type
+        # Callers that already know the timestamp can pass it in
+        self._stamp = stamp
+
+    # The date without the time, e.g. 2024-01-31, or "Invalid date"
+    @property
+    def day(self):
+        if looks_like_timestamp(self.date):
+            return self.date[:10]
+        return "Invalid date"
+
+    # Seconds since 1970, or None if the date can't be read
+    @property
+    def stamp(self):
+        if self._stamp is UNPARSED:
+            self._stamp = parse_timestamp(self.date)
+        return self._stamp
+
+    # The amount formatted for display, e.g. £12.50
+    @property
+    def money(self):
+        return format_stored_amount(self.amount)
+
+    # Returns the record as a row in the expenses file layout
+    def row(self):
+        return [
+            self.username, self.date, self.category, self.description,
+            self.amount, self.expense_type
+        ]
+
+
+# Decodes stored rows into records, skipping rows that are missing fields
+def decode_rows(rows):
+    for row in rows:
+        if len(row) >= 6:
+            yield ExpenseRecord(row[0], row[1], row[2], row[3], row[4], row[5])
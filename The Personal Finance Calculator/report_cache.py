@@ -0,0 +1,75 @@
+# Imported modules
+from collections import OrderedDict
+
+CACHED_REPORTS = 32
+CACHED_ROWS = 20000
+
+
+class ReportCache:
+    """
+    Least recently used cache of report results and their rendered tables.
+
+    Keys start with the username and end with the storage generation the
+    result was read at, so a report is only reused while the data it came
+    from is unchanged. The cache holds at most max_entries reports and
+    max_rows rows in total; a single result bigger than that isn't cached.
+    """
+
+    def __init__(self, max_entries=CACHED_REPORTS, max_rows=CACHED_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._rows = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns the (rows, table) cached for a key, or None
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    # Caches the rows of a report and optionally its rendered table
+    def put(self, key, rows, table=None):
+        if len(rows) > self.max_rows:
+            return
+        self._remove(key)
+        self._entries[key] = (rows, table)
+        self._rows += len(rows)
+        while len(self._entries
+                  ) > self.max_entries or self._rows > self.max_rows:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    # Drops every cached report of a user, or of everyone
+    def invalidate(self, username=None):
+        for key in list(self._entries):
+            if username is None or key[0] == username:
+                self._remove(key)
+
+    # Removes one entry if it is cached
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._rows -= len(entry[0])
+
+    # Returns the counters used to tune the cache size
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "rows": self._rows
+        }
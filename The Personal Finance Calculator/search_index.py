@@ -0,0 +1,125 @@
+# Imported modules
+import re
+from array import array
+from bisect import bisect_left
+
+WORD = re.compile(r"\w+")
+
+
+# Splits text into lowercase words
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+# Checks whether every search term starts a word of the category or description
+def matches_search(terms, category, description):
+    words = tokenize(category) + tokenize(description)
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+class SearchIndex:
+    """
+    Inverted index over the words of one user's categories and descriptions.
+
+    Rows are numbered in the order they are added and each word maps to the
+    numbers of the rows containing it: a plain int while there is only one,
+    which is the common case for words like receipt numbers, and an array
+    after that. The words are also kept sorted, so every word starting with
+    a search term is found with one bisect. New words are sorted into them
+    all at once before the next search rather than one by one as rows are
+    added. Rows are only ever added, so the index is extended with new
+    expenses and rebuilt when some are removed.
+    """
+
+    def __init__(self):
+        self.keys = array("q")
+        self._postings = {}
+        self._words = []
+        self._new_words = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Adds a row, identified by key (a file offset or a row id)
+    def add(self, key, category, description):
+        row = len(self.keys)
+        self.keys.append(key)
+        for word in set(tokenize(category) + tokenize(description)):
+            rows = self._postings.get(word)
+            if rows is None:
+                self._postings[word] = row
+                self._new_words.append(word)
+            elif isinstance(rows, int):
+                self._postings[word] = array("I", (rows, row))
+            else:
+                rows.append(row)
+
+    # Returns the row lists of every word starting with the term, and how
+    # many rows they hold in total
+    def _postings_starting(self, term):
+        if self._new_words:
+            # Both lists are runs of sorted words, which sort() just merges
+            self._new_words.sort()
+            self._words.extend(self._new_words)
+            self._words.sort()
+            self._new_words = []
+        words = self._words
+        position = bisect_left(words, term)
+        postings = []
+        size = 0
+        while position < len(words) and words[position].startswith(term):
+            rows = self._postings[words[position]]
+            postings.append(rows)
+            size += 1 if isinstance(rows, int) else len(rows)
+            position += 1
+        return postings, size
+
+    # Returns the set of rows in any of the row lists
+    @staticmethod
+    def _union(postings):
+        found = set()
+        for rows in postings:
+            if isinstance(rows, int):
+                found.add(rows)
+            else:
+                found.update(rows)
+        return found
+
+    # Checks whether a row is in any of the row lists
+    @staticmethod
+    def _contains(postings, row):
+        for rows in postings:
+            if isinstance(rows, int):
+                if rows == row:
+                    return True
+            else:
+                position = bisect_left(rows, row)
+                if position < len(rows) and rows[position] == row:
+                    return True
+        return False
+
+    # Returns the keys of rows matching every word of a search, oldest first
+    def search(self, text):
+        """
+        Each word of the search has to start a word of the row's category
+        or description, so "groc" finds "Groceries" and "tesco ex" finds
+        "Tesco Express". The term matching the fewest rows is looked up
+        first. Row lists are in row order, so once only a few rows are left
+        the other terms are checked with a bisect per row instead of
+        reading every row they match.
+        """
+        terms = [self._postings_starting(term) for term in set(tokenize(text))]
+        if not terms:
+            return []
+        terms.sort(key=lambda term: term[1])
+
+        found = self._union(terms[0][0])
+        for postings, size in terms[1:]:
+            if not found:
+                break
+            if len(found) * len(postings) < size:
+                found = {row for row in found if self._contains(postings, row)}
+            else:
+                found &= self._union(postings)
+        keys = self.keys
+        return [keys[row] for row in sorted(found)]
@@ -0,0 +1,290 @@
+# Imported modules
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from money import format_pounds, parse_pence
+from records import build_expense_row, hash_password
+from storage import matches
+
+SOCKET_FILE = "finance.sock"
+BATCH_SIZE = 1000
+REPORT_LIMIT = 1000
+
+
+class Session:
+    """
+    What one connected client is doing: who is logged in, their income and,
+    for guests, the expenses that are only kept for the session.
+    """
+
+    __slots__ = ("name", "income", "logged_in", "guest_expenses")
+
+    def __init__(self):
+        self.log_out()
+
+    # Goes back to an empty guest session
+    def log_out(self):
+        self.name = "Guest"
+        self.income = 0
+        self.logged_in = False
+        self.guest_expenses = []
+
+
+class FinanceServer:
+    """
+    Serves many sessions from one process that owns the storage backend.
+
+    Requests and responses are single lines of JSON. Storage calls run on
+    worker threads so one slow request doesn't hold up the others, and
+    expenses added by all sessions are queued and written in batches: while
+    one batch is being written the next one gathers, and every client gets
+    its reply only after its expense is on disk.
+    """
+
+    def __init__(self, storage, batch_size=BATCH_SIZE):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.sessions = 0
+        self.batches = 0
+        self._pending = []
+        self._wakeup = None
+        self._writer = None
+
+    # Starts listening on a Unix socket, or on a localhost port if one is given
+    async def start(self, path=SOCKET_FILE, port=None):
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_batches())
+        if port is not None:
+            server = await asyncio.start_server(self._serve_client,
+                                                "127.0.0.1", port)
+        else:
+            server = await asyncio.start_unix_server(self._serve_client, path)
+        logging.info(f"Server listening on {port or path}")
+        return server
+
+    # Waits for queued expenses to be written and stops the batch writer
+    async def stop(self):
+        while self._pending:
+            await asyncio.sleep(0.01)
+        self._writer.cancel()
+
+    # Reads requests from one client until it disconnects
+    async def _serve_client(self, reader, writer):
+        session = Session()
+        self.sessions += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle(session, line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    # Runs one JSON request for a session and returns the response
+    async def handle(self, session, line):
+        try:
+            request = json.loads(line)
+            command = request.pop("command")
+            handler = getattr(self, f"_command_{command}", None)
+            if handler is None:
+                raise ValueError(f"Unknown command: {command}")
+            result = await handler(session, **request)
+        except (KeyError, TypeError, ValueError) as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            logging.exception("Server request failed")
+            return {"ok": False, "error": f"Internal error: {e}"}
+        return {"ok": True, **(result or {})}
+
+    # Runs a blocking storage call on a worker thread
+    async def _call(self, function, *args, **kwargs):
+        return await asyncio.to_thread(function, *args, **kwargs)
+
+    # Writes queued expenses, one batch at a time, until cancelled
+    async def _write_batches(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    await self._call(self.storage.append_expenses,
+                                     [row for row, _ in batch])
+                except Exception as e:
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_exception(e)
+                else:
+                    self.batches += 1
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_result(None)
+
+    # Compacts the storage in the background if enough has changed
+    async def _compact_if_needed(self):
+        if await self._call(self.storage.needs_compaction):
+            await self._call(self.storage.compact)
+
+    # Requires a logged-in session
+    @staticmethod
+    def _require_login(session):
+        if not session.logged_in:
+            raise ValueError("Please log in first")
+
+    async def _command_create_profile(self, session, name, password):
+        name = str(name).strip()
+        if not name:
+            raise ValueError("A name is required")
+        await self._call(self.storage.add_profile,
+                         [name, hash_password(password), 0])
+        session.name = name
+        session.income = 0
+        session.logged_in = True
+        session.guest_expenses.clear()
+        return {"name": name}
+
+    async def _command_login(self, session, name, password):
+        row = await self._call(self.storage.get_profile, name)
+        if not row or row[1] != hash_password(password):
+            logging.warning(f"Failed login attempt for user: {name}")
+            raise ValueError("Login failed")
+        session.name = name
+        session.income = parse_pence(row[2])
+        session.logged_in = True
+        session.guest_expenses.clear()
+        return {"name": name, "income": session.income}
+
+    async def _command_logout(self, session):
+        session.log_out()
+
+    async def _command_set_income(self, session, income):
+        income = parse_pence(income)
+        if income < 0:
+            raise ValueError("Income must be positive")
+        if session.logged_in:
+            await self._call(self.storage.update_income, session.name,
+                             format_pounds(income))
+        session.income = income
+        return {"income": income}
+
+    async def _command_add_expense(self,
+                                   session,
+                                   category,
+                                   description,
+                                   amount,
+                                   type,
+                                   date=None):
+        row = build_expense_row(session.name, date, category, description,
+                                amount, type)
+        if not session.logged_in:
+            session.guest_expenses.append(row)
+            return {"expense": row}
+
+        done = asyncio.get_running_loop().create_future()
+        self._pending.append((row, done))
+        self._wakeup.set()
+        await done
+        return {"expense": row}
+
+    async def _command_summary(self, session):
+        if session.logged_in:
+            totals = await self._call(self.storage.totals, session.name)
+            total = totals.total
+        else:
+            total = sum(row[4] for row in session.guest_expenses)
+        return {
+            "income": session.income,
+            "total_expenses": total,
+            "remaining": session.income - total
+        }
+
+    async def _command_expenses(self,
+                                session,
+                                category=None,
+                                type=None,
+                                start=None,
+                                end=None,
+                                limit=REPORT_LIMIT):
+        if start is not None:
+            start = datetime.strptime(start, "%Y-%m-%d")
+        if end is not None:
+            end = datetime.strptime(end, "%Y-%m-%d")
+        if session.logged_in:
+            rows = await self._call(self._query, session.name, category, type,
+                                    start, end, int(limit))
+        else:
+            rows = self._guest_query(session, category, type, start, end,
+                                     int(limit))
+        return {"expenses": rows}
+
+    # Reads up to limit matching rows of a user from storage
+    def _query(self, username, category, expense_type, start, end, limit):
+        rows = []
+        for row in self.storage.query_expenses(username, category,
+                                               expense_type, start, end):
+            if len(rows) >= limit:
+                break
+            if len(row) >= 6:
+                rows.append(row)
+        return rows
+
+    # Filters a guest's session expenses the same way storage queries do
+    @staticmethod
+    def _guest_query(session, category, expense_type, start, end, limit):
+        rows = []
+        for row in session.guest_expenses:
+            if len(rows) >= limit:
+                break
+            if not matches(row, category, expense_type):
+                continue
+            date = datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S")
+            if start is not None and date < start or end is not None and date > end:
+                continue
+            rows.append([row[0], row[1], row[2], row[3], str(row[4]), row[5]])
+        return rows
+
+    async def _command_reset(self, session):
+        session.income = 0
+        if session.logged_in:
+            await self._call(self.storage.update_income, session.name,
+                             format_pounds(0))
+            await self._call(self.storage.reset_expenses, session.name)
+            await self._compact_if_needed()
+        else:
+            session.guest_expenses.clear()
+
+    async def _command_delete_account(self, session):
+        self._require_login(session)
+        name = session.name
+        await self._call(self.storage.delete_profile, name)
+        await self._call(self.storage.reset_expenses, name)
+        session.log_out()
+        logging.info(f"Account and expenses deleted for user: {name}")
+        await self._compact_if_needed()
+
+
+# Sends one request over an open connection and returns the decoded response
+async def send(reader, writer, command, **fields):
+    writer.write(json.dumps({"command": command, **fields}).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+# Runs the server until it is interrupted
+async def serve(storage, path=SOCKET_FILE, port=None):
+    server = FinanceServer(storage)
+    listener = await server.start(path, port)
+    async with listener:
+        try:
+            await listener.serve_forever()
+        finally:
+            await server.stop()
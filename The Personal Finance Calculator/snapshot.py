@@ -0,0 +1,143 @@
+# Imported modules
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+SNAPSHOT_MAGIC = b"FINSNAP1"
+# Magic, the source file's inode, size and mtime, a crc32 of its first bytes
+# (the header with the version id) and the bytes just before that size, and
+# the lengths of the string table and number array
+SNAPSHOT_HEADER = struct.Struct("<8sQQqQQQ")
+CHECK_BYTES = 4096
+# Snapshots are only rewritten at shutdown once this much has been appended
+SNAPSHOT_TAIL_BYTES = 1024 * 1024
+
+
+# Returns the crc32 of the first CHECK_BYTES and the last CHECK_BYTES before
+# size in a file
+def content_check(file, size):
+    file.seek(0)
+    check = zlib.crc32(file.read(min(size, CHECK_BYTES)))
+    start = max(size - CHECK_BYTES, 0)
+    file.seek(start)
+    return zlib.crc32(file.read(size - start), check)
+
+
+# Rounds a length up to a whole number of 8-byte numbers
+def padded(length):
+    return (length + 7) // 8 * 8
+
+
+# Writes a snapshot of what was read from the first `size` bytes of a file
+def write_snapshot(path, source_path, inode, size, mtime, strings, numbers):
+    """
+    strings is the string table (a list of str) and numbers an array("q")
+    laid out however the store reading it back expects. Nothing is written
+    if the source file has been replaced since it was read. The snapshot is
+    only a cache of the csv, so it is replaced atomically but not synced.
+    """
+    with open(source_path, "rb") as source:
+        if os.fstat(source.fileno()).st_ino != inode:
+            return False
+        check = content_check(source, size)
+
+    table = json.dumps(strings, ensure_ascii=False).encode("utf-8")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(
+            SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, inode, size, mtime, check,
+                                 len(table), len(numbers)))
+        # Padding keeps the numbers 8-byte aligned in the mapped file
+        file.write(table.ljust(padded(len(table)), b" "))
+        numbers.tofile(file)
+    os.replace(temp_path, path)
+    return True
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot, read front to back.
+
+    The string table is decoded up front. Numbers are read one at a time
+    with next() and runs of them with array(), which copies the bytes
+    straight out of the mapping without unpacking them one by one.
+    """
+
+    def __init__(self, data, inode, size, mtime, strings, start, count):
+        self.inode = inode
+        self.size = size
+        self.mtime = mtime
+        self.strings = strings
+        self._data = data
+        self._bytes = memoryview(data)[start:start + count * 8]
+        self._numbers = self._bytes.cast("q")
+        self._position = 0
+
+    # Returns the next number
+    def next(self):
+        value = self._numbers[self._position]
+        self._position += 1
+        return value
+
+    # Returns the next count numbers as an array("q")
+    def array(self, count):
+        values = array("q")
+        values.frombytes(self._bytes[self._position *
+                                     8:(self._position + count) * 8])
+        self._position += count
+        return values
+
+    # Unmaps the snapshot
+    def close(self):
+        self._numbers.release()
+        self._bytes.release()
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Opens a snapshot if it still describes the start of the source file
+def open_snapshot(path, source_path):
+    """
+    The source must be the same file (inode) at least as long as it was.
+    At the same length it must also have the same mtime, and its first
+    bytes, which hold the version id, and the bytes just before the
+    snapshotted length must be unchanged. Anything after
+    that is a tail appended since, which the caller reads from the csv.
+    Returns None if the snapshot is missing, damaged or out of date.
+    """
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with file:
+        header = file.read(SNAPSHOT_HEADER.size)
+        if len(header) != SNAPSHOT_HEADER.size:
+            return None
+        magic, inode, size, mtime, check, table_length, count = (
+            SNAPSHOT_HEADER.unpack(header))
+        start = SNAPSHOT_HEADER.size + padded(table_length)
+        if (magic != SNAPSHOT_MAGIC
+                or os.fstat(file.fileno()).st_size != start + count * 8):
+            return None
+
+        try:
+            with open(source_path, "rb") as source:
+                stat = os.fstat(source.fileno())
+                if (stat.st_ino != inode or stat.st_size < size
+                        or stat.st_size == size and stat.st_mtime_ns != mtime
+                        or content_check(source, size) != check):
+                    return None
+        except FileNotFoundError:
+            return None
+
+        strings = json.loads(file.read(table_length).decode("utf-8"))
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return Snapshot(data, inode, size, mtime, strings, start, count)
@@ -0,0 +1,332 @@
+# Imported modules
+import logging
+import sqlite3
+import threading
+
+from columnar import ExpenseColumns
+from expense_store import UserTotals
+from instrumentation import count_rows, timed
+from search_index import SearchIndex
+from storage import StorageBackend
+from timestamps import parse_timestamp, to_timestamp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    name TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    income TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    date TEXT NOT NULL,
+    stamp INTEGER,
+    category TEXT NOT NULL,
+    category_key TEXT NOT NULL,
+    description TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    type_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS expenses_user_date
+    ON expenses (username, stamp);
+CREATE INDEX IF NOT EXISTS expenses_user_category
+    ON expenses (username, category_key);
+CREATE INDEX IF NOT EXISTS expenses_user_type
+    ON expenses (username, type_key);
+"""
+
+EXPENSE_COLUMNS = "username, date, category, description, amount, type"
+
+# Most row ids looked up in one query
+ID_BATCH = 500
+
+
+# Converts a stored expense row to the values of an expenses table row
+def expense_values(row):
+    return (row[0], row[1],
+            parse_timestamp(row[1]), row[2], row[2].strip().lower(), row[3],
+            int(row[4]), row[5], row[5].strip().capitalize())
+
+
+# Converts a database row back to the csv-style list of strings
+def expense_row(values):
+    return [str(value) for value in values]
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Profiles and expenses in a single SQLite database.
+
+    Expenses are indexed on (user, date), (user, category) and (user, type),
+    so filtered reports and totals are indexed queries. Category and type
+    are also stored normalised the same way the csv reports compare them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._searches = {}
+        self._connection = sqlite3.connect(path,
+                                           timeout=30,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    # Runs a query and returns all resulting rows
+    def _fetch(self, query, parameters=()):
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    # Runs a query and yields its rows, fetching them in chunks
+    def _stream(self, query, parameters=(), chunk_size=1000):
+        with self._lock:
+            cursor = self._connection.execute(query, parameters)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+    # Runs a statement in its own transaction
+    def _execute(self, query, parameters=()):
+        with self._lock, self._connection:
+            self._writes += 1
+            return self._connection.execute(query, parameters)
+
+    def get_profile(self, username):
+        rows = self._fetch(
+            "SELECT name, password, income FROM profiles WHERE name = ?",
+            (username, ))
+        return list(rows[0]) if rows else None
+
+    def add_profile(self, row):
+        try:
+            self._execute(
+                "INSERT INTO profiles (name, password, income) VALUES (?, ?, ?)",
+                [str(field) for field in row[:3]])
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Username already exists: {row[0]}")
+
+    def update_income(self, username, income):
+        self._execute("UPDATE profiles SET income = ? WHERE name = ?",
+                      (str(income), username))
+
+    def delete_profile(self, username):
+        self._execute("DELETE FROM profiles WHERE name = ?", (username, ))
+
+    def profiles(self):
+        return [
+            list(row) for row in self._fetch(
+                "SELECT name, password, income FROM profiles ORDER BY rowid")
+        ]
+
+    def append_expenses(self, rows):
+        values = [expense_values(row) for row in rows]
+        with timed("storage.append"), self._lock, self._connection:
+            self._writes += 1
+            self._connection.executemany(
+                "INSERT INTO expenses (username, date, stamp, category, "
+                "category_key, description, amount, type, type_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+        return len(values)
+
+    def reset_expenses(self, username):
+        self._execute("DELETE FROM expenses WHERE username = ?", (username, ))
+        with self._lock:
+            self._searches.pop(username, None)
+
+    def query_expenses(self,
+                       username,
+                       category=None,
+                       expense_type=None,
+                       start=None,
+                       end=None):
+        conditions = ["username = ?"]
+        parameters = [username]
+        order = "id"
+
+        if category is not None:
+            conditions.append("category_key = ?")
+            parameters.append(category.strip().lower())
+        if expense_type is not None:
+            conditions.append("type_key = ?")
+            parameters.append(expense_type.strip().capitalize())
+        if start is not None or end is not None:
+            conditions.append("stamp IS NOT NULL")
+            order = "stamp, id"
+        if start is not None:
+            conditions.append("stamp >= ?")
+            parameters.append(to_timestamp(start))
+        if end is not None:
+            conditions.append("stamp <= ?")
+            parameters.append(to_timestamp(end))
+
+        # The indexes do the filtering, so every row read is returned
+        returned = 0
+        try:
+            for values in self._stream(
+                    f"SELECT {EXPENSE_COLUMNS} FROM expenses "
+                    f"WHERE {' AND '.join(conditions)} ORDER BY {order}",
+                    parameters):
+                returned += 1
+                yield expense_row(values)
+        finally:
+            count_rows("storage.query", returned, returned)
+
+    def undated_expenses(self, username):
+        for values in self._stream(
+                f"SELECT {EXPENSE_COLUMNS} FROM expenses "
+                "WHERE username = ? AND stamp IS NULL ORDER BY id",
+            (username, )):
+            yield expense_row(values)
+
+    # Returns the search index of a user, extended with rows added since
+    def _search_index(self, username):
+        """
+        Row ids only grow, so new rows are the ones with a higher id than the
+        last one indexed. If fewer rows up to that id are left than were
+        indexed, some were deleted by another connection and it is rebuilt.
+        """
+        with self._lock:
+            generation = self.generation()
+            cached = self._searches.get(username)
+            if cached is not None and cached[0] == generation:
+                return cached[1]
+
+            if cached is not None:
+                left = self._fetch(
+                    "SELECT COUNT(*) FROM expenses "
+                    "WHERE username = ? AND id <= ?",
+                    (username, cached[2]))[0][0]
+                if left != len(cached[1]):
+                    cached = None
+            if cached is None:
+                cached = self._searches[username] = [None, SearchIndex(), 0]
+
+            for row_id, category, description in self._stream(
+                    "SELECT id, category, description FROM expenses "
+                    "WHERE username = ? AND id > ? ORDER BY id",
+                (username, cached[2])):
+                cached[1].add(row_id, category, description)
+                cached[2] = row_id
+            cached[0] = generation
+            return cached[1]
+
+    def search_expenses(self, username, text):
+        ids = self._search_index(username).search(text)
+        for start in range(0, len(ids), ID_BATCH):
+            batch = ids[start:start + ID_BATCH]
+            for values in self._fetch(
+                    f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE id IN "
+                    f"({', '.join('?' * len(batch))}) ORDER BY id", batch):
+                yield expense_row(values)
+
+    # Counts rows through the same indexes the reads would use
+    def access_paths(self, username, query):
+
+        def count(condition="", parameters=()):
+            return self._fetch(
+                "SELECT COUNT(*) FROM expenses "
+                f"WHERE username = ?{condition}",
+                (username, *parameters))[0][0]
+
+        sizes = {"all": count()}
+        if query.dated:
+            start, end = query.date_range()
+            sizes["date"] = count(
+                " AND stamp IS NOT NULL AND stamp >= ? AND stamp <= ?",
+                (to_timestamp(start), to_timestamp(end)))
+        if query.category is not None:
+            sizes["category"] = count(" AND category_key = ?",
+                                      (query.category_key, ))
+        if query.expense_type is not None:
+            sizes["type"] = count(" AND type_key = ?", (query.type_key, ))
+        if query.search is not None:
+            sizes["search"] = len(
+                self._search_index(username).search(query.search))
+        return sizes
+
+    def totals(self, username):
+        totals = UserTotals()
+        for type_key, category_key, amount, count in self._fetch(
+                "SELECT type_key, category_key, SUM(amount), COUNT(*) "
+                "FROM expenses WHERE username = ? "
+                "GROUP BY type_key, category_key", (username, )):
+            totals.total += amount
+            totals.rows += count
+            totals.by_type[type_key] = totals.by_type.get(type_key, 0) + amount
+            totals.by_category[category_key] = totals.by_category.get(
+                category_key, 0) + amount
+        return totals
+
+    def columns(self, username):
+        columns = ExpenseColumns()
+        columns.extend(self.query_expenses(username))
+        return columns
+
+    # data_version only changes when other connections commit, so writes made
+    # through this one are counted separately
+    def generation(self):
+        with self._lock:
+            version = self._connection.execute(
+                "PRAGMA data_version").fetchone()[0]
+            return self._writes, version
+
+    def expense_users(self):
+        return [
+            row[0]
+            for row in self._fetch("SELECT DISTINCT username FROM expenses")
+        ]
+
+    def expense_totals(self, workers=None):
+        return dict(
+            self._fetch(
+                "SELECT username, SUM(amount) FROM expenses GROUP BY username")
+        )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# Copies every profile and expense from one backend into another
+def migrate(source, target):
+    """
+    Rows whose amount cannot be read are skipped and logged, since the
+    database stores amounts as integers. Each user's expenses are copied in
+    one transaction, and users who already have expenses in the target are
+    left alone, so running it again (or after an interrupted run) never
+    copies an expense twice.
+    """
+    profiles = 0
+    for row in source.profiles():
+        if target.get_profile(row[0]) is None:
+            target.add_profile(row)
+            profiles += 1
+
+    expenses = 0
+    skipped = 0
+    migrated = set(target.expense_users())
+    for username in source.expense_users():
+        if username in migrated:
+            continue
+        rows = []
+        for row in source.query_expenses(username):
+            try:
+                int(row[4])
+            except ValueError:
+                logging.warning(
+                    f"Skipping an expense with an invalid amount: {row}")
+                skipped += 1
+                continue
+            rows.append(row)
+        if rows:
+            expenses += target.append_expenses(rows)
+
+    logging.info(f"Migrated {profiles} profiles and {expenses} expenses "
+                 f"({skipped} skipped, expenses of {len(migrated)} users "
+                 f"already there)")
+    return profiles, expenses, skipped
@@ -0,0 +1,304 @@
+# Imported modules
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from expense_store import ExpenseStore
+from instrumentation import count_rows, timed
+from journal import Journal
+from profile_store import ProfileRepository
+
+COMPACTION_THRESHOLD = 1000
+
+
+# Checks whether an expense row matches the optional category and type filters
+def matches(row, category=None, expense_type=None):
+    if len(row) < 6:
+        return False
+    if category is not None and row[2].strip().lower() != category.strip(
+    ).lower():
+        return False
+    if expense_type is not None and row[5].strip().capitalize(
+    ) != expense_type.strip().capitalize():
+        return False
+    return True
+
+
+class StorageBackend(ABC):
+    """
+    Where profiles and expenses are kept.
+
+    Profiles are rows of [name, password hash, income in pounds] and expenses
+    rows of [name, "%Y-%m-%d %H:%M:%S" date, category, description, amount in
+    pence, type], all as strings, exactly as they appear in the csv files.
+    """
+
+    # Returns the profile row of a user, or None if there is no such user
+    @abstractmethod
+    def get_profile(self, username):
+        pass
+
+    # Adds a new profile row, raising ValueError if the name is taken
+    @abstractmethod
+    def add_profile(self, row):
+        pass
+
+    # Changes the income (in pounds, as text) stored for a user
+    @abstractmethod
+    def update_income(self, username, income):
+        pass
+
+    # Removes a user's profile
+    @abstractmethod
+    def delete_profile(self, username):
+        pass
+
+    # Returns every profile row
+    @abstractmethod
+    def profiles(self):
+        pass
+
+    # Stores expense rows, returning how many were added
+    @abstractmethod
+    def append_expenses(self, rows):
+        pass
+
+    # Removes every expense of a user
+    @abstractmethod
+    def reset_expenses(self, username):
+        pass
+
+    # Yields a user's expense rows, optionally filtered by category, type and
+    # date range (datetimes, inclusive). Date-filtered rows come oldest first.
+    @abstractmethod
+    def query_expenses(self,
+                       username,
+                       category=None,
+                       expense_type=None,
+                       start=None,
+                       end=None):
+        pass
+
+    # Yields a user's expense rows whose date could not be read
+    @abstractmethod
+    def undated_expenses(self, username):
+        pass
+
+    # Yields a user's expense rows matching every word of a search, oldest first
+    @abstractmethod
+    def search_expenses(self, username, text):
+        pass
+
+    # Returns how many rows of a user each access path open to an
+    # ExpenseQuery would read, e.g. {"all": 5000, "category": 300}
+    @abstractmethod
+    def access_paths(self, username, query):
+        pass
+
+    # Yields a user's rows along one access path of an ExpenseQuery
+    def read_path(self, username, path, query):
+        if path == "date":
+            start, end = query.date_range()
+            return self.query_expenses(username, start=start, end=end)
+        if path == "category":
+            return self.query_expenses(username, category=query.category)
+        if path == "type":
+            return self.query_expenses(username,
+                                       expense_type=query.expense_type)
+        if path == "search":
+            return self.search_expenses(username, query.search)
+        return self.query_expenses(username)
+
+    # Returns the UserTotals of a user
+    @abstractmethod
+    def totals(self, username):
+        pass
+
+    # Returns the ExpenseColumns of a user
+    @abstractmethod
+    def columns(self, username):
+        pass
+
+    # Returns the names of every user with expenses
+    @abstractmethod
+    def expense_users(self):
+        pass
+
+    # Returns the total expenses of every user with expenses, {username:
+    # pence}. Backends reading files may split the work across `workers`
+    # processes.
+    def expense_totals(self, workers=None):
+        return {
+            username: self.totals(username).total
+            for username in self.expense_users()
+        }
+
+    # Returns a value that changes whenever any user's expenses change
+    @abstractmethod
+    def generation(self):
+        pass
+
+    # Checks stored totals against the raw rows, returning any drift found
+    def check_totals(self):
+        return []
+
+    # Checks whether enough changes have built up to make compaction worthwhile
+    def needs_compaction(self):
+        return False
+
+    # Rewrites storage without deleted or outdated data
+    def compact(self):
+        pass
+
+    # Saves what has been indexed so the next process can start from it.
+    # Called at shutdown; only worth doing once enough has changed unless
+    # forced.
+    def save_snapshot(self, force=False):
+        pass
+
+    # Moves expenses dated before a cutoff datetime into compressed archive
+    # segments of one period ("month" or "year") each, returning how many
+    def archive_expenses(self, cutoff, period="month", compression="gzip"):
+        raise ValueError("Archiving is only available for the csv files")
+
+    # Releases any open resources
+    def close(self):
+        pass
+
+
+class CsvBackend(StorageBackend):
+    """
+    The original csv files: user_list.csv and expenses.csv, with deletes and
+    income changes journaled and compacted later. Old expenses can be moved
+    into compressed segments in an archive directory.
+    """
+
+    def __init__(self,
+                 profile_file,
+                 expenses_file,
+                 journal_file,
+                 archive_directory=None):
+        self.journal = Journal(journal_file)
+        self.expense_store = ExpenseStore(expenses_file, self.journal,
+                                          archive_directory)
+        self.profile_repository = ProfileRepository(profile_file, self.journal)
+
+    def get_profile(self, username):
+        return self.profile_repository.get(username)
+
+    def add_profile(self, row):
+        self.profile_repository.add(row)
+
+    def update_income(self, username, income):
+        self.profile_repository.update_income(username, income)
+
+    def delete_profile(self, username):
+        self.profile_repository.delete(username)
+
+    def profiles(self):
+        return self.profile_repository.rows()
+
+    def append_expenses(self, rows):
+        with timed("storage.append"):
+            return self.expense_store.append_many(rows)
+
+    def reset_expenses(self, username):
+        self.expense_store.reset_user(username)
+
+    def query_expenses(self,
+                       username,
+                       category=None,
+                       expense_type=None,
+                       start=None,
+                       end=None):
+        if start is not None or end is not None:
+            rows = self.expense_store.rows_between(username, start
+                                                   or datetime.min, end
+                                                   or datetime.max)
+        else:
+            rows = self.expense_store.rows(username)
+        scanned = returned = 0
+        try:
+            for row in rows:
+                scanned += 1
+                if matches(row, category, expense_type):
+                    returned += 1
+                    yield row
+        finally:
+            count_rows("storage.query", scanned, returned)
+
+    def undated_expenses(self, username):
+        return self.expense_store.undated_rows(username)
+
+    def search_expenses(self, username, text):
+        return self.expense_store.search(username, text)
+
+    def access_paths(self, username, query):
+        return self.expense_store.path_sizes(username, query)
+
+    # Reads categories and types through their own offsets instead of
+    # checking every row
+    def read_path(self, username, path, query):
+        if path == "category":
+            return self.expense_store.rows_in_category(username,
+                                                       query.category)
+        if path == "type":
+            return self.expense_store.rows_of_type(username,
+                                                   query.expense_type)
+        return super().read_path(username, path, query)
+
+    def totals(self, username):
+        return self.expense_store.totals(username)
+
+    def columns(self, username):
+        return self.expense_store.columns(username)
+
+    def expense_users(self):
+        return self.expense_store.users()
+
+    def expense_totals(self, workers=None):
+        return self.expense_store.all_totals(workers)
+
+    def generation(self):
+        return self.expense_store.generation
+
+    def check_totals(self):
+        return self.expense_store.check_totals()
+
+    def needs_compaction(self):
+        return (len(self.journal) >= COMPACTION_THRESHOLD
+                or self.expense_store.dead_rows >= COMPACTION_THRESHOLD)
+
+    def compact(self):
+        with self.journal.lock:
+            self.profile_repository.compact()
+            self.expense_store.compact()
+            self.journal.prune()
+
+    def save_snapshot(self, force=False):
+        with self.journal.lock:
+            self.profile_repository.save_snapshot(force)
+            self.expense_store.save_snapshot(force)
+
+    def archive_expenses(self, cutoff, period="month", compression="gzip"):
+        with self.journal.lock:
+            moved = self.expense_store.archive_before(cutoff, period,
+                                                      compression)
+            self.journal.prune()
+            return moved
+
+
+# Opens the backend chosen by FINANCE_BACKEND ("csv" by default, or "sqlite")
+def open_backend(profile_file,
+                 expenses_file,
+                 journal_file,
+                 database_file,
+                 archive_directory=None):
+    backend = os.environ.get("FINANCE_BACKEND", "csv").strip().lower()
+    if backend == "sqlite":
+        from sqlite_backend import SqliteBackend
+        return SqliteBackend(database_file)
+    if backend != "csv":
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return CsvBackend(profile_file, expenses_file, journal_file,
+                      archive_directory)
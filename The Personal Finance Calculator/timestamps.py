@@ -0,0 +1,29 @@
+# Imported modules
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+
+
+# Converts a "%Y-%m-%d %H:%M:%S" date to whole seconds since 1970, or None if invalid
+def parse_timestamp(text):
+    if len(text) != 19 or text[10] != " ":
+        return None
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    return (moment - EPOCH) // SECOND
+
+
+# Checks that a date has the "%Y-%m-%d %H:%M:%S" shape, without parsing it
+def looks_like_timestamp(text):
+    return (len(text) == 19 and text[4] == text[7] == "-" and text[10] == " "
+            and text[13] == text[16] == ":"
+            and (text[:4] + text[5:7] + text[8:10] + text[11:13] +
+                 text[14:16] + text[17:]).isdigit())
+
+
+# Converts a datetime to the same whole-second timestamps used by the index
+def to_timestamp(moment):
+    return (moment - EPOCH) // SECOND